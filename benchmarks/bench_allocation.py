@@ -0,0 +1,70 @@
+# Copyright 2015 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Measure how partition planning time scales with the partition count.
+
+Compares allocating after every partition is added with queuing every
+partition and allocating once, e.g.::
+
+    python -m benchmarks.bench_allocation --disks 4 --counts 16,64,256
+"""
+
+import argparse
+import sys
+import timeit
+
+import blivet
+
+from benchmarks import synthetic
+from os_disk_config import objects
+
+
+def time_planning(paths, count, defer_allocation):
+    """Return the seconds taken to plan count partitions over paths."""
+    provider = synthetic.make_provider(paths,
+                                       defer_allocation=defer_allocation)
+    start = timeit.default_timer()
+    for i in range(count):
+        obj = objects.StandardPartition('part%d' % i, paths, '16 MiB', None,
+                                        None)
+        provider.add_object(obj)
+    provider.plan()
+    return timeit.default_timer() - start
+
+
+def main(argv=sys.argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--disks', type=int, default=4,
+                        help='The number of synthetic disks.')
+    parser.add_argument('--disk-size', default='64 GiB',
+                        help='The size of each synthetic disk.')
+    parser.add_argument('--counts', default='8,32,128,256',
+                        help='Comma-separated partition counts to plan.')
+    opts = parser.parse_args(argv[1:])
+
+    counts = [int(c) for c in opts.counts.split(',')]
+    print('%10s %14s %14s %8s' % ('partitions', 'per-part (s)',
+                                  'deferred (s)', 'speedup'))
+    with synthetic.disk_files(opts.disks,
+                              blivet.Size(opts.disk_size)) as paths:
+        for count in counts:
+            immediate = time_planning(paths, count, False)
+            deferred = time_planning(paths, count, True)
+            print('%10d %14.3f %14.3f %7.1fx' % (count, immediate, deferred,
+                                                 immediate / deferred))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
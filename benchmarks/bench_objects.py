@@ -0,0 +1,73 @@
+# Copyright 2015 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Measure how long it takes to parse and validate large configs.
+
+Generates a config of standard partitions spread over a number of disks,
+serialises it as JSON, and times loading it and building the objects, e.g.::
+
+    python -m benchmarks.bench_objects --entries 10000
+"""
+
+import argparse
+import json
+import sys
+import timeit
+
+from os_disk_config import objects
+
+
+def make_config(entries, disks):
+    """Return a config dict with entries partitions over disks disks"""
+    partitions = []
+    for i in range(entries):
+        part = {'type': 'standard',
+                'name': 'part%d' % i,
+                'disks': ['sd%s%s' % (chr(ord('a') + (i % disks) // 26),
+                                      chr(ord('a') + (i % disks) % 26))],
+                'size': '%d GiB' % (1 + i % 64),
+                'filesystem': 'xfs',
+                'mountpoint': '/srv/node/part%d' % i,
+                'format_options': 'fast'}
+        partitions.append(part)
+    return {'version': objects.CONFIG_VERSION, 'partitions': partitions}
+
+
+def main(argv=sys.argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entries', type=int, default=10000,
+                        help='The number of partitions in the config.')
+    parser.add_argument('--disks', type=int, default=60,
+                        help='The number of disks they are spread over.')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='How many times to repeat each measurement.')
+    opts = parser.parse_args(argv[1:])
+
+    data = json.dumps(make_config(opts.entries, opts.disks))
+
+    def _parse():
+        return json.loads(data)
+
+    def _validate():
+        return objects.objects_from_json(_parse()['partitions'])
+
+    for name, func in (('parse', _parse), ('parse+validate', _validate)):
+        best = min(timeit.repeat(func, number=1, repeat=opts.repeat))
+        print('%-16s %8d entries %10.4f s %10.2f us/entry' %
+              (name, opts.entries, best, best * 1e6 / opts.entries))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
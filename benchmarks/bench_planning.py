@@ -0,0 +1,157 @@
+# Copyright 2015 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Time each step of planning a config against synthetic device trees.
+
+For every combination of disk and partition counts, a synthetic devicetree
+is built, a partition is added for each object and the result is planned
+with apply(noop=True).  The time spent in add_object, _get_partition,
+_create_partition, plan, apply(noop=True) and get_partition_info is
+written as JSON, so results can be kept and compared between releases,
+e.g.::
+
+    python -m benchmarks.bench_planning --disks 1,4,16 \\
+        --partitions 16,64,256 --output planning.json
+"""
+
+import argparse
+import collections
+import json
+import platform
+import sys
+import timeit
+
+import blivet
+
+from benchmarks import synthetic
+from os_disk_config import version
+
+# The provider methods timed on every call, in the order they are reported
+METHODS = ('add_object', '_get_partition', '_create_partition', 'plan',
+           'apply', 'get_partition_info')
+
+
+class CallTimer(object):
+    """Record the duration of every call to some methods of an object."""
+    def __init__(self):
+        self.samples = collections.defaultdict(list)
+
+    def wrap(self, obj, name):
+        func = getattr(obj, name)
+
+        def _timed(*args, **kwargs):
+            start = timeit.default_timer()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.samples[name].append(timeit.default_timer() - start)
+        setattr(obj, name, _timed)
+
+
+def summarize(samples):
+    """Return the statistics reported for a list of durations in seconds"""
+    samples = sorted(samples)
+    count = len(samples)
+    middle = count // 2
+    median = samples[middle]
+    if count % 2 == 0:
+        median = (samples[middle - 1] + median) / 2
+    return {'calls': count,
+            'total': sum(samples),
+            'min': samples[0],
+            'median': median,
+            'max': samples[-1]}
+
+
+def run_case(paths, partitions, partition_size, filesystem, defer_allocation,
+             repeat):
+    """Plan partitions over paths repeat times and return the timings"""
+    timer = CallTimer()
+    for _ in range(repeat):
+        provider = synthetic.make_provider(paths,
+                                           defer_allocation=defer_allocation)
+        for name in METHODS:
+            timer.wrap(provider, name)
+        objs = synthetic.partition_objects(paths, partitions,
+                                           partition_size, filesystem)
+        for obj in objs:
+            provider.add_object(obj)
+        provider.apply(noop=True)
+        for record in provider.device_index.records():
+            if record['partition']:
+                provider.get_partition_info(record['path'])
+    return collections.OrderedDict((name, summarize(timer.samples[name]))
+                                   for name in METHODS
+                                   if timer.samples[name])
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(',')]
+
+
+def main(argv=sys.argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--disks', type=_int_list, default=[1, 4, 16],
+                        help='Comma-separated synthetic disk counts.')
+    parser.add_argument('--partitions', type=_int_list,
+                        default=[16, 64, 256],
+                        help='Comma-separated partition counts.')
+    parser.add_argument('--disk-size', default='4 TiB',
+                        help='The size of each synthetic disk.')
+    parser.add_argument('--partition-size', default='1 GiB',
+                        help='The size of each partition.')
+    parser.add_argument('--filesystem', default='xfs',
+                        help='The filesystem for each partition, or "none".')
+    parser.add_argument('--immediate', action='store_true',
+                        help='Allocate after every partition instead of '
+                             'once for the whole config.')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='How many times to plan each case.')
+    parser.add_argument('--output', default='-',
+                        help='Where to write the JSON results.')
+    opts = parser.parse_args(argv[1:])
+    filesystem = None if opts.filesystem == 'none' else opts.filesystem
+
+    results = []
+    for disks in opts.disks:
+        with synthetic.disk_files(disks,
+                                  blivet.Size(opts.disk_size)) as paths:
+            for partitions in opts.partitions:
+                timings = run_case(paths, partitions, opts.partition_size,
+                                   filesystem, not opts.immediate,
+                                   opts.repeat)
+                results.append({'disks': disks,
+                                'partitions': partitions,
+                                'timings': timings})
+    report = {'benchmark': 'planning',
+              'version': version.version_info.version_string(),
+              'python': platform.python_version(),
+              'blivet': getattr(blivet, '__version__', None),
+              'disk_size': opts.disk_size,
+              'partition_size': opts.partition_size,
+              'filesystem': filesystem,
+              'defer_allocation': not opts.immediate,
+              'repeat': opts.repeat,
+              'results': results}
+    data = json.dumps(report, indent=2)
+    if opts.output == '-':
+        print(data)
+    else:
+        with open(opts.output, 'w') as f:
+            f.write(data + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,84 @@
+# Copyright 2015 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Synthetic blivet device trees for benchmarking.
+
+Disks are backed by sparse files and represented with blivet's own DiskFile
+device class, so partitions can be allocated without root privileges and
+without probing or touching any real block device.  Nothing is written to
+the files unless the scheduled actions are executed.
+"""
+
+import contextlib
+import os
+import shutil
+import tempfile
+
+import blivet
+from blivet import devices
+import mock
+
+from os_disk_config import fstab
+from os_disk_config import impl_blivet
+from os_disk_config import objects
+
+
+@contextlib.contextmanager
+def disk_files(count, size):
+    """Create count sparse files of size bytes and yield their paths."""
+    tmpdir = tempfile.mkdtemp(prefix='os-disk-config-bench-')
+    try:
+        paths = []
+        for i in range(count):
+            path = os.path.join(tmpdir, 'disk%d.img' % i)
+            with open(path, 'wb') as f:
+                f.truncate(int(size))
+            paths.append(path)
+        yield paths
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def make_provider(paths, **kwargs):
+    """Build a BlivetDiskConfig whose devicetree only holds paths as disks.
+
+    The host is never scanned.  Objects refer to the disks by their path.
+    Entries are staged in an empty fstab next to the disk images rather than
+    in /etc/fstab.
+
+    :param paths: A list of disk image paths from disk_files().
+    :param kwargs: Passed through to BlivetDiskConfig.
+    """
+    with mock.patch.object(blivet.Blivet, 'reset'):
+        provider = impl_blivet.BlivetDiskConfig(**kwargs)
+    for path in paths:
+        provider._blivet.devicetree._addDevice(devices.DiskFile(path))
+    provider._fstab = fstab.Fstab(os.path.join(os.path.dirname(paths[0]),
+                                               'fstab'))
+    return provider
+
+
+def partition_objects(paths, count, size, filesystem=None):
+    """Return count StandardPartitions dealt round-robin over paths.
+
+    Partitions with a filesystem are also given a mountpoint, so that
+    planning them stages fstab entries.
+    """
+    objs = []
+    for i in range(count):
+        mountpoint = '/srv/part%d' % i if filesystem else None
+        objs.append(objects.StandardPartition('part%d' % i,
+                                              [paths[i % len(paths)]], size,
+                                              filesystem, mountpoint))
+    return objs
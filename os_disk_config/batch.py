@@ -0,0 +1,304 @@
+# Copyright 2015 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Plan one config against many recorded disk inventories.
+
+An inventory is a JSON file holding a snapshot of the disks of one machine,
+as recorded with ``os-disk-config-plan-batch --record``: a mapping of disk
+name to the attributes utils.block_devices_snapshot() reads, plus an
+optional "mounted" flag for disks with a mounted filesystem.  Attributes
+other than the size may be left out of hand-written inventories.
+
+The config is parsed and validated once.  Each worker process receives the
+objects when it starts, then reads and plans inventories independently, so
+only file names and results go through the pool.
+"""
+
+import argparse
+import collections
+import copy
+import json
+import logging
+import multiprocessing
+import os
+import sys
+
+import six
+
+from os_disk_config import cli
+from os_disk_config import disk_selectors
+from os_disk_config import loader
+from os_disk_config import objects
+from os_disk_config import planner
+from os_disk_config import utils
+
+
+logger = logging.getLogger(__name__)
+
+INVENTORY_SUFFIX = '.json'
+
+# The attributes a hand-written inventory may leave out
+_DEFAULTS = {
+    'logical_block_size': 512,
+    'minimum_io_size': 0,
+    'optimal_io_size': 0,
+    'alignment_offset': 0,
+    'rotational': False,
+    'removable': False,
+    'model': None,
+    'wwn': None,
+    'transport': 'scsi',
+    'partitions': 0,
+    'holders': [],
+    'mounted': False,
+}
+
+# The types of the attributes, other than the size, that an inventory may
+# give.  bool is a subclass of int, so it is checked for separately.
+_INTEGERS = ('logical_block_size', 'physical_block_size', 'minimum_io_size',
+             'optimal_io_size', 'alignment_offset', 'partitions')
+# The planner divides by these, so they must also be more than 0
+_BLOCK_SIZES = ('logical_block_size', 'physical_block_size')
+_BOOLEANS = ('rotational', 'removable', 'mounted')
+# These may also be null
+_STRINGS = ('model', 'wwn', 'transport')
+
+# The objects parsed from the config, in each worker process
+_worker_objects = None
+
+
+def _check_attributes(name, attrs):
+    """Raise ValueError if an attribute of disk name has the wrong type"""
+    def _invalid(attr, kind):
+        return ValueError('%s of disk %s must be %s, not %r' %
+                          (attr, name, kind, attrs[attr]))
+
+    for attr in _INTEGERS:
+        value = attrs.get(attr, 1)
+        if attr in _BLOCK_SIZES:
+            minimum, kind = 1, 'a positive integer'
+        else:
+            minimum, kind = 0, 'a non-negative integer'
+        if (isinstance(value, bool) or
+                not isinstance(value, six.integer_types) or value < minimum):
+            raise _invalid(attr, kind)
+    for attr in _BOOLEANS:
+        if not isinstance(attrs.get(attr, False), bool):
+            raise _invalid(attr, 'true or false')
+    for attr in _STRINGS:
+        value = attrs.get(attr)
+        if value is not None and not isinstance(value, six.string_types):
+            raise _invalid(attr, 'a string')
+    holders = attrs.get('holders', [])
+    if not isinstance(holders, list) or not all(
+            isinstance(h, six.string_types) for h in holders):
+        raise _invalid('holders', 'a list of device names')
+
+
+def load_inventory(filename):
+    """Return the snapshot and mounted disks recorded in an inventory.
+
+    :param filename: The path of the inventory file.
+    :returns: a tuple of the snapshot, in the same form as
+        utils.block_devices_snapshot(), and the set of mounted disk names.
+    :raises: ValueError if the file is not a valid inventory.
+    """
+    with open(filename) as f:
+        data = json.load(f)
+    if not isinstance(data, dict):
+        raise ValueError('The inventory must be a mapping of disk names')
+    snapshot = {}
+    mounted = set()
+    for name, attrs in data.items():
+        if not isinstance(attrs, dict) or isinstance(
+                attrs.get('size'), bool) or not isinstance(
+                attrs.get('size'), six.string_types + six.integer_types):
+            raise ValueError('No size given for disk %s' % name)
+        _check_attributes(name, attrs)
+        info = dict(_DEFAULTS)
+        info.update(attrs)
+        info['name'] = name
+        info['size'] = utils.parse_size(info['size'])
+        info.setdefault('physical_block_size', info['logical_block_size'])
+        if info.pop('mounted'):
+            mounted.add(name)
+        snapshot[name] = info
+    return snapshot, mounted
+
+
+def record_inventory(filename):
+    """Write a snapshot of the disks of this machine to an inventory file"""
+    snapshot = utils.block_devices_snapshot()
+    mounted = disk_selectors.mounted_disks()
+    for name, info in snapshot.items():
+        info['mounted'] = name in mounted
+        del info['name']
+    utils.write_config(filename, json.dumps(snapshot, indent=2,
+                                            sort_keys=True) + '\n')
+
+
+def plan_inventory(objs, filename):
+    """Return the result of planning objs against an inventory.
+
+    :param objs: A list of objects as returned by objects_from_json.  They
+        are not modified.
+    :param filename: The path of the inventory file.
+    :returns: a dict with the inventory file name under "inventory", and
+        either the layout from planner.plan() under "layout" or the reason
+        it could not be planned under "error".
+    """
+    result = collections.OrderedDict([
+        ('inventory', os.path.basename(filename))])
+    try:
+        snapshot, mounted = load_inventory(filename)
+        if disk_selectors.has_selectors(objs):
+            # Selectors are replaced in place with the disks they match
+            objs = copy.deepcopy(objs)
+            disk_selectors.resolve_objects(objs, snapshot, mounted)
+            objects.check_disks(objs)
+        # Nothing is mounted from the planned disks, so no fstab entries
+        # can clash
+        result['layout'] = planner.plan(objs, snapshot, os.devnull)
+    except (IOError, OSError, ValueError, planner.PlanningException) as e:
+        # InvalidConfigException from selectors is also a ValueError
+        result['error'] = str(e)
+    except Exception as e:
+        # Anything else is a bug, but it must not abort the whole batch,
+        # as an exception in a worker would
+        logger.exception('Unexpected error planning %s', filename)
+        result['error'] = 'Unexpected error: %s' % e
+    return result
+
+
+def _init_worker(objs):
+    global _worker_objects
+    _worker_objects = objs
+
+
+def _plan_file(filename):
+    return plan_inventory(_worker_objects, filename)
+
+
+def inventory_files(directory):
+    """Return the paths of the inventory files in directory, sorted"""
+    return [os.path.join(directory, f) for f in sorted(os.listdir(directory))
+            if f.endswith(INVENTORY_SUFFIX) and not f.startswith('.')]
+
+
+def plan_batch(objs, filenames, jobs=1):
+    """Plan objs against each inventory, yielding results as they finish.
+
+    Results are yielded in the order of filenames, each as soon as it and
+    every one before it are done.
+
+    :param objs: A list of objects as returned by objects_from_json.
+    :param filenames: A list of inventory file paths.
+    :param jobs: The number of worker processes.  With 1, inventories are
+        planned in this process.
+    :returns: an iterator of plan_inventory() results.
+    """
+    if jobs <= 1 or len(filenames) <= 1:
+        for filename in filenames:
+            yield plan_inventory(objs, filename)
+        return
+
+    jobs = min(jobs, len(filenames))
+    # Inventories plan in milliseconds, so hand them out in chunks to keep
+    # the pool overhead down, while still spreading them over every worker
+    chunksize = max(1, len(filenames) // (jobs * 4))
+    pool = multiprocessing.Pool(jobs, _init_worker, (objs,))
+    try:
+        for result in pool.imap(_plan_file, filenames, chunksize):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def parse_opts(argv):
+    parser = argparse.ArgumentParser(
+        description='Plan the layout of a config against a directory of '
+        'recorded disk inventories, printing one JSON result per line.')
+    parser.add_argument('inventory_dir', metavar='INVENTORY_DIR', nargs='?',
+                        help="""the directory of %s inventory files."""
+                        % INVENTORY_SUFFIX)
+    parser.add_argument('-c', '--config-file', metavar='CONFIG_FILE',
+                        help="""path to the configuration file.""",
+                        default='/etc/os-disk-config/config.yaml')
+    parser.add_argument('-j', '--jobs', metavar='N', type=int,
+                        help="""The number of inventories to plan """
+                        """concurrently.  Defaults to the number of """
+                        """CPUs.""",
+                        default=None)
+    parser.add_argument(
+        '--record',
+        metavar='FILE',
+        help="Write the disks of this machine to an inventory file "
+             "instead of planning.",
+        default=None)
+    parser.add_argument(
+        '-d', '--debug',
+        dest="debug",
+        action='store_true',
+        help="Print debugging output.",
+        required=False)
+    parser.add_argument(
+        '-v', '--verbose',
+        dest="verbose",
+        action='store_true',
+        help="Print verbose output.",
+        required=False)
+
+    opts = parser.parse_args(argv[1:])
+    if not opts.record and not opts.inventory_dir:
+        parser.error('an inventory directory or --record is required')
+    return opts
+
+
+def main(argv=sys.argv):
+    """Return 0 if every inventory could be planned, and 1 otherwise"""
+    opts = parse_opts(argv)
+    cli.configure_logger(opts.verbose, opts.debug)
+
+    if opts.record:
+        try:
+            record_inventory(opts.record)
+        except (IOError, OSError) as e:
+            logger.error('Unable to write %s: %s', opts.record, e)
+            return 1
+        return 0
+
+    try:
+        config = loader.load_config(opts.config_file, use_cache=False)
+        part_array = config.get('partitions')
+        if not isinstance(part_array, list):
+            raise objects.InvalidConfigException('No partitions defined')
+        objs = objects.objects_from_json(part_array)
+        filenames = inventory_files(opts.inventory_dir)
+    except (IOError, OSError, objects.InvalidConfigException) as e:
+        logger.error('%s', e)
+        return 1
+
+    jobs = opts.jobs or multiprocessing.cpu_count()
+    failed = 0
+    for result in plan_batch(objs, filenames, jobs):
+        if 'error' in result:
+            failed += 1
+        sys.stdout.write(json.dumps(result) + '\n')
+        sys.stdout.flush()
+    logger.info('Planned %d inventories, %d failed', len(filenames), failed)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -20,11 +20,20 @@ import json
 import logging
 import os
 import sys
-import yaml
 
-from os_disk_config import impl_blivet
+from os_disk_config import converge
+from os_disk_config import disk_selectors
+from os_disk_config import impl_base
+from os_disk_config import loader
+from os_disk_config import mdraid
+from os_disk_config import metrics
 from os_disk_config import objects
+from os_disk_config import planner
+from os_disk_config import providers
+from os_disk_config import queue_tuning
+from os_disk_config import utils
 from os_disk_config import version
+from os_disk_config import wipe
 
 
 logger = logging.getLogger(__name__)
@@ -35,12 +44,52 @@ def parse_opts(argv):
         description='Configure disk interfaces using a JSON config'
         ' file format.')
     parser.add_argument('-c', '--config-file', metavar='CONFIG_FILE',
-                        help="""path to the configuration file.""",
+                        help="""path to the configuration file, or - """
+                        """to read it from stdin.""",
                         default='/etc/os-disk-config/config.yaml')
     parser.add_argument('-p', '--provider', metavar='PROVIDER',
-                        help="""The provider to use."""
-                        """One of: blivet.""",
-                        default=None)
+                        help="""The provider to use: %s, or another """
+                        """installed %s entry point.  Defaults to %s."""
+                        % (', '.join(providers.builtin_names()),
+                           providers.NAMESPACE, providers.DEFAULT),
+                        default=providers.DEFAULT)
+    parser.add_argument('-j', '--jobs', metavar='N', type=int,
+                        help="""The number of disk groups to configure """
+                        """concurrently.""",
+                        default=1)
+    parser.add_argument(
+        '--converge',
+        dest="converge",
+        action='store_true',
+        help="Do nothing if the disks already match the config.",
+        required=False)
+    parser.add_argument(
+        '--no-cache',
+        dest="no_cache",
+        action='store_true',
+        help="Always parse the config and probe the disks instead of "
+             "using cached results for ones that have not changed.",
+        required=False)
+    parser.add_argument(
+        '--full-scan',
+        dest="full_scan",
+        action='store_true',
+        help="Probe every block device on the system instead of only the "
+             "disks named in the config.",
+        required=False)
+    parser.add_argument(
+        '--metrics-file',
+        metavar='FILE',
+        help="Where to write a JSON report of the time spent in each "
+             "phase.  Defaults to %s, which is not written in --noop "
+             "mode." % metrics.METRICS_FILE,
+        default=None)
+    parser.add_argument(
+        '--textfile',
+        metavar='FILE',
+        help="Also write the timings in the Prometheus text format, for "
+             "the node-exporter textfile collector.",
+        default=None)
     parser.add_argument(
         '-d', '--debug',
         dest="debug",
@@ -60,10 +109,24 @@ def parse_opts(argv):
         '--noop',
         dest="noop",
         action='store_true',
-        help="Return the configuration commands, without applying them.",
+        help="Print the planned layout as JSON, without applying it.  The "
+             "disks are not probed, so --converge only checks whether the "
+             "config changed since the last run.  The layout is worked out "
+             "without loading the provider, and the blivet provider may "
+             "place partitions differently.",
+        required=False)
+    parser.add_argument(
+        '--provider-noop',
+        dest="provider_noop",
+        action='store_true',
+        help="Like --noop, but scan the disks and allocate the layout with "
+             "the provider, and print the changes it would make to files "
+             "such as fstab.",
         required=False)
 
     opts = parser.parse_args(argv[1:])
+    if opts.provider_noop:
+        opts.noop = True
 
     return opts
 
@@ -82,42 +145,220 @@ def configure_logger(verbose=False, debug=False):
                         level=log_level)
 
 
+def _build_provider(opts, obj_array, provider_cls, timer):
+    """Scan the disks and return a provider, or None if they are unusable"""
+    # Only probe the disks the config refers to, unless asked otherwise
+    scan_disks = None
+    if not opts.full_scan:
+        scan_disks = objects.referenced_disks(obj_array)
+        logger.debug('Limiting device scan to: %s', scan_disks)
+
+    provider = provider_cls.from_cli(jobs=opts.jobs, scan_disks=scan_disks,
+                                     use_cache=not opts.no_cache,
+                                     timer=timer)
+
+    disks = provider.disks()
+    logger.debug('Available disks: %s', disks)
+    if scan_disks is None:
+        if len(disks) <= 1:
+            logger.error('The system only has one disk')
+            return None
+    else:
+        found = set(utils.disk_name(d) for d in disks)
+        missing = [d for d in scan_disks if d not in found]
+        if missing:
+            logger.error('Disks not found on the system: %s',
+                         ', '.join(missing))
+            return None
+    return provider
+
+
+def _write_metrics(opts, timer):
+    metrics_file = opts.metrics_file
+    if metrics_file is None and not opts.noop:
+        metrics_file = metrics.METRICS_FILE
+    try:
+        if metrics_file:
+            timer.write_json(metrics_file)
+        if opts.textfile:
+            timer.write_textfile(opts.textfile)
+    except (IOError, OSError) as e:
+        logger.warning('Unable to write metrics: %s', e)
+    logger.info('Phase breakdown:')
+    for line in timer.summary():
+        logger.info('  %s', line)
+
+
 def main(argv=sys.argv):
     opts = parse_opts(argv)
     configure_logger(opts.verbose, opts.debug)
     logger.info('Using config file at: %s' % opts.config_file)
-    part_array = []
 
-    # NOTE(bnemec): Add alternate implementations here
-    provider = impl_blivet.BlivetDiskConfig()
+    timer = metrics.PhaseTimer()
+    try:
+        with timer.phase('total'):
+            return _run(opts, timer)
+    finally:
+        _write_metrics(opts, timer)
 
-    disks = provider.disks()
-    if len(disks) <= 1:
-        logger.error('The system only has one disk')
-        return 1
-    logger.debug('Available disks: %s', disks)
-    if os.path.exists(opts.config_file):
-        with open(opts.config_file) as cf:
-            cf_data = cf.read()
-            # yaml will happily load a json file, but return worthless data
-            # json will blow up on a yaml file, so try it first
-            try:
-                full_config = json.loads(cf_data)
-            except ValueError:
-                full_config = yaml.load(cf_data)
-            objects.check_version(full_config)
-            part_array = full_config.get("partitions")
-            logger.debug('partitions JSON: %s' % str(part_array))
-    else:
+
+def _run(opts, timer):
+    if opts.config_file != '-' and not os.path.exists(opts.config_file):
         logger.error('No config file exists at: %s' % opts.config_file)
         return 1
+    try:
+        with timer.phase('config'):
+            full_config = loader.load_config(opts.config_file,
+                                             use_cache=not opts.no_cache)
+    except objects.InvalidConfigException as e:
+        logger.error('%s', e)
+        return 1
+    part_array = full_config.get("partitions")
+    logger.debug('partitions JSON: %s' % str(part_array))
     if not isinstance(part_array, list):
         logger.error('No interfaces defined in config: %s' % opts.config_file)
         return 1
-    for part_json in part_array:
-        obj = objects.object_from_json(part_json)
-        provider.add_object(obj)
-    files_changed = provider.apply(noop=opts.noop)
+    try:
+        with timer.phase('validate'):
+            obj_array = objects.objects_from_json(part_array)
+            tunings = objects.queue_tunings_from_json(
+                full_config.get('queue_tuning'))
+    except objects.InvalidConfigException as e:
+        logger.error('%s', e)
+        return 1
+    try:
+        # Everything below works on disk names, so selectors go first
+        with timer.phase('selectors'):
+            disk_selectors.resolve_objects(obj_array + tunings)
+        objects.check_disks(obj_array)
+    except objects.InvalidConfigException as e:
+        logger.error('%s', e)
+        return 1
+
+    # The queue settings do not depend on the layout, and are not part of
+    # what --converge compares, so they are always brought up to date
+    tuning_report = None
+    if tunings:
+        try:
+            with timer.phase('queue_tuning'):
+                tuning_report = queue_tuning.apply(
+                    queue_tuning.disk_settings(tunings), noop=opts.noop)
+        except impl_base.DiskApplyException as e:
+            for disk in sorted(e.failures):
+                logger.error('Failed to tune the queue of %s: %s', disk,
+                             e.failures[disk])
+            return 1
+
+    if opts.converge and converge.is_converged(obj_array):
+        logger.info('Disks are unchanged since the last run')
+        return 0
+
+    wipe_disks = objects.wipe_requests(obj_array)
+    provider = None
+    provider_cls = None
+    # The blivet provider supports every type of object, so plain --noop
+    # can leave it unloaded
+    if (not opts.noop or opts.provider_noop or
+            opts.provider != providers.DEFAULT):
+        # Providers can be slow to import, so this is left until the config
+        # is known to be valid, but must happen before any disk is touched
+        try:
+            with timer.phase('load_provider'):
+                provider_cls = providers.load(opts.provider)
+        except providers.ProviderNotFound as e:
+            logger.error('%s', e)
+            return 1
+        # Nothing may be wiped for a config the provider will then refuse
+        unsupported = [obj for obj in obj_array
+                       if not provider_cls.supports(obj)]
+        if unsupported:
+            logger.error('The %s provider does not support: %s',
+                         opts.provider, ', '.join(
+                             '%s (%s)' % (obj.name, obj.type_name)
+                             for obj in unsupported))
+            return 1
+    if not opts.noop:
+        # Undo the resync tuning of arrays created by earlier runs
+        try:
+            mdraid.restore_sync_speeds()
+        except (IOError, OSError, ValueError) as e:
+            logger.warning('Unable to restore resync speed limits: %s', e)
+    if opts.converge and not opts.noop:
+        provider = _build_provider(opts, obj_array, provider_cls, timer)
+        if provider is None:
+            return 1
+        with timer.phase('converge'):
+            matches = provider.layout_matches(obj_array)
+        if matches:
+            logger.info('Disks already match the config')
+            if not opts.noop:
+                converge.record(obj_array)
+            return 0
+        if wipe_disks and converge.has_state():
+            # The disks were configured by an earlier run, so whatever does
+            # not match is not worth destroying data over
+            logger.error('Disks do not match the config, but are not wiped '
+                         'once a run has succeeded with --converge.  Run '
+                         'without --converge to wipe them: %s',
+                         ', '.join(sorted(wipe_disks)))
+            return 1
+        if wipe_disks:
+            # The disks have to be scanned again once they are wiped
+            provider = None
+
+    # Old signatures must be gone before the disks are scanned, or they
+    # will be found and treated as existing devices
+    try:
+        with timer.phase('wipe'):
+            wipe.wipe_disks(wipe_disks, jobs=opts.jobs, noop=opts.noop)
+    except impl_base.DiskApplyException as e:
+        logger.error('%s', e)
+        return 1
+
+    if opts.noop and not opts.provider_noop:
+        try:
+            with timer.phase('plan'):
+                layout = planner.plan(obj_array)
+        except planner.PlanningException as e:
+            logger.error('%s', e)
+            return 1
+        if tuning_report is not None:
+            layout['queue_tuning'] = tuning_report
+        print(json.dumps(layout, indent=2))
+        return 0
+
+    if provider is None:
+        provider = _build_provider(opts, obj_array, provider_cls, timer)
+        if provider is None:
+            return 1
+    try:
+        for obj in obj_array:
+            provider.add_object(obj)
+    except (NotImplementedError, objects.InvalidConfigException) as e:
+        logger.error('%s', e)
+        return 1
+    if opts.provider_noop:
+        try:
+            changes = provider.apply(noop=True)
+        except planner.PlanningException as e:
+            logger.error('%s', e)
+            return 1
+        report = {'files': changes}
+        if tuning_report is not None:
+            report['queue_tuning'] = tuning_report
+        print(json.dumps(report, indent=2))
+        return 0
+    try:
+        provider.apply(noop=False)
+    except planner.PlanningException as e:
+        logger.error('%s', e)
+        return 1
+    except impl_base.DiskApplyException as e:
+        for group in sorted(e.failures):
+            logger.error('Failed to configure %s: %s', group,
+                         e.failures[group])
+        return 1
+    converge.record(obj_array)
     return 0
 
 
@@ -0,0 +1,253 @@
+# Copyright 2015 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Detecting when the disks already match the config.
+
+Two checks are used.  The cheap one compares a fingerprint of the desired
+layout and of the current device state from sysfs, /proc/mounts and fstab
+with the one recorded after the last successful run, and needs no device
+scan at all.  If that does not match, layout_matches() compares the
+desired partitions with the scanned devices.
+"""
+
+import hashlib
+import json
+import logging
+import os
+
+from os_disk_config import fstab
+from os_disk_config import objects
+from os_disk_config import utils
+
+
+logger = logging.getLogger(__name__)
+
+STATE_FILE = os.path.join(utils.STATE_DIR, 'converge.json')
+
+# How far an existing partition's size may be from the requested size and
+# still match, to allow for alignment and metadata.
+SIZE_TOLERANCE = 0.01
+
+# The fields that determine the layout, besides the ones every object has
+_LAYOUT_FIELDS = {
+    objects.RaidArray: ('level', 'partitions', 'chunk', 'bitmap'),
+    objects.VolumeGroup: ('partitions', 'pe_size'),
+    objects.LogicalVolume: ('volume_group', 'stripes', 'stripe_size',
+                            'thin_pool', 'pool', 'metadata_size', 'chunk'),
+}
+
+
+def desired_layout(objs):
+    """Return the parts of each object that determine the layout"""
+    layout = []
+    for obj in objs:
+        if obj is None:
+            continue
+        entry = {'type': type(obj).__name__,
+                 'name': obj.name,
+                 'disks': [utils.disk_name(d) for d in obj.disks],
+                 'size': obj.size,
+                 'filesystem': obj.filesystem,
+                 'mountpoint': obj.mountpoint}
+        for field in _LAYOUT_FIELDS.get(type(obj), ()):
+            entry[field] = getattr(obj, field)
+        layout.append(entry)
+    return layout
+
+
+def device_state(objs):
+    """Return the current state of every disk and mountpoint in objs"""
+    layout = desired_layout(objs)
+    mountpoints = set(p['mountpoint'] for p in layout if p['mountpoint'])
+    fstab_lines = utils.get_file_data(fstab.FSTAB).splitlines()
+    return {
+        'disks': dict((d, utils.block_device_state(d))
+                      for d in objects.referenced_disks(objs)),
+        'mounts': sorted(list(m) for m in utils.mounts()
+                         if m[1] in mountpoints),
+        'fstab': sorted(line for line in fstab_lines
+                        if len(line.split()) > 1 and
+                        line.split()[1] in mountpoints),
+    }
+
+
+def _state_data(objs):
+    layout = desired_layout(objs)
+    state = device_state(objs)
+    digest = hashlib.sha256(json.dumps([layout, state], sort_keys=True)
+                            .encode('utf-8')).hexdigest()
+    return json.dumps({'fingerprint': digest, 'layout': layout},
+                      sort_keys=True, indent=2) + '\n'
+
+
+def is_converged(objs, state_file=STATE_FILE):
+    """Return True if nothing has changed since the last recorded run.
+
+    This only reads sysfs, /proc/mounts, fstab and the state file.
+    """
+    return not utils.diff(state_file, _state_data(objs))
+
+
+def record(objs, state_file=STATE_FILE):
+    """Record that the disks now match objs"""
+    data = _state_data(objs)
+    if not utils.diff(state_file, data):
+        return
+    state_dir = os.path.dirname(state_file)
+    if not os.path.isdir(state_dir):
+        os.makedirs(state_dir)
+    utils.write_config(state_file, data)
+
+
+def has_state(state_file=STATE_FILE):
+    """Return True if a successful run has been recorded before"""
+    return os.path.exists(state_file)
+
+
+def _size_matches(requested, actual):
+    if requested is None:
+        # The object fills the space left, so any size will do
+        return True
+    requested = utils.parse_size(requested)
+    return abs(actual - requested) <= requested * SIZE_TOLERANCE
+
+
+def _member_formats(objs):
+    """Return the format expected on partitions used as members, by name"""
+    formats = {}
+    for obj in objs:
+        if isinstance(obj, objects.RaidArray):
+            formats.update((p, 'mdmember') for p in obj.partitions)
+        elif isinstance(obj, objects.VolumeGroup):
+            formats.update((p, 'lvmpv') for p in obj.partitions)
+    return formats
+
+
+def _device_keys(obj):
+    """Return the names an array, VG or LV may be indexed under"""
+    if isinstance(obj, objects.LogicalVolume):
+        vg = obj.volume_group
+        return ['%s-%s' % (vg, obj.name),
+                '/dev/mapper/%s-%s' % (vg.replace('-', '--'),
+                                       obj.name.replace('-', '--'))]
+    if isinstance(obj, objects.RaidArray):
+        return [obj.name, '/dev/md/%s' % obj.name]
+    return [obj.name]
+
+
+def _known_differs(requested, actual):
+    """Return True if a requested size is known to differ from actual"""
+    return (requested is not None and actual is not None and
+            utils.parse_size(requested) != actual)
+
+
+def _structure_matches(obj, record):
+    """Return False if the record is built differently from obj.
+
+    Attributes a record does not know, such as those cached by older
+    versions, are not compared.
+    """
+    if isinstance(obj, objects.RaidArray):
+        level = record.get('level')
+        if level is not None and level != obj.level:
+            return False
+        return len(record['parents']) == len(obj.disks) + len(obj.partitions)
+    if isinstance(obj, objects.VolumeGroup):
+        if _known_differs(obj.pe_size, record.get('pe_size')):
+            return False
+        return len(record['parents']) == len(obj.disks) + len(obj.partitions)
+    if isinstance(obj, objects.LogicalVolume):
+        # Thin volumes are in their pool, and other volumes in the VG
+        if record['parents'] != [obj.pool or obj.volume_group]:
+            return False
+        device_type = record.get('type')
+        if (device_type is not None and
+                (device_type == 'lvmthinpool') != obj.thin_pool):
+            return False
+        stripes = record.get('stripes')
+        if stripes is not None and stripes != (obj.stripes or 1):
+            return False
+        return not _known_differs(obj.stripe_size,
+                                  record.get('stripe_size'))
+    return True
+
+
+def _find_record(obj, index, mounted, fs_type, claimed):
+    """Return the record of the device matching obj, or None"""
+    if obj.mountpoint:
+        if obj.mountpoint not in mounted:
+            logger.debug('%s is not mounted', obj.name)
+            return None
+        # /proc/mounts names arrays by their kernel name, e.g. /dev/md127
+        source = mounted[obj.mountpoint]
+        candidates = [index.lookup(source) or
+                      index.lookup(os.path.realpath(source))]
+    elif isinstance(obj, objects.StandardPartition):
+        # Unmounted partitions are told apart by their disk, format and size
+        disks = set(utils.disk_name(d) for d in obj.disks)
+        candidates = [r for r in index.records()
+                      if r['partition'] and set(r['parents']) & disks]
+    else:
+        candidates = [index.lookup(key) for key in _device_keys(obj)]
+    for record in candidates:
+        if record is None or record['name'] in claimed:
+            continue
+        if isinstance(obj, objects.StandardPartition):
+            disks = set(utils.disk_name(d) for d in obj.disks)
+            if not set(record['parents']) & disks:
+                continue
+        if record['fs_type'] != fs_type:
+            continue
+        # The size of arrays and VGs is the size of each member
+        sized = isinstance(obj, (objects.StandardPartition,
+                                 objects.LogicalVolume))
+        if sized and not _size_matches(obj.size, record['size']):
+            continue
+        if not _structure_matches(obj, record):
+            continue
+        return record
+    return None
+
+
+def layout_matches(objs, index, mounts):
+    """Compare the desired devices with the devices on the system.
+
+    Objects with a mountpoint are identified through the device mounted
+    there, RAID arrays, volume groups and logical volumes by their name,
+    and other partitions by their disk, format and size.  Arrays must also
+    have the same level and number of members, volume groups the same
+    members and extent size, and logical volumes the same volume group or
+    pool, kind and striping.  Each device can only match one object.
+
+    :param objs: A list of objects as returned by object_from_json.
+    :param index: A topology.DeviceIndex of the scanned devices.
+    :param mounts: A list of mounts as returned by utils.mounts().
+    :returns: True if every object is already present on the system.
+    """
+    mounted = dict((target, source) for source, target, _ in mounts)
+    member_formats = _member_formats(objs)
+    claimed = set()
+    for obj in objs:
+        if isinstance(obj, objects.VolumeGroup):
+            # A VG has no format of its own
+            fs_type = None
+        else:
+            fs_type = member_formats.get(obj.name, obj.filesystem)
+        record = _find_record(obj, index, mounted, fs_type, claimed)
+        if record is None:
+            logger.debug('%s %s does not match the system',
+                         type(obj).__name__, obj.name)
+            return False
+        claimed.add(record['name'])
+    return True
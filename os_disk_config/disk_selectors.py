@@ -0,0 +1,150 @@
+# Copyright 2015 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Resolve attribute-based selectors in the disks field of objects.
+
+As well as kernel names, an entry in the disks list of an object may be a
+selector dict, which stands for every disk matching all of its keys::
+
+    disks:
+      - {transport: nvme}
+      - {rotational: true, min_size: 4TiB}
+      - {wwn: 'naa.5000c5*', order: smallest, count: 2, unused: true}
+
+Selectors are resolved against a single snapshot of /sys/block, taken the
+first time it is needed, so every object sees the same set of disks.  Only
+disks backed by hardware are in it, so loop, dm and md devices and the like
+can never be selected.  The disks of earlier objects in the config are no
+longer unused, so two objects selecting unused disks never get the same
+one.
+"""
+
+import fnmatch
+import logging
+
+from os_disk_config import objects
+from os_disk_config import utils
+
+
+logger = logging.getLogger(__name__)
+
+# Keys matched as shell-style patterns against the sysfs attribute
+_GLOB_KEYS = ('name', 'model', 'wwn')
+
+
+def has_selectors(objs):
+    """Return True if any of objs use a selector in their disks"""
+    return any(isinstance(d, dict)
+               for obj in objs for d in getattr(obj, 'disks', None) or [])
+
+
+def _matches(selector, disk, mounted, taken):
+    for key in _GLOB_KEYS:
+        if key in selector:
+            value = disk.get(key) or ''
+            if not fnmatch.fnmatchcase(value, str(selector[key])):
+                return False
+    if 'transport' in selector and disk['transport'] != selector['transport']:
+        return False
+    for key in ('rotational', 'removable'):
+        if key in selector and disk[key] != selector[key]:
+            return False
+    if 'unused' in selector:
+        unused = (not disk['partitions'] and not disk['holders'] and
+                  disk['name'] not in mounted and disk['name'] not in taken)
+        if unused != selector['unused']:
+            return False
+    if ('min_size' in selector and
+            disk['size'] < utils.parse_size(selector['min_size'])):
+        return False
+    if ('max_size' in selector and
+            disk['size'] > utils.parse_size(selector['max_size'])):
+        return False
+    return True
+
+
+def select(selector, snapshot, mounted=frozenset(), taken=frozenset()):
+    """Return the names of the disks in snapshot matching selector.
+
+    Disks are returned in name order, or by size with ties broken by name
+    if the selector has an order, so the result is the same on every run.
+
+    :param selector: A selector dict, as validated by objects.
+    :param snapshot: The result of utils.block_devices_snapshot().
+    :param mounted: The names of disks that are mounted directly.
+    :param taken: The names of disks used by other objects, which are not
+        unused either.
+    :raises: objects.InvalidConfigException if too few disks match.
+    """
+    found = [d for d in snapshot.values()
+             if _matches(selector, d, mounted, taken)]
+    order = selector.get('order', 'name')
+    if order == 'smallest':
+        found.sort(key=lambda d: (d['size'], d['name']))
+    elif order == 'largest':
+        found.sort(key=lambda d: (-d['size'], d['name']))
+    else:
+        found.sort(key=lambda d: d['name'])
+    count = selector.get('count')
+    if not found or (count is not None and len(found) < count):
+        raise objects.InvalidConfigException(
+            'Disk selector %s matched %d disks' % (selector, len(found)))
+    return [d['name'] for d in found[:count]]
+
+
+def mounted_disks():
+    """Return the names of the disks with a mounted filesystem"""
+    disks = set()
+    for source, _, _ in utils.mounts():
+        if source.startswith('/dev/'):
+            disks.add(utils.disk_name(source))
+    return disks
+
+
+def resolve_objects(objs, snapshot=None, mounted=None):
+    """Replace the selectors in the disks of objs with disk names.
+
+    This must be done before anything looks at the disks of the objects.
+    The sysfs snapshot is only taken if there are selectors to resolve.
+
+    :param objs: A list of objects as returned by objects_from_json.
+    :param snapshot: A snapshot to use instead of reading /sys/block.
+    :param mounted: The names of the disks with a mounted filesystem, to
+        use instead of reading the mount table.
+    :raises: objects.InvalidConfigException if a selector matches too few
+        disks.
+    """
+    if not has_selectors(objs):
+        return
+    if snapshot is None:
+        snapshot = utils.block_devices_snapshot()
+    if mounted is None:
+        mounted = mounted_disks()
+    # The disks laid out by the objects resolved so far
+    taken = set()
+    for obj in objs:
+        disks = []
+        for disk in obj.disks:
+            names = [disk]
+            if isinstance(disk, dict):
+                names = select(disk, snapshot, mounted, taken)
+                logger.info('Disk selector %s for %s matched: %s', disk,
+                            obj.name, ', '.join(names))
+            for name in names:
+                if name not in disks:
+                    disks.append(name)
+        obj.disks = disks
+        # Queue tuning does not use up a disk
+        if not isinstance(obj, objects.QueueTuning):
+            taken.update(disks)
@@ -0,0 +1,124 @@
+# Copyright 2015 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import difflib
+import logging
+
+from os_disk_config import utils
+
+
+logger = logging.getLogger(__name__)
+
+FSTAB = '/etc/fstab'
+ENTRY_COMMENT = '# Entry added by os-disk-config.  Do not edit.'
+
+
+def _source_key(source):
+    """Normalise an fstab source so equivalent spellings compare equal"""
+    tag, sep, value = source.partition('=')
+    if sep and tag.upper() in ('UUID', 'PARTUUID'):
+        return '%s=%s' % (tag.upper(), value.lower())
+    if sep and tag.upper() in ('LABEL', 'PARTLABEL'):
+        return '%s=%s' % (tag.upper(), value)
+    return source
+
+
+class Fstab(object):
+    """A staged, all-at-once editor for an fstab file.
+
+    The file is read and indexed by mountpoint and source once, new entries
+    are staged and checked against the index in memory, and commit() writes
+    everything with a single atomic rename.
+
+    :param filename: The fstab file to edit.
+    """
+    def __init__(self, filename=FSTAB):
+        self.filename = filename
+        self._original = None
+        self._by_mountpoint = {}
+        self._by_source = {}
+        self._staged = []
+
+    def _load(self):
+        if self._original is not None:
+            return
+        self._original = utils.get_file_data(self.filename)
+        for line in self._original.splitlines():
+            fields = line.split()
+            if len(fields) < 2 or fields[0].startswith('#'):
+                continue
+            self._by_mountpoint.setdefault(fields[1], line)
+            self._by_source.setdefault(_source_key(fields[0]), line)
+
+    def add(self, source, mountpoint, filesystem, options, dump=0,
+            passno=1):
+        """Stage a new entry.
+
+        Entries whose mountpoint or source is already used, either in the file
+        or by an earlier staged entry, are not added.
+
+        :returns: True if the entry was staged, False if it conflicted.
+        """
+        self._load()
+        if mountpoint in self._by_mountpoint:
+            logger.warning('Found existing fstab entry for %s. '
+                           'Will not add a duplicate.', mountpoint)
+            return False
+        key = _source_key(source)
+        if key in self._by_source:
+            logger.warning('%s is already in fstab as "%s". Will not add it '
+                           'again at %s.', source, self._by_source[key],
+                           mountpoint)
+            return False
+        line = '%s %s %s %s %d %d' % (source, mountpoint, filesystem, options,
+                                      dump, passno)
+        self._by_mountpoint[mountpoint] = line
+        self._by_source[key] = line
+        self._staged.append(line)
+        return True
+
+    @property
+    def staged(self):
+        """The lines staged so far, in the order they were added"""
+        return list(self._staged)
+
+    def render(self):
+        """Return the contents the file will have once committed"""
+        self._load()
+        data = self._original
+        if data and not data.endswith('\n'):
+            data += '\n'
+        for line in self._staged:
+            data += '\n%s\n%s\n' % (ENTRY_COMMENT, line)
+        return data
+
+    def diff(self):
+        """Return a unified diff of the staged changes"""
+        self._load()
+        return ''.join(difflib.unified_diff(
+            self._original.splitlines(True), self.render().splitlines(True),
+            fromfile=self.filename, tofile=self.filename))
+
+    def commit(self):
+        """Atomically write the staged entries to the file.
+
+        :returns: True if the file was changed.
+        """
+        if not self._staged:
+            return False
+        data = self.render()
+        utils.write_config(self.filename, data)
+        self._original = data
+        self._staged = []
+        return True
@@ -14,19 +14,75 @@
 
 import abc
 import logging
-import subprocess
 
 import six
 
-from os_disk_config import objects
+from os_disk_config import fstab
+from os_disk_config import metrics
+from os_disk_config import utils
 
 
 logger = logging.getLogger(__name__)
 
 
+class DiskApplyException(Exception):
+    """Raised when the configuration could not be applied to some disks.
+
+    :param failures: A dict mapping the name of each failed disk group to the
+        exception that was raised while configuring it.
+    """
+    def __init__(self, failures):
+        self.failures = failures
+        msg = '; '.join('%s: %s' % (name, failures[name])
+                        for name in sorted(failures))
+        super(DiskApplyException, self).__init__(
+            'Failed to configure disks: %s' % msg)
+
+
 @six.add_metaclass(abc.ABCMeta)
 class DiskConfigBase(object):
     """Base class for disk configuration implementations"""
+    def __init__(self, jobs=1, timer=None):
+        """:param jobs: The maximum number of disk groups to configure
+            concurrently when applying the config.
+        :param timer: A metrics.PhaseTimer to record the time spent in each
+            phase in.  A new one is created if this is None.
+        """
+        self.jobs = jobs
+        self.timer = timer if timer is not None else metrics.PhaseTimer()
+        # Disks that must be configured together, stored as a union-find
+        # forest mapping each disk name to its parent in the group.
+        self._disk_groups = {}
+        self._uuids = utils.UuidResolver()
+        self._fstab = fstab.Fstab()
+
+    @classmethod
+    def from_cli(cls, jobs, scan_disks, use_cache, timer):
+        """Build the provider the way the CLI uses it.
+
+        :param jobs: See __init__.
+        :param scan_disks: A list of the names of the disks in the config,
+            or None if every disk on the system should be probed.
+        :param use_cache: Whether results cached by earlier runs may be used.
+        :param timer: See __init__.
+        """
+        return cls(jobs=jobs, timer=timer)
+
+    @classmethod
+    def supports(cls, obj):
+        """Return True if this provider can create obj.
+
+        Providers support the object types whose add_* method they
+        override.  This is checked before any disk is touched.
+
+        :param obj: An object as returned by object_from_json.
+        """
+        method = getattr(cls, obj.add_method)
+        return (obj.add_method == 'add_standard_partition' or
+                six.get_unbound_function(method) is not
+                six.get_unbound_function(getattr(DiskConfigBase,
+                                                 obj.add_method)))
+
     @abc.abstractmethod
     def disks(self):
         """Return a list of paths to disks on the system"""
@@ -38,14 +94,28 @@ class DiskConfigBase(object):
 
         :param obj: The object to add.
         """
-        if isinstance(obj, objects.StandardPartition):
-            self.add_standard_partition(obj)
+        getattr(self, obj.add_method)(obj)
 
     @abc.abstractmethod
     def add_standard_partition(self, obj):
         """Add a StandardPartition object to the disk config"""
         pass
 
+    def add_raid(self, obj):
+        """Add a RaidArray object to the disk config"""
+        raise NotImplementedError('%s does not support RAID arrays' %
+                                  type(self).__name__)
+
+    def add_volume_group(self, obj):
+        """Add a VolumeGroup object to the disk config"""
+        raise NotImplementedError('%s does not support LVM' %
+                                  type(self).__name__)
+
+    def add_logical_volume(self, obj):
+        """Add a LogicalVolume object to the disk config"""
+        raise NotImplementedError('%s does not support LVM' %
+                                  type(self).__name__)
+
     @abc.abstractmethod
     def apply(self, noop):
         """Apply the disk configuration.
@@ -53,14 +123,56 @@ class DiskConfigBase(object):
         :param noop: A boolean which indicates whether this is a no-op.
         :returns: a dict of the format: filename/data which contains info
             for each file that was changed (or would be changed if in --noop
-            mode).
+            mode).  For /etc/fstab the data is a unified diff.
         """
         pass
 
-    def add_to_fstab(self, device, path, filesystem, options, dump):
-        """Add an entry to /etc/fstab for the specified partition
+    def link_disks(self, disks):
+        """Record that a set of disks must be configured together.
 
-        Checks to see if an entry already exists, and if not adds one.
+        Objects that may be placed on any of several disks tie all of those
+        disks into a single group, which is never split across workers.
+
+        :param disks: A list of disk names.
+        """
+        roots = [self._find_disk_group(d) for d in disks]
+        for root in roots[1:]:
+            if root != roots[0]:
+                self._disk_groups[root] = roots[0]
+
+    def _find_disk_group(self, disk):
+        self._disk_groups.setdefault(disk, disk)
+        while self._disk_groups[disk] != disk:
+            disk = self._disk_groups[disk]
+        return disk
+
+    def disk_group_name(self, disk):
+        """Return a printable name for the group containing disk.
+
+        The name is the comma-separated, sorted list of the disks in the
+        group, e.g. "sda,sdb".
+        """
+        root = self._find_disk_group(disk)
+        members = [d for d in self._disk_groups
+                   if self._find_disk_group(d) == root]
+        return ','.join(sorted(members))
+
+    def layout_matches(self, objs):
+        """Return True if objs are already present on the disks.
+
+        Implementations that cannot tell should return False, so that the
+        config is always applied.
+
+        :param objs: A list of objects as returned by object_from_json.
+        """
+        return False
+
+    def add_to_fstab(self, device, path, filesystem, options, dump,
+                     noop=False):
+        """Stage an entry in /etc/fstab for the specified partition
+
+        Checks to see if an entry already exists, and if not stages one.
+        Nothing is written until write_fstab() is called.
 
         :param device: The path to the partition device file, e.g. /dev/sda1.
         :param path: The path at which to mount the partition.
@@ -68,25 +180,40 @@ class DiskConfigBase(object):
         :param options: The options for mounting the filesystem.
         :param dump: Boolean indicating whether the filesystem will be
             included in dump(8) backups.
+        :param noop: If True the device has not been formatted yet, so it is
+            referred to by path rather than looked up by UUID.
+        :returns: True if the entry was staged.
         """
-        uuid = self.get_uuid(device)
+        uuid = None if noop else self.get_uuid(device)
+        if uuid:
+            source = 'UUID=%s' % uuid
+        else:
+            if not noop:
+                logger.warning('No filesystem UUID found for %s, using the '
+                               'device path in fstab.', device)
+            source = device
         dump = 1 if dump else 0
-        newline = 'UUID=%s %s %s %s %s 1' % (uuid, path, filesystem, options,
-                                             dump)
-        with open('/etc/fstab') as fstab:
-            lines = fstab.readlines()
-            for line in lines:
-                split_line = line.split()
-                if (len(split_line) > 2 and
-                        not split_line[0].startswith('#') and
-                        split_line[1] == path):
-                    logger.warning('Found existing fstab entry for %s. '
-                                   'Will not add a duplicate.', path)
-                    return
-        with open('/etc/fstab', 'a') as fstab:
-            fstab.write('\n# Entry added by os-disk-config.  Do not edit.\n')
-            fstab.write(newline + '\n')
+        return self._fstab.add(source, path, filesystem, options, dump)
+
+    def write_fstab(self, noop):
+        """Write every staged fstab entry in one atomic update.
+
+        :param noop: If True, only report what would be written.
+        :returns: a dict of filename: diff for the fstab, or an empty dict
+            if there was nothing to add.
+        """
+        if not self._fstab.staged:
+            return {}
+        with self.timer.phase('fstab'):
+            changes = {self._fstab.filename: self._fstab.diff()}
+            if not noop:
+                self._fstab.commit()
+        return changes
 
     def get_uuid(self, device):
-        output = subprocess.check_output(['blkid', '-o', 'value', device])
-        return output.split()[0]
+        """Return the filesystem UUID of device, or None if it has none.
+
+        Lookups are cached for the lifetime of the object, see
+        utils.UuidResolver.
+        """
+        return self._uuids.get(device)
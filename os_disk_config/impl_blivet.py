@@ -12,96 +12,715 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import collections
 import logging
+import subprocess
+import timeit
 
 import blivet
+import parted
 
+from os_disk_config import converge
 from os_disk_config import impl_base
+from os_disk_config import mdraid
+from os_disk_config import objects
+from os_disk_config import planner
+from os_disk_config import probe_cache
+from os_disk_config import profiles
+from os_disk_config import topology
+from os_disk_config import utils
 
 
 logger = logging.getLogger(__name__)
 
 
+# The size grown partitions start from
+_MIN_GROW_SIZE = '1 MiB'
+
+
+class MDRaidArrayDevice(blivet.devices.MDRaidArrayDevice):
+    """An md array that is created with options blivet cannot pass to mdadm.
+
+    :param chunk: The chunk size in bytes, or None for the mdadm default.
+    :param bitmap: "internal", "none", or None for the mdadm default.
+    :param assume_clean: Skip the initial resync.
+    """
+    def __init__(self, name, chunk=None, bitmap=None, assume_clean=False,
+                 **kwargs):
+        super(MDRaidArrayDevice, self).__init__(name, **kwargs)
+        self.raid_level = kwargs.get('level')
+        self.chunk = chunk
+        self.bitmap = bitmap
+        self.assume_clean = assume_clean
+
+    def _create(self):
+        mdraid.create_array(self.path, self.raid_level,
+                            [d.path for d in self.parents], chunk=self.chunk,
+                            bitmap=self.bitmap,
+                            assume_clean=self.assume_clean)
+
+
+class StripedLogicalVolumeDevice(blivet.devices.LVMLogicalVolumeDevice):
+    """A logical volume striped over several physical volumes.
+
+    blivet can only create linear volumes, so lvcreate is run directly.
+
+    :param stripes: The number of physical volumes to stripe over.
+    :param stripe_size: The stripe size in bytes, or None for the LVM
+        default.
+    """
+    def __init__(self, name, stripes, stripe_size=None, **kwargs):
+        super(StripedLogicalVolumeDevice, self).__init__(name, **kwargs)
+        self.stripes = stripes
+        self.stripe_size = stripe_size
+
+    def _create(self):
+        cmd = ['lvcreate', '--yes', '--name', self.lvname,
+               '--size', '%db' % int(self.size),
+               '--stripes', str(self.stripes)]
+        if self.stripe_size is not None:
+            # lvcreate takes the stripe size in KiB
+            cmd += ['--stripesize', str(self.stripe_size // 1024)]
+        cmd.append(self.vg.name)
+        logger.debug('Running %s', ' '.join(cmd))
+        subprocess.check_call(cmd)
+
+
 class BlivetDiskConfig(impl_base.DiskConfigBase):
-    def __init__(self):
-        super(BlivetDiskConfig, self).__init__()
+    def __init__(self, jobs=1, defer_allocation=False, scan_disks=None,
+                 cache=None, timer=None):
+        """:param jobs: See DiskConfigBase.
+        :param timer: See DiskConfigBase.
+        :param defer_allocation: If True, partitions are only queued when
+            they are added and space is allocated for all of them in a single
+            pass by plan() or apply().  Otherwise the allocator runs again
+            after every partition is added.
+        :param scan_disks: A list of disk names to limit the device scan to.
+            Every block device on the system is probed if this is None.
+        :param cache: A probe_cache.ProbeCache.  If given along with
+            scan_disks, the full scan is put off until objects are added,
+            and queries about the existing devices are answered from the
+            cache until then.  Only the disks that changed since they were
+            cached are probed for those queries.
+        """
+        super(BlivetDiskConfig, self).__init__(jobs=jobs, timer=timer)
         self._blivet = blivet.Blivet()
-        self._blivet.reset()
+        self._scan_disks = scan_disks
+        self._cache = cache if scan_disks is not None else None
+        self._scanned = False
+        self._device_index = None
+        self._fingerprints = {}
+        if self._cache is None:
+            self._scan()
         self._mounts = []
+        # Devices scheduled for each object in the config, by name
+        self._devices_by_name = {}
+        # (array, sync_speed_min, sync_speed_max) to set once created
+        self._sync_speeds = []
         self._initialized_disks = set()
+        # (I/O hints, alignment in bytes) of each disk label we created
+        self._alignments = {}
+        # (partition, alignment in bytes) of partitions with an align
+        # override, which the label alignment does not cover
+        self._aligned_partitions = []
+        self._defer_allocation = defer_allocation
+        self._allocation_pending = False
+        # Seconds each mkfs took, by device path
+        self.format_times = {}
         # Impose an ordering based on the order of partitions in the config.
         # Otherwise blivet somewhat arbitrarily chooses the ordering, which
         # can result in unintuitive partition layouts.
         self._next_weight = 0
 
+    @classmethod
+    def from_cli(cls, jobs, scan_disks, use_cache, timer):
+        cache = probe_cache.ProbeCache() if use_cache else None
+        return cls(jobs=jobs, defer_allocation=True, scan_disks=scan_disks,
+                   cache=cache, timer=timer)
+
+    def _scan(self):
+        """Populate the devicetree, if that has not been done yet"""
+        if self._scanned:
+            return
+        if self._scan_disks is not None:
+            self._blivet.config.exclusiveDisks = list(self._scan_disks)
+        with self.timer.phase('scan'):
+            self._blivet.reset()
+        self._scanned = True
+        self._invalidate_device_index()
+        if self._cache is not None:
+            self._update_cache(self.device_index, self._scan_disks)
+
+    def _fingerprint(self, disk):
+        # The disks are not changed between computing the fingerprints and
+        # scanning, so each is only computed once
+        if disk not in self._fingerprints:
+            self._fingerprints[disk] = probe_cache.disk_fingerprint(disk)
+        return self._fingerprints[disk]
+
+    def _update_cache(self, index, disks):
+        for disk in disks:
+            fingerprint = self._fingerprint(disk)
+            if fingerprint is not None:
+                self._cache.update(disk, fingerprint, index.subtree(disk))
+        self._cache.save()
+
+    def _cached_device_index(self):
+        """Build a DeviceIndex from the cache and the disks that changed.
+
+        Only the changed disks are probed, and their records are cached
+        for the next run.  Adding objects still needs every disk in the
+        devicetree, so that scans them all again.
+        """
+        records = []
+        changed = []
+        for disk in self._scan_disks:
+            cached = self._cache.get(disk, self._fingerprint(disk))
+            if cached is None:
+                changed.append(disk)
+            else:
+                records.extend(cached)
+        if not changed:
+            return topology.DeviceIndex.from_records(records)
+        logger.debug('Disks changed since they were cached: %s', changed)
+        self._blivet.config.exclusiveDisks = changed
+        with self.timer.phase('scan'):
+            self._blivet.reset()
+        index = topology.DeviceIndex(self._blivet.devices)
+        self._update_cache(index, changed)
+        index.add_records(records)
+        return index
+
+    @property
+    def device_index(self):
+        """A topology.DeviceIndex of the current devicetree.
+
+        The index is built on first use after each rescan or allocation and
+        kept up to date as devices are scheduled in between.  Until the
+        devicetree has been scanned it is built from the cache, and holds
+        records but no devices.
+        """
+        if self._device_index is None:
+            if self._scanned:
+                self._device_index = topology.DeviceIndex(
+                    self._blivet.devices)
+            else:
+                self._device_index = self._cached_device_index()
+        return self._device_index
+
+    def _invalidate_device_index(self):
+        self._device_index = None
+
     def disks(self):
-        return [i.path for i in self._blivet.devices if len(i.parents) == 0]
+        return self.device_index.disks()
 
     def get_partition_info(self, partition):
-        # Match by partition UUID, name, or path
-        partitions = self._blivet.partitions
-        disk_info = {}
-        for device in partitions:
-            info = device.dict
-            if (info['path'] == partition or info['name'] == partition or
-                info['format']['uuid'] == partition):
-                disk_info = {'name': info['name'], 'fs_type': info['format']['type'],
-                        'path': info['path'], 'uuid': info['format']['uuid'],
-                        'mountpoint': info['format']['mountpoint']}
-                return disk_info
-        logger.debug('No match for partition %s' % partition)
-        return disk_info
+        # Match by partition UUID, filesystem UUID, name, or path
+        info = self.device_index.lookup(partition)
+        if info is None or not info['partition']:
+            logger.debug('No match for partition %s' % partition)
+            return {}
+        return {'name': info['name'], 'fs_type': info['fs_type'],
+                'path': info['path'], 'uuid': info['uuid'],
+                'mountpoint': info['mountpoint']}
+
+    def layout_matches(self, objs):
+        return converge.layout_matches(objs, self.device_index,
+                                       utils.mounts())
 
     def add_standard_partition(self, obj):
+        self._scan()
         partition = self._get_partition(obj)
         self._create_partition(partition)
+        self._devices_by_name[obj.name] = partition
 
-        if obj.filesystem is not None:
-            self._format_partition(obj, partition)
-            if obj.mountpoint is not None:
-                self._mounts.append((partition, obj.mountpoint))
-                logger.info('Mounting %s at %s', partition.path, obj.mountpoint)
+        self._add_mount(obj, partition)
 
     def _get_partition(self, obj):
         """Build a blivet partition object based on the data in obj"""
+        align = None
+        if obj.align is not None:
+            align = utils.parse_size(obj.align)
+        return self._new_partition(obj.disks, obj.size, align=align)
+
+    def _new_partition(self, disk_names, size, fmt=None, align=None):
+        """Build a blivet partition that may go on any of disk_names.
+
+        :param size: The size of the partition, or None to fill the disk.
+        :param fmt: The blivet format to create on the partition, if any.
+        :param align: The alignment of the start of the partition in bytes,
+            on top of the one from the I/O hints of the disk.
+        """
         disks = []
-        for d in obj.disks:
-            dev = self._blivet.devicetree.resolveDevice(d)
-            # NOTE(bnemec): This will fail if dev already has partitions.
-            # We will need to figure out whether to wipe partitions or just
-            # fail in that case.
-            if dev not in self._initialized_disks:
-                self._blivet.initializeDisk(dev)
-                self._initialized_disks.add(dev)
-            disks.append(dev)
-        partition = self._blivet.newPartition(size=blivet.Size(obj.size),
+        with self.timer.phase('resolve'):
+            for d in disk_names:
+                dev = self.device_index.device(d)
+                if dev is None:
+                    dev = self._blivet.devicetree.resolveDevice(d)
+                # NOTE(bnemec): This will fail if dev already has partitions.
+                # We will need to figure out whether to wipe partitions or
+                # just fail in that case.
+                if dev not in self._initialized_disks:
+                    self._blivet.initializeDisk(dev)
+                    self._initialized_disks.add(dev)
+                    self.device_index.add(dev)
+                self._align_disk(dev)
+                disks.append(dev)
+        self.link_disks([d.name for d in disks])
+        kwargs = {}
+        if size is None:
+            size = _MIN_GROW_SIZE
+            kwargs['grow'] = True
+        if fmt is not None:
+            kwargs['format'] = fmt
+        partition = self._blivet.newPartition(size=blivet.Size(size),
                                               parents=disks,
-                                              weight=self._next_weight)
+                                              weight=self._next_weight,
+                                              **kwargs)
         # Lower weights will be allocated after higher weights
         self._next_weight -= 100
+        if align is not None:
+            self._aligned_partitions.append((partition, align))
         return partition
 
+    def _align_disk(self, disk):
+        """Set the alignment of new partitions on a disk we labelled.
+
+        parted only looks at optimal_io_size, so the alignment from
+        planner.io_alignment() is set on the disk label instead.  Partitions
+        with their own align are moved by _pin_aligned_partitions().
+        """
+        if disk.name in self._alignments:
+            return
+        hints = utils.block_device_io_hints(disk.name)
+        if hints is None:
+            logger.debug('No I/O hints for %s, leaving the alignment to '
+                         'parted', disk.name)
+            return
+        grain = planner.io_alignment(hints)
+        self._alignments[disk.name] = (hints, grain)
+        sector_size = hints['logical_block_size']
+        grain_sectors = grain // sector_size
+        offset = (planner.alignment_offset(hints) // sector_size %
+                  grain_sectors)
+        # blivet caches these on the label the first time they are needed,
+        # so setting them here takes the place of the values from parted
+        disk.format._alignment = parted.Alignment(offset=offset,
+                                                  grainSize=grain_sectors)
+        disk.format._endAlignment = parted.Alignment(
+            offset=(offset - 1) % grain_sectors, grainSize=grain_sectors)
+        logger.debug('Aligning partitions on %s to %d bytes', disk.name,
+                     grain)
+
     def _create_partition(self, partition):
         """Add partition to the list of devices scheduled for creation"""
         self._blivet.createDevice(partition)
-        blivet.partitioning.doPartitioning(self._blivet)
+        if self._defer_allocation:
+            self._allocation_pending = True
+            self.device_index.add(partition)
+        else:
+            self._allocate()
+            self._invalidate_device_index()
         logger.info('Creating partition %s', partition.path)
 
+    def _allocate(self):
+        """Run the allocator until every partition is aligned"""
+        with self.timer.phase('allocate'):
+            blivet.partitioning.doPartitioning(self._blivet)
+            while self._pin_aligned_partitions():
+                blivet.partitioning.doPartitioning(self._blivet)
+
+    def _pin_aligned_partitions(self):
+        """Fix the start of partitions the allocator did not align.
+
+        The allocator aligns every partition on a disk to its label, so a
+        partition with an align override that was not placed on a multiple
+        of both is given the next start sector that is.  Moving a partition
+        moves the ones after it, so only the first misplaced partition on
+        each disk is fixed before the allocator runs again.
+
+        :returns: True if any partition was moved.
+        """
+        first = {}
+        for partition, align in self._aligned_partitions:
+            if partition.req_start_sector is not None:
+                continue
+            current = partition.partedPartition.geometry.start
+            start = self._aligned_start(partition, align)
+            if start == current:
+                continue
+            disk = partition.disk.name
+            if disk not in first or current < first[disk][2]:
+                first[disk] = (partition, start, current)
+        for partition, start, current in first.values():
+            logger.debug('Moving the start of %s from sector %d to %d',
+                         partition.name, current, start)
+            partition.req_start_sector = start
+            partition.req_disks = [partition.disk]
+        return bool(first)
+
+    def _aligned_start(self, partition, align):
+        """Return the first start at or after partition's own that is on
+        a multiple of both align and the alignment of its disk label.
+        """
+        label = partition.disk.format
+        sector_size = label.sectorSize
+        grain = utils.lcm(label.alignment.grainSize * sector_size,
+                          align) // sector_size
+        offset = label.alignment.offset % grain
+        start = partition.partedPartition.geometry.start - offset
+        return -(-start // grain) * grain + offset
+
+    def plan(self):
+        """Allocate space for any partitions that are still queued.
+
+        Every queued partition is placed by one run of the allocator, which
+        still honours the weights assigned in _get_partition.
+        """
+        if self._allocation_pending:
+            self._allocate()
+            self._allocation_pending = False
+            self._invalidate_device_index()
+
+    def _add_members(self, obj, format_type):
+        """Return the member devices of an array or volume group.
+
+        A partition is created on each of the disks of obj, and the
+        partitions and arrays it names are reformatted, as format_type.
+        """
+        members = []
+        for d in obj.disks:
+            member = self._new_partition(
+                [d], obj.size, fmt=blivet.formats.getFormat(format_type))
+            self._create_partition(member)
+            members.append(member)
+        for name in obj.partitions:
+            member = self._devices_by_name[name]
+            self._blivet.formatDevice(member,
+                                      blivet.formats.getFormat(format_type))
+            members.append(member)
+        # Everything built on the members is applied together
+        self.link_disks([d.name for m in members for d in m.disks])
+        return members
+
+    def _add_mount(self, obj, device):
+        if obj.filesystem is not None:
+            self._format_partition(obj, device)
+            if obj.mountpoint is not None:
+                self._mounts.append((device, obj.mountpoint))
+                logger.info('Mounting %s at %s', device.path, obj.mountpoint)
+
+    def add_raid(self, obj):
+        self._scan()
+        members = self._add_members(obj, 'mdmember')
+        if len(members) < objects.RAID_LEVELS[obj.level]:
+            raise objects.InvalidConfigException(
+                '%s needs at least %d members' %
+                (obj.level, objects.RAID_LEVELS[obj.level]))
+
+        chunk = None
+        if obj.chunk is not None:
+            chunk = utils.parse_size(obj.chunk)
+        array = MDRaidArrayDevice(obj.name, level=obj.level, parents=members,
+                                  memberDevices=len(members),
+                                  totalDevices=len(members), chunk=chunk,
+                                  bitmap=obj.bitmap,
+                                  assume_clean=obj.assume_clean)
+        self._blivet.createDevice(array)
+        self._devices_by_name[obj.name] = array
+        if self._device_index is not None:
+            self._device_index.add(array)
+        if obj.sync_speed_min is not None or obj.sync_speed_max is not None:
+            self._sync_speeds.append((array, obj.sync_speed_min,
+                                      obj.sync_speed_max))
+        logger.info('Creating %s array %s', obj.level, array.path)
+        self._add_mount(obj, array)
+
+    def add_volume_group(self, obj):
+        self._scan()
+        pvs = self._add_members(obj, 'lvmpv')
+        kwargs = {}
+        if obj.pe_size is not None:
+            kwargs['peSize'] = blivet.Size(obj.pe_size)
+        vg = self._blivet.newVG(name=obj.name, parents=pvs, **kwargs)
+        self._blivet.createDevice(vg)
+        self._devices_by_name[obj.name] = vg
+        logger.info('Creating volume group %s', obj.name)
+
+    def add_logical_volume(self, obj):
+        self._scan()
+        vg = self._devices_by_name[obj.volume_group]
+        if obj.stripes and obj.stripes > len(vg.parents):
+            raise objects.InvalidConfigException(
+                '%s cannot be striped over %d of the %d physical volumes in '
+                '%s' % (obj.name, obj.stripes, len(vg.parents), vg.name))
+        kwargs = {}
+        if obj.size is None:
+            kwargs['size'] = blivet.Size(_MIN_GROW_SIZE)
+            kwargs['grow'] = True
+        else:
+            kwargs['size'] = blivet.Size(obj.size)
+        if obj.stripes:
+            lv = StripedLogicalVolumeDevice(
+                obj.name, parents=[vg], stripes=obj.stripes,
+                stripe_size=(utils.parse_size(obj.stripe_size)
+                             if obj.stripe_size else None),
+                **kwargs)
+        elif obj.thin_pool:
+            if obj.metadata_size is not None:
+                kwargs['metadatasize'] = blivet.Size(obj.metadata_size)
+            if obj.chunk is not None:
+                kwargs['chunksize'] = blivet.Size(obj.chunk)
+            lv = self._blivet.newLV(name=obj.name, parents=[vg],
+                                    thin_pool=True, **kwargs)
+        elif obj.pool is not None:
+            lv = self._blivet.newLV(name=obj.name,
+                                    parents=[self._devices_by_name[obj.pool]],
+                                    thin_volume=True, **kwargs)
+        else:
+            lv = self._blivet.newLV(name=obj.name, parents=[vg], **kwargs)
+        self._blivet.createDevice(lv)
+        self._devices_by_name[obj.name] = lv
+        if kwargs.get('grow'):
+            # Grown volumes are sized by the allocator
+            self._allocation_pending = True
+        if self._device_index is not None:
+            self._device_index.add(lv)
+        logger.info('Creating logical volume %s', lv.path)
+        self._add_mount(obj, lv)
+
     def _format_partition(self, obj, partition):
+        kwargs = {}
+        if obj.mount_options:
+            # Used by both the mount and the fstab entry
+            disks = utils.block_devices_snapshot(
+                [d.name for d in partition.disks])
+            kwargs['mountopts'] = profiles.mount_options(
+                obj.filesystem, obj.mount_options, list(disks.values()))
         filesystem = blivet.formats.getFormat(obj.filesystem,
-                                              device=partition.path)
+                                              device=partition.path,
+                                              **kwargs)
         self._blivet.formatDevice(partition, filesystem)
+        hints = []
+        if isinstance(obj, objects.StandardPartition):
+            hints = [utils.block_device_io_hints(utils.disk_name(d))
+                     for d in obj.disks]
+            if None in hints:
+                hints = []
+        geometry = profiles.stripe_geometry(obj, hints)
+        if geometry is not None:
+            logger.debug('%s is striped in %d byte units over %d disks',
+                         obj.name, geometry[0], geometry[1])
+        # Passed to mkfs when the format is created
+        partition.formatArgs = profiles.format_args(obj.filesystem,
+                                                    obj.format_options,
+                                                    geometry)
+        if self._device_index is not None:
+            self._device_index.add(partition)
         logger.info('Formatting %s as %s', partition.path, obj.filesystem)
 
+    def _device_group(self, device):
+        """Return the name of the disk group that device lives on"""
+        disks = device.disks
+        if not disks:
+            return None
+        return self.disk_group_name(disks[0].name)
+
     def apply(self, noop):
-        if not noop:
+        self._scan()
+        self.plan()
+        if noop:
+            for partition, mountpoint in self._mounts:
+                self._add_mount_to_fstab(partition, mountpoint, noop=True)
+            return self.write_fstab(noop=True)
+        self._invalidate_device_index()
+        if self.jobs > 1:
+            return self._apply_parallel()
+        # Filesystems are created after doIt, so each mkfs can be timed
+        devicetree = self._blivet.devicetree
+        devicetree.pruneActions()
+        devicetree.sortActions()
+        format_actions = self._format_actions()
+        for action in format_actions:
+            devicetree._actions.remove(action)
+        with self.timer.phase('doit'):
             self._blivet.doIt()
-            for i in self._mounts:
-                partition = i[0]
-                mountpoint = i[1]
-                partition.format.mount(mountpoint=mountpoint)
-                self.add_to_fstab(partition.path,
-                                  mountpoint,
-                                  partition.format.name,
-                                  partition.format.options,
-                                  partition.format.dump)
+        self._set_sync_speeds()
+        for action in format_actions:
+            self._create_format(action)
+        self._refresh_uuids(self._mounts)
+        for i in self._mounts:
+            partition = i[0]
+            mountpoint = i[1]
+            self._mount(partition, mountpoint)
+            self._add_mount_to_fstab(partition, mountpoint)
+        return self.write_fstab(noop=False)
+
+    def _set_sync_speeds(self, failed_groups=()):
+        """Apply the resync speed limits of newly created arrays"""
+        for array, speed_min, speed_max in self._sync_speeds:
+            if self._device_group(array) in failed_groups:
+                continue
+            try:
+                mdraid.raise_sync_speed(array.path, speed_min, speed_max)
+            except (IOError, OSError) as e:
+                logger.warning('Unable to set the resync speed of %s: %s',
+                               array.path, e)
+
+    def _mount(self, partition, mountpoint):
+        with self.timer.phase('mount'):
+            partition.format.mount(mountpoint=mountpoint)
+
+    def _refresh_uuids(self, mounts):
+        """Look up the UUIDs of freshly formatted mounts in one pass"""
+        paths = [partition.path for partition, _ in mounts]
+        self._uuids.invalidate(paths)
+        with self.timer.phase('uuid'):
+            self._uuids.prime(paths)
+
+    def _add_mount_to_fstab(self, partition, mountpoint, noop=False):
+        self.add_to_fstab(partition.path,
+                          mountpoint,
+                          partition.format.name,
+                          partition.format.options,
+                          partition.format.dump,
+                          noop=noop)
+
+    def _format_actions(self):
+        """Return the actions creating filesystems, in the order to run"""
+        return [action for action in self._blivet.devicetree.findActions()
+                if action.isCreate and action.isFormat and
+                isinstance(action.format, blivet.formats.fs.FS)]
+
+    def _create_format(self, action):
+        """Execute an action creating a filesystem, and time it.
+
+        :returns: the number of seconds mkfs took.
+        """
+        start = timeit.default_timer()
+        action.execute()
+        elapsed = timeit.default_timer() - start
+        logger.info('Created %s on %s in %.2f seconds',
+                    action.format.type, action.device.path, elapsed)
+        self.timer.record('mkfs', elapsed, device=action.device.path)
+        self.format_times[action.device.path] = elapsed
+        return elapsed
+
+    def _prepare_actions(self):
+        """Get the scheduled actions ready to be executed one by one.
+
+        These are the steps DeviceTree.processActions takes before it
+        executes anything, as the actions are not run through it here.
+        """
+        devicetree = self._blivet.devicetree
+        devices = devicetree.devices
+        # parted has to start from the labels as they are on disk
+        for device in devices:
+            if device.partitioned:
+                device.format.resetPartedDisk()
+            if (device.originalFormat.type == 'disklabel' and
+                    device.originalFormat != device.format):
+                device.originalFormat.resetPartedDisk()
+        for device in devices:
+            device.preCommitFixup()
+        # Extended partitions added by the allocator have no action yet
+        for device in devices:
+            if (isinstance(device, blivet.devices.PartitionDevice) and
+                    device.isExtended and not device.exists and
+                    not devicetree.findActions(device=device,
+                                               type='create')):
+                devicetree._actions.append(
+                    blivet.deviceaction.ActionCreateDevice(device))
+        devicetree.pruneActions()
+        devicetree.sortActions()
+
+    def _apply_parallel(self):
+        """Apply the scheduled actions using a bounded pool of workers.
+
+        Actions are prepared and sorted once for the whole devicetree, as
+        DeviceTree.processActions would, and then run in three stages:
+
+        1. Everything except creating filesystems, with one worker per disk
+           group.  Each group runs its actions in the original order, so
+           groups only ever run concurrently with groups sharing no disks.
+        2. Creating filesystems, with one worker per device, since mkfs on
+           one partition does not depend on any other.
+        3. Mounting and updating fstab, from this thread.
+
+        The time each mkfs took is logged, kept in self.format_times and
+        recorded in the timer.
+        """
+        devicetree = self._blivet.devicetree
+        self._prepare_actions()
+        # The devices of each group, whose names may change as partitions
+        # are created
+        devices = collections.defaultdict(list)
+        for device in devicetree.devices:
+            devices[self._device_group(device)].append(device)
+        actions = collections.OrderedDict()
+        format_actions = self._format_actions()
+        for action in devicetree.findActions():
+            if action in format_actions:
+                continue
+            group = self._device_group(action.device)
+            actions.setdefault(group, []).append(action)
+        mounts = collections.OrderedDict()
+        for partition, mountpoint in self._mounts:
+            group = self._device_group(partition)
+            mounts.setdefault(group, []).append((partition, mountpoint))
+
+        def _apply_group(group):
+            for action in actions[group]:
+                logger.debug('Executing %s', action)
+                try:
+                    action.execute()
+                except blivet.errors.DiskLabelCommitError:
+                    # Something an earlier action set up, such as an
+                    # array, is holding the disk open
+                    for device in devices[group]:
+                        if device.exists and any(device.dependsOn(disk)
+                                                 for disk in
+                                                 action.device.disks):
+                            device.teardown(recursive=True)
+                    action.execute()
+                # parted may have renumbered the partitions
+                for device in devices[group]:
+                    if (device.exists and isinstance(
+                            device, blivet.devices.PartitionDevice)):
+                        device.updateName()
+                        device.format.device = device.path
+
+        failures = {}
+
+        def _record_failures(results, get_group):
+            for item, _, error in results:
+                if error is not None:
+                    group = get_group(item)
+                    logger.error('Failed to configure disks %s: %s', group,
+                                 error)
+                    failures.setdefault(group, error)
+
+        with self.timer.phase('doit'):
+            results = utils.run_parallel(_apply_group, list(actions),
+                                         self.jobs)
+        _record_failures(results, lambda group: group)
+        self._set_sync_speeds(failures)
+
+        format_actions = [a for a in format_actions
+                          if self._device_group(a.device) not in failures]
+        results = utils.run_parallel(self._create_format, format_actions,
+                                     self.jobs)
+        _record_failures(results, lambda a: self._device_group(a.device))
+
+        # Mounts and fstab are shared by every group, so they are only
+        # updated from this thread once all of the groups have finished.
+        done = [m for g in mounts if g not in failures for m in mounts[g]]
+        for partition, mountpoint in done:
+            self._mount(partition, mountpoint)
+        self._refresh_uuids(done)
+        for partition, mountpoint in done:
+            self._add_mount_to_fstab(partition, mountpoint)
+        files_changed = self.write_fstab(noop=False)
+        if failures:
+            raise impl_base.DiskApplyException(failures)
+        return files_changed
@@ -0,0 +1,193 @@
+# Copyright 2015 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""A provider that partitions disks with sfdisk and runs mkfs directly.
+
+The layout is worked out by the planner, so nothing has to be probed or
+imported up front, and each disk's partition table is written by a single
+sfdisk run.  It only handles fresh whole-disk layouts: every disk used is
+given a new GPT label.
+"""
+
+import collections
+import logging
+import os
+import subprocess
+import timeit
+
+from os_disk_config import impl_base
+from os_disk_config import planner
+from os_disk_config import utils
+
+
+logger = logging.getLogger(__name__)
+
+# The GPT type GUID for Linux filesystem data
+LINUX_FILESYSTEM = '0FC63DAF-8483-4772-8E79-3D69D8477DE4'
+
+
+def _run(cmd, data=None):
+    """Run cmd, passing data on stdin.
+
+    :raises: subprocess.CalledProcessError if the command fails.
+    """
+    logger.debug('Running %s', ' '.join(cmd))
+    process = subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                               universal_newlines=True)
+    process.communicate(data)
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, cmd)
+
+
+def sfdisk_script(disk):
+    """Return the sfdisk script that creates the partitions of disk.
+
+    :param disk: The layout of one disk, as returned by planner.plan().
+    """
+    lines = ['label: gpt', 'unit: sectors', '']
+    for part in disk['partitions']:
+        lines.append('start=%d, size=%d, type=%s, name="%s"' %
+                     (part['start'], part['end'] - part['start'] + 1,
+                      LINUX_FILESYSTEM, part['name'].replace('"', '')))
+    return '\n'.join(lines) + '\n'
+
+
+class SfdiskDiskConfig(impl_base.DiskConfigBase):
+    def __init__(self, jobs=1, scan_disks=None, timer=None):
+        """:param jobs: The maximum number of disks to partition, and
+            partitions to format, concurrently.
+        :param scan_disks: A list of disk names to limit disks() to.
+        :param timer: See DiskConfigBase.
+        """
+        super(SfdiskDiskConfig, self).__init__(jobs=jobs, timer=timer)
+        self._scan_disks = scan_disks
+        self._snapshot = None
+        self._objs = []
+
+    @classmethod
+    def from_cli(cls, jobs, scan_disks, use_cache, timer):
+        return cls(jobs=jobs, scan_disks=scan_disks, timer=timer)
+
+    @property
+    def snapshot(self):
+        """The sysfs snapshot of the disks, taken on first use"""
+        if self._snapshot is None:
+            with self.timer.phase('scan'):
+                self._snapshot = utils.block_devices_snapshot(
+                    self._scan_disks)
+        return self._snapshot
+
+    def disks(self):
+        names = sorted(self.snapshot)
+        if self._scan_disks is not None:
+            names = [n for n in names if n in self._scan_disks]
+        return ['/dev/%s' % n for n in names]
+
+    def add_standard_partition(self, obj):
+        self._objs.append(obj)
+        self.link_disks([utils.disk_name(d) for d in obj.disks])
+        logger.info('Creating partition %s', obj.name)
+
+    def plan(self):
+        """Return the planned layout of every disk.
+
+        :raises: planner.PlanningException if the config does not fit.
+        """
+        with self.timer.phase('allocate'):
+            return planner.plan(self._objs, self.snapshot,
+                                self._fstab.filename)['disks']
+
+    def apply(self, noop):
+        layout = self.plan()
+        parts = [p for disk in layout.values() for p in disk['partitions']]
+        mounts = [p for p in parts
+                  if p['filesystem'] is not None and
+                  p['mountpoint'] is not None]
+        if noop:
+            for part in mounts:
+                self.add_to_fstab(part['device'], part['mountpoint'],
+                                  part['filesystem'], part['mount_options'],
+                                  False, noop=True)
+            return self.write_fstab(noop=True)
+
+        failures = {}
+
+        def _partition(name):
+            with self.timer.phase('partition'):
+                _run(['sfdisk', '--quiet', '--wipe', 'always',
+                      '--wipe-partitions', 'always', '/dev/%s' % name],
+                     sfdisk_script(layout[name]))
+
+        def _format(part):
+            start = timeit.default_timer()
+            _run(['mkfs.%s' % part['filesystem']] + part['mkfs_args'] +
+                 [part['device']])
+            elapsed = timeit.default_timer() - start
+            logger.info('Created %s on %s in %.2f seconds',
+                        part['filesystem'], part['device'], elapsed)
+            self.timer.record('mkfs', elapsed, device=part['device'])
+
+        def _record_failures(results, get_disk):
+            for item, _, error in results:
+                if error is not None:
+                    disk = get_disk(item)
+                    logger.error('Failed to configure disk %s: %s', disk,
+                                 error)
+                    failures.setdefault(disk, error)
+
+        disk_of = collections.OrderedDict()
+        for name, disk in layout.items():
+            for part in disk['partitions']:
+                disk_of[part['device']] = name
+        _record_failures(utils.run_parallel(_partition, list(layout),
+                                            self.jobs),
+                         lambda name: name)
+        # Wait for the new partition device nodes to appear
+        _run(['udevadm', 'settle'])
+
+        formats = [p for p in parts if p['filesystem'] is not None and
+                   disk_of[p['device']] not in failures]
+        _record_failures(utils.run_parallel(_format, formats, self.jobs),
+                         lambda p: disk_of[p['device']])
+
+        done = []
+        for part in mounts:
+            disk = disk_of[part['device']]
+            if disk in failures:
+                continue
+            try:
+                with self.timer.phase('mount'):
+                    if not os.path.isdir(part['mountpoint']):
+                        os.makedirs(part['mountpoint'])
+                    _run(['mount', '-t', part['filesystem'], '-o',
+                          part['mount_options'], part['device'],
+                          part['mountpoint']])
+            except (subprocess.CalledProcessError, OSError) as e:
+                logger.error('Failed to mount %s on %s: %s', part['device'],
+                             part['mountpoint'], e)
+                failures.setdefault(disk, e)
+                continue
+            done.append(part)
+        paths = [p['device'] for p in done]
+        self._uuids.invalidate(paths)
+        with self.timer.phase('uuid'):
+            self._uuids.prime(paths)
+        for part in done:
+            self.add_to_fstab(part['device'], part['mountpoint'],
+                              part['filesystem'], part['mount_options'],
+                              False)
+        files_changed = self.write_fstab(noop=False)
+        if failures:
+            raise impl_base.DiskApplyException(failures)
+        return files_changed
@@ -0,0 +1,110 @@
+# Copyright 2015 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Loading and caching the config file."""
+
+import hashlib
+import json
+import logging
+import os
+import sys
+
+import yaml
+
+from os_disk_config import objects
+from os_disk_config import utils
+
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.path.join(utils.STATE_DIR, 'configs')
+
+# The C implementation is much faster on large configs, but is only there
+# if PyYAML was built against libyaml.
+_YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+def parse_config(data):
+    """Parse JSON or YAML config data and check its version.
+
+    :param data: The contents of the config file.
+    :returns: the config as a dict.
+    :raises: objects.InvalidConfigException if it is not a valid config.
+    """
+    config = None
+    # yaml will happily load a json file, but return worthless data
+    # json will blow up on a yaml file, so try it first if it looks like json
+    if data.lstrip()[:1] == '{':
+        try:
+            config = json.loads(data)
+        except ValueError:
+            pass
+    if config is None:
+        try:
+            config = yaml.load(data, Loader=_YAML_LOADER)
+        except yaml.YAMLError as e:
+            raise objects.InvalidConfigException('Unable to parse config: %s'
+                                                 % e)
+    if not isinstance(config, dict):
+        raise objects.InvalidConfigException('The config must be a mapping')
+    objects.check_version(config)
+    return config
+
+
+def _cache_file(filename):
+    key = hashlib.sha256(os.path.abspath(filename).encode('utf-8'))
+    return os.path.join(CACHE_DIR, key.hexdigest()[:32] + '.json')
+
+
+def load_config(filename, use_cache=True):
+    """Load and check a config file, using the cache where possible.
+
+    The cache is keyed on the file's path, mtime and content hash, and on
+    the supported config version, so any change to the file is picked up.
+
+    :param filename: The path to the config file, or "-" to read it from
+        stdin.
+    :param use_cache: Whether to read and update the cache.
+    :returns: the config as a dict.
+    """
+    if filename == '-':
+        return parse_config(sys.stdin.read())
+
+    with open(filename) as f:
+        data = f.read()
+    if not use_cache:
+        return parse_config(data)
+
+    key = {'path': os.path.abspath(filename),
+           'mtime': os.path.getmtime(filename),
+           'sha256': hashlib.sha256(data.encode('utf-8')).hexdigest(),
+           'version': objects.CONFIG_VERSION}
+    cache_file = _cache_file(filename)
+    try:
+        cached = json.loads(utils.get_file_data(cache_file) or '{}')
+    except ValueError:
+        cached = {}
+    if cached.get('key') == key:
+        logger.debug('Using cached config from %s', cache_file)
+        return cached['config']
+
+    config = parse_config(data)
+    try:
+        if not os.path.isdir(CACHE_DIR):
+            os.makedirs(CACHE_DIR)
+        utils.write_config(cache_file, json.dumps({'key': key,
+                                                   'config': config}))
+    except (IOError, OSError, TypeError) as e:
+        logger.debug('Unable to cache the config: %s', e)
+    return config
@@ -0,0 +1,148 @@
+# Copyright 2015 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Creating md RAID arrays and tuning their initial resync."""
+
+import json
+import logging
+import os
+import subprocess
+
+from os_disk_config import utils
+
+
+logger = logging.getLogger(__name__)
+
+_SYS_BLOCK = '/sys/block'
+# Arrays whose resync speed limits were raised and still need restoring
+SYNC_SPEED_STATE = os.path.join(utils.STATE_DIR, 'sync-speeds.json')
+# The chunk size mdadm uses when none is given
+DEFAULT_CHUNK = 512 * 1024
+# The number of members of each level that hold parity or copies
+_REDUNDANT_MEMBERS = {'raid0': 0, 'raid4': 1, 'raid5': 1, 'raid6': 2}
+
+
+def data_disks(level, members):
+    """Return how many members of an array each stripe holds data on.
+
+    raid1 arrays are not striped, so they have a single data disk, and
+    raid10 is taken to use the default near=2 layout.
+    """
+    if level == 'raid1':
+        return 1
+    if level == 'raid10':
+        return members // 2
+    return members - _REDUNDANT_MEMBERS[level]
+
+
+def create_command(path, level, members, chunk=None, bitmap=None,
+                   assume_clean=False):
+    """Return the mdadm command that creates an array.
+
+    :param path: The path of the new array, e.g. /dev/md/data.
+    :param level: The RAID level, e.g. "raid10".
+    :param members: The paths of the member devices.
+    :param chunk: The chunk size in bytes, or None for the mdadm default.
+    :param bitmap: "internal", "none", or None for the mdadm default.
+    :param assume_clean: Skip the initial resync.  Only safe on members that
+        are known to be blank, e.g. brand new or zeroed disks.
+    """
+    cmd = ['mdadm', '--create', path, '--run', '--level=%s' % level,
+           '--raid-devices=%d' % len(members)]
+    if chunk is not None:
+        # mdadm takes the chunk size in KiB
+        cmd.append('--chunk=%d' % (chunk // 1024))
+    if bitmap is not None:
+        cmd.append('--bitmap=%s' % bitmap)
+    if assume_clean:
+        cmd.append('--assume-clean')
+    return cmd + list(members)
+
+
+def create_array(path, level, members, **kwargs):
+    """Create an array with mdadm and wait for its device node.
+
+    Takes the same arguments as create_command().
+    """
+    cmd = create_command(path, level, members, **kwargs)
+    logger.debug('Running %s', ' '.join(cmd))
+    subprocess.check_call(cmd)
+    subprocess.check_call(['udevadm', 'settle'])
+
+
+def _md_dir(path):
+    return os.path.join(_SYS_BLOCK, utils.disk_name(path), 'md')
+
+
+def _load_state(state_file):
+    data = utils.get_file_data(state_file)
+    return json.loads(data) if data else []
+
+
+def _save_state(state_file, arrays):
+    state_dir = os.path.dirname(state_file)
+    if not os.path.isdir(state_dir):
+        os.makedirs(state_dir)
+    utils.write_config(state_file, json.dumps(sorted(arrays)))
+
+
+def raise_sync_speed(path, speed_min=None, speed_max=None,
+                     state_file=SYNC_SPEED_STATE):
+    """Set the resync speed limits of one array, in KiB/s.
+
+    The limits only apply to this array, and are reset to the system wide
+    ones by restore_sync_speeds() once it has finished resyncing.
+    """
+    md_dir = _md_dir(path)
+    # Raise the maximum first, so the minimum is never above it
+    for name, speed in (('sync_speed_max', speed_max),
+                        ('sync_speed_min', speed_min)):
+        if speed is not None:
+            with open(os.path.join(md_dir, name), 'w') as f:
+                f.write('%d\n' % speed)
+    arrays = set(_load_state(state_file))
+    arrays.add(utils.disk_name(path))
+    _save_state(state_file, arrays)
+    logger.info('Set resync speed of %s to %s-%s KiB/s', path, speed_min,
+                speed_max)
+
+
+def restore_sync_speeds(state_file=SYNC_SPEED_STATE):
+    """Restore the system resync limits of arrays that are now idle.
+
+    :returns: a list of the arrays that were restored.
+    """
+    arrays = _load_state(state_file)
+    if not arrays:
+        return []
+    restored = []
+    for array in arrays:
+        md_dir = _md_dir(array)
+        try:
+            with open(os.path.join(md_dir, 'sync_action')) as f:
+                action = f.read().strip()
+        except IOError:
+            # The array has gone away
+            restored.append(array)
+            continue
+        if action != 'idle':
+            logger.debug('%s is still running %s', array, action)
+            continue
+        for name in ('sync_speed_min', 'sync_speed_max'):
+            with open(os.path.join(md_dir, name), 'w') as f:
+                f.write('system\n')
+        logger.info('Restored the system resync speed limits of %s', array)
+        restored.append(array)
+    _save_state(state_file, set(arrays) - set(restored))
+    return restored
@@ -0,0 +1,145 @@
+# Copyright 2015 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Time the phases of a run and export the results.
+
+The report can be written as JSON, or in the Prometheus text format for the
+node-exporter textfile collector.
+"""
+
+import collections
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+import timeit
+
+from os_disk_config import utils
+
+
+logger = logging.getLogger(__name__)
+
+METRICS_FILE = os.path.join(utils.STATE_DIR, 'metrics.json')
+_PROMETHEUS_PREFIX = 'os_disk_config'
+
+
+def _escape_label(value):
+    return (str(value).replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+class PhaseTimer(object):
+    """Accumulate the time spent in, and number of calls to, named phases.
+
+    Phases are reported in the order they were first entered.  Timings may
+    be recorded from several threads at once.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._phases = collections.OrderedDict()
+        # Seconds for individual devices, by phase and device path
+        self._devices = collections.OrderedDict()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Context manager that records the time spent inside it as name"""
+        start = timeit.default_timer()
+        try:
+            yield
+        finally:
+            self.record(name, timeit.default_timer() - start)
+
+    def record(self, name, seconds, device=None):
+        """Add one call to name that took seconds.
+
+        :param device: If given, the time is also reported for this device.
+        """
+        with self._lock:
+            phase = self._phases.setdefault(name, {'calls': 0,
+                                                   'seconds': 0.0})
+            phase['calls'] += 1
+            phase['seconds'] += seconds
+            if device is not None:
+                self._devices.setdefault(name, collections.OrderedDict())
+                self._devices[name][device] = seconds
+
+    def report(self):
+        """Return the timings as a JSON-serialisable dict"""
+        with self._lock:
+            return {'timestamp': time.time(),
+                    'phases': collections.OrderedDict(
+                        (name, dict(phase))
+                        for name, phase in self._phases.items()),
+                    'devices': collections.OrderedDict(
+                        (name, dict(devices))
+                        for name, devices in self._devices.items())}
+
+    def summary(self):
+        """Return the lines of a human-readable phase breakdown"""
+        lines = ['%-20s %6s %10s' % ('phase', 'calls', 'seconds')]
+        for name, phase in self.report()['phases'].items():
+            lines.append('%-20s %6d %10.3f' % (name, phase['calls'],
+                                               phase['seconds']))
+        return lines
+
+    def render_textfile(self):
+        """Return the timings in the Prometheus text exposition format"""
+        report = self.report()
+        prefix = _PROMETHEUS_PREFIX
+        lines = ['# HELP %s_phase_seconds Seconds spent in each phase of the '
+                 'last run.' % prefix,
+                 '# TYPE %s_phase_seconds gauge' % prefix]
+        for name, phase in report['phases'].items():
+            lines.append('%s_phase_seconds{phase="%s"} %f' %
+                         (prefix, _escape_label(name), phase['seconds']))
+        lines += ['# HELP %s_phase_calls Times each phase ran in the last '
+                  'run.' % prefix,
+                  '# TYPE %s_phase_calls gauge' % prefix]
+        for name, phase in report['phases'].items():
+            lines.append('%s_phase_calls{phase="%s"} %d' %
+                         (prefix, _escape_label(name), phase['calls']))
+        lines += ['# HELP %s_device_seconds Seconds spent on each device in '
+                  'the last run.' % prefix,
+                  '# TYPE %s_device_seconds gauge' % prefix]
+        for name, devices in report['devices'].items():
+            for device, seconds in devices.items():
+                lines.append('%s_device_seconds{phase="%s",device="%s"} %f' %
+                             (prefix, _escape_label(name),
+                              _escape_label(device), seconds))
+        lines += ['# HELP %s_last_run_timestamp_seconds When the last run '
+                  'finished.' % prefix,
+                  '# TYPE %s_last_run_timestamp_seconds gauge' % prefix,
+                  '%s_last_run_timestamp_seconds %f' % (prefix,
+                                                        report['timestamp'])]
+        return '\n'.join(lines) + '\n'
+
+    def write_json(self, filename=METRICS_FILE):
+        """Atomically write the JSON report to filename"""
+        self._write(filename, json.dumps(self.report(), indent=2) + '\n')
+
+    def write_textfile(self, filename):
+        """Atomically write the Prometheus textfile to filename.
+
+        The textfile collector may read the file at any time, so it is
+        never left partly written.
+        """
+        self._write(filename, self.render_textfile())
+
+    def _write(self, filename, data):
+        directory = os.path.dirname(filename)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        utils.write_config(filename, data)
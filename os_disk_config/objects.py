@@ -15,6 +15,9 @@
 # under the License.
 
 import logging
+import re
+
+import six
 
 from os_disk_config.openstack.common import versionutils
 from os_disk_config import utils
@@ -30,10 +33,123 @@ class InvalidConfigException(ValueError):
     pass
 
 
+# Maps the "type" field of config objects to the class that represents them
+_OBJECT_TYPES = {}
+
+
+def register_type(type_name):
+    """Class decorator that makes a class available as a config "type"."""
+    def _register(cls):
+        cls.type_name = type_name
+        _OBJECT_TYPES[type_name] = cls
+        return cls
+    return _register
+
+
 def object_from_json(json):
     obj_type = json.get("type")
-    if obj_type == "standard":
-        return StandardPartition.from_json(json)
+    cls = _OBJECT_TYPES.get(obj_type)
+    if cls is None:
+        raise InvalidConfigException('Unknown object type: %s' % obj_type)
+    return cls.from_json(json)
+
+
+def objects_from_json(json_list):
+    """Validate a list of JSON objects and build the object for each.
+
+    Errors are reported with the position of the offending entry.  Object
+    names must be unique.
+
+    :param json_list: The list of JSON objects from the config.
+    :returns: a list of objects, in config order.
+    """
+    objs = []
+    by_name = {}
+    used = {}
+    for i, json in enumerate(json_list):
+        if not isinstance(json, dict):
+            raise InvalidConfigException('Config entry %d is not an object' %
+                                         i)
+        try:
+            obj = object_from_json(json)
+        except InvalidConfigException as e:
+            raise InvalidConfigException('Config entry %d: %s' % (i, e))
+        if obj.name in by_name:
+            raise InvalidConfigException('Config entry %d: duplicate name %s'
+                                         % (i, obj.name))
+        for ref in obj.references():
+            if ref not in by_name:
+                raise InvalidConfigException('Config entry %d: %s must be '
+                                             'defined before it is used' %
+                                             (i, ref))
+        try:
+            obj.check_references(by_name)
+        except InvalidConfigException as e:
+            raise InvalidConfigException('Config entry %d: %s' % (i, e))
+        for ref in obj.members():
+            if ref in used:
+                raise InvalidConfigException('Config entry %d: %s is already '
+                                             'used by %s' %
+                                             (i, ref, used[ref]))
+            if by_name[ref].filesystem or by_name[ref].mountpoint:
+                raise InvalidConfigException('Config entry %d: %s cannot '
+                                             'have a filesystem or mountpoint'
+                                             ' when it is used by %s' %
+                                             (i, ref, obj.name))
+            used[ref] = obj.name
+        by_name[obj.name] = obj
+        objs.append(obj)
+    return objs
+
+
+def referenced_disks(objs):
+    """Return the kernel names of every disk used by a list of objects.
+
+    :param objs: A list of objects as returned by object_from_json.
+    :returns: a list of unique disk names, in the order they are first used.
+    """
+    disks = []
+    for obj in objs:
+        for disk in getattr(obj, 'disks', None) or []:
+            name = utils.disk_name(disk)
+            if name not in disks:
+                disks.append(name)
+    return disks
+
+
+def check_disks(objs):
+    """Check the disks of every object, once selectors have been resolved.
+
+    :param objs: A list of objects as returned by objects_from_json.
+    :raises: InvalidConfigException naming the first object with too few
+        disks.
+    """
+    for obj in objs:
+        try:
+            obj.check_disks()
+        except InvalidConfigException as e:
+            raise InvalidConfigException('%s: %s' % (obj.name, e))
+
+
+def wipe_requests(objs):
+    """Return the disks that objects have asked to be wiped.
+
+    :param objs: A list of objects as returned by object_from_json.
+    :returns: a dict of disk name: wipe mode.
+    :raises: InvalidConfigException if a disk is given conflicting modes.
+    """
+    wipes = {}
+    for obj in objs:
+        mode = getattr(obj, 'wipe', None)
+        if not mode:
+            continue
+        for disk in obj.disks:
+            name = utils.disk_name(disk)
+            if wipes.setdefault(name, mode) != mode:
+                raise InvalidConfigException(
+                    'Conflicting wipe modes for %s: %s and %s' %
+                    (name, wipes[name], mode))
+    return wipes
 
 
 def _get_required_field(json, name, object_name):
@@ -55,33 +171,568 @@ def check_version(json):
                                      (version, CONFIG_VERSION))
 
 
+def _intern_disks(disks):
+    # The same few disk names are repeated across thousands of objects
+    return [d if isinstance(d, dict) else six.moves.intern(str(d))
+            for d in disks]
+
+
 class _BaseOpts(object):
     """Base abstraction for partition options."""
+    __slots__ = ('name', 'disks', 'size', 'filesystem', 'mountpoint',
+                 'format_options', 'wipe', 'mount_options')
+    # Set by register_type
+    type_name = None
+    # The DiskConfigBase method that adds this type of object
+    add_method = None
 
-    def __init__(self, name, disks, size, filesystem, mountpoint):
+    def __init__(self, name, disks, size, filesystem, mountpoint,
+                 format_options=None, wipe=None, mount_options=None):
         self.name = name
-        self.disks = disks
+        self.disks = _intern_disks(disks)
         self.size = size
         self.filesystem = filesystem
         self.mountpoint = mountpoint
+        self.format_options = format_options
+        self.wipe = wipe
+        self.mount_options = mount_options
+
+    def references(self):
+        """Return the names of the config objects this one is built on"""
+        return self.members()
+
+    def members(self):
+        """Return the referenced objects that this one uses up.
+
+        Members cannot have a filesystem or be used by anything else.
+        """
+        return []
+
+    def check_references(self, by_name):
+        """Check the objects this one refers to are of the right kind.
+
+        :param by_name: The objects defined so far, by name.
+        :raises: InvalidConfigException if they are not.
+        """
+        pass
+
+    def check_disks(self):
+        """Check the disks, once any selectors in them have been resolved.
+
+        :raises: InvalidConfigException if there are too few of them.
+        """
+        pass
 
     @staticmethod
     def base_opts_from_json(json):
-        disks = _get_required_field(json, 'disks', 'All')
+        disks = _get_disks(_get_required_field(json, 'disks', 'All'))
         size = _get_required_field(json, 'size', 'All')
         filesystem = json.get('filesystem')
         mountpoint = json.get('mountpoint')
-        return (disks, size, filesystem, mountpoint)
+        format_options = _get_format_options(json)
+        wipe = _get_wipe(json)
+        mount_options = _get_mount_options(json)
+        return (disks, size, filesystem, mountpoint, format_options, wipe,
+                mount_options)
+
+
+def _get_disks(disks):
+    """Validate a list of disk names and selectors"""
+    if not isinstance(disks, list):
+        raise InvalidConfigException('disks must be a list')
+    for disk in disks:
+        if isinstance(disk, dict):
+            _check_disk_selector(disk)
+        elif not isinstance(disk, six.string_types):
+            raise InvalidConfigException('disks must be names or selectors')
+    return disks
+
+
+# See the disk_selectors module
+_SELECTOR_BOOL_KEYS = ('rotational', 'removable', 'unused')
+SELECTOR_KEYS = frozenset(_SELECTOR_BOOL_KEYS +
+                          ('name', 'model', 'wwn', 'transport', 'min_size',
+                           'max_size', 'count', 'order'))
+SELECTOR_ORDERS = ('name', 'smallest', 'largest')
+
+
+def _check_disk_selector(selector):
+    """Validate a selector dict in the disks field."""
+    unknown = set(selector) - SELECTOR_KEYS
+    if unknown:
+        raise InvalidConfigException('Unknown disk selector keys: %s' %
+                                     ', '.join(sorted(unknown)))
+    if not set(selector) - set(['count', 'order']):
+        raise InvalidConfigException('Disk selectors must match on at least '
+                                     'one attribute')
+    for key in _SELECTOR_BOOL_KEYS:
+        if key in selector and not isinstance(selector[key], bool):
+            raise InvalidConfigException('Disk selector %s must be a boolean'
+                                         % key)
+    for key in ('min_size', 'max_size'):
+        if key in selector:
+            try:
+                utils.parse_size(selector[key])
+            except ValueError as e:
+                raise InvalidConfigException('Disk selector %s: %s' %
+                                             (key, e))
+    count = selector.get('count')
+    if count is not None and (isinstance(count, bool) or
+                              not isinstance(count, int) or count < 1):
+        raise InvalidConfigException('Disk selector count must be a positive '
+                                     'integer')
+    if selector.get('order', 'name') not in SELECTOR_ORDERS:
+        raise InvalidConfigException('Disk selector order must be one of: %s'
+                                     % ', '.join(SELECTOR_ORDERS))
+
+
+# In increasing order of how much they erase, see the wipe module
+WIPE_MODES = ('signatures', 'discard', 'zero')
+
+
+def _get_wipe(json):
+    """Validate the optional wipe field.
+
+    True is the same as "signatures", false or missing means no wipe.
+    """
+    wipe = json.get('wipe')
+    if not wipe:
+        return None
+    if wipe is True:
+        return 'signatures'
+    if wipe not in WIPE_MODES:
+        raise InvalidConfigException('wipe must be a boolean or one of: %s' %
+                                     ', '.join(WIPE_MODES))
+    return wipe
+
 
+def _get_format_options(json):
+    """Validate the optional format_options field.
 
+    It may be the name of a format profile, a list of extra mkfs arguments,
+    or a dict with an optional 'profile' name and optional 'args' list.
+    """
+    # profiles uses the object classes, so it cannot be imported before them
+    from os_disk_config import profiles
+
+    format_options = json.get('format_options')
+    if format_options is None:
+        return None
+    if isinstance(format_options, list):
+        format_options = [str(a) for a in format_options]
+    elif not (isinstance(format_options, six.string_types) or
+              (isinstance(format_options, dict) and
+               set(format_options) <= set(['profile', 'args']) and
+               isinstance(format_options.get('args', []), list))):
+        raise InvalidConfigException('format_options must be a profile '
+                                     'name, a list of mkfs arguments or a '
+                                     'dict of "profile" and "args"')
+    profiles.check_format_options(json.get('filesystem'), format_options)
+    return format_options
+
+
+def _get_mount_options(json):
+    """Validate the optional mount_options field.
+
+    It may be the name of a mount profile, "auto" to pick one from the
+    kind of disk, a list of mount options, or a dict with an optional
+    'profile' name and optional 'options' list.
+    """
+    # profiles uses the object classes, so it cannot be imported before them
+    from os_disk_config import profiles
+
+    mount_options = json.get('mount_options')
+    if mount_options is None:
+        return None
+    if isinstance(mount_options, list):
+        mount_options = [str(o) for o in mount_options]
+    elif not (isinstance(mount_options, six.string_types) or
+              (isinstance(mount_options, dict) and
+               set(mount_options) <= set(['profile', 'options']) and
+               isinstance(mount_options.get('options', []), list))):
+        raise InvalidConfigException('mount_options must be a profile name, '
+                                     'a list of mount options or a dict of '
+                                     '"profile" and "options"')
+    profiles.check_mount_options(mount_options)
+    return mount_options
+
+
+@register_type('standard')
 class StandardPartition(_BaseOpts):
-    """Class for representing partitions."""
-    def __init__(self, name, disks, size, filesystem, mountpoint):
+    """Class for representing partitions.
+
+    align is an alignment for the start of the partition, on top of the one
+    worked out from the I/O hints of the disk it is placed on.
+    """
+    __slots__ = ('align',)
+    add_method = 'add_standard_partition'
+
+    def __init__(self, name, disks, size, filesystem, mountpoint,
+                 format_options=None, wipe=None, mount_options=None,
+                 align=None):
         super(StandardPartition, self).__init__(name, disks, size, filesystem,
-                                                mountpoint)
+                                                mountpoint, format_options,
+                                                wipe, mount_options)
+        self.align = align
 
     @staticmethod
     def from_json(json):
         name = _get_required_field(json, 'name', 'StandardPartition')
         opts = _BaseOpts.base_opts_from_json(json)
-        return StandardPartition(name, *opts)
+        align = _get_size(json, 'align')
+        if align is not None and utils.parse_size(align) <= 0:
+            raise InvalidConfigException('align must be more than 0')
+        return StandardPartition(name, *opts, align=align)
+
+
+# The fewest members an array of each level can be created with
+RAID_LEVELS = {'raid0': 2, 'raid1': 2, 'raid4': 3, 'raid5': 3, 'raid6': 4,
+               'raid10': 2}
+BITMAP_MODES = ('internal', 'none')
+
+
+def _get_raid_level(json):
+    level = json.get('level')
+    if level is None:
+        raise InvalidConfigException('RaidArray JSON objects require '
+                                     '\'level\' to be configured.')
+    level = str(level).lower()
+    if not level.startswith('raid'):
+        level = 'raid' + level
+    if level not in RAID_LEVELS:
+        raise InvalidConfigException('level must be one of: %s' %
+                                     ', '.join(sorted(RAID_LEVELS)))
+    return level
+
+
+def _get_size(json, name):
+    """Validate an optional size field"""
+    size = json.get(name)
+    if size is not None:
+        try:
+            utils.parse_size(size)
+        except (TypeError, ValueError):
+            raise InvalidConfigException('%s must be a size, e.g. "512 KiB"'
+                                         % name)
+    return size
+
+
+def _get_sync_speeds(json):
+    speeds = []
+    for name in ('sync_speed_min', 'sync_speed_max'):
+        speed = json.get(name)
+        if speed is not None and (isinstance(speed, bool) or
+                                  not isinstance(speed, int) or speed < 1):
+            raise InvalidConfigException('%s must be a positive number of '
+                                         'KiB/s' % name)
+        speeds.append(speed)
+    if None not in speeds and speeds[0] > speeds[1]:
+        raise InvalidConfigException('sync_speed_min must not be more than '
+                                     'sync_speed_max')
+    return speeds
+
+
+def _get_members(json, object_name):
+    """Validate the member disks and partitions of an array or VG"""
+    disks = _get_disks(json.get('disks') or [])
+    partitions = json.get('partitions') or []
+    if (not isinstance(partitions, list) or
+            not all(isinstance(p, six.string_types) for p in partitions)):
+        raise InvalidConfigException('partitions must be a list of names')
+    if not disks and not partitions:
+        raise InvalidConfigException('%s JSON objects require \'disks\' or '
+                                     '\'partitions\' to be configured.' %
+                                     object_name)
+    return disks, partitions
+
+
+@register_type('raid')
+class RaidArray(_BaseOpts):
+    """Class for representing md RAID arrays.
+
+    Members are either whole disks, on each of which a partition of size
+    (or the whole disk, if size is None) is created, or the names of
+    standard partitions defined earlier in the config.
+    """
+    __slots__ = ('level', 'partitions', 'chunk', 'bitmap', 'assume_clean',
+                 'sync_speed_min', 'sync_speed_max')
+    add_method = 'add_raid'
+
+    def __init__(self, name, disks, size, filesystem, mountpoint, level,
+                 partitions=None, chunk=None, bitmap=None, assume_clean=False,
+                 sync_speed_min=None, sync_speed_max=None,
+                 format_options=None, wipe=None, mount_options=None):
+        super(RaidArray, self).__init__(name, disks, size, filesystem,
+                                        mountpoint, format_options, wipe,
+                                        mount_options)
+        self.level = level
+        self.partitions = list(partitions or [])
+        self.chunk = chunk
+        self.bitmap = bitmap
+        self.assume_clean = assume_clean
+        self.sync_speed_min = sync_speed_min
+        self.sync_speed_max = sync_speed_max
+
+    def members(self):
+        return list(self.partitions)
+
+    def check_disks(self):
+        if len(self.disks) + len(self.partitions) < RAID_LEVELS[self.level]:
+            raise InvalidConfigException('%s needs at least %d members' %
+                                         (self.level,
+                                          RAID_LEVELS[self.level]))
+
+    @staticmethod
+    def from_json(json):
+        name = _get_required_field(json, 'name', 'RaidArray')
+        level = _get_raid_level(json)
+        disks, partitions = _get_members(json, 'RaidArray')
+        chunk = _get_size(json, 'chunk')
+        if chunk is not None and level == 'raid1':
+            raise InvalidConfigException('raid1 arrays have no chunk size')
+        bitmap = json.get('bitmap')
+        if bitmap is not None and bitmap not in BITMAP_MODES:
+            raise InvalidConfigException('bitmap must be one of: %s' %
+                                         ', '.join(BITMAP_MODES))
+        if bitmap == 'internal' and level == 'raid0':
+            raise InvalidConfigException('raid0 arrays cannot have a bitmap')
+        assume_clean = json.get('assume_clean', False)
+        if not isinstance(assume_clean, bool):
+            raise InvalidConfigException('assume_clean must be a boolean')
+        sync_speed_min, sync_speed_max = _get_sync_speeds(json)
+        array = RaidArray(name, disks, _get_size(json, 'size'),
+                          json.get('filesystem'), json.get('mountpoint'),
+                          level, partitions, chunk, bitmap, assume_clean,
+                          sync_speed_min, sync_speed_max,
+                          _get_format_options(json), _get_wipe(json),
+                          _get_mount_options(json))
+        # Selectors may match any number of disks, so they are only counted
+        # once they have been resolved
+        if all(not isinstance(d, dict) for d in disks):
+            array.check_disks()
+        return array
+
+
+@register_type('volume_group')
+class VolumeGroup(_BaseOpts):
+    """Class for representing LVM volume groups.
+
+    Physical volumes are created like the members of a RaidArray: one
+    partition of size (or the whole disk) on each disk, plus any earlier
+    partitions or arrays named in partitions.
+    """
+    __slots__ = ('partitions', 'pe_size')
+    add_method = 'add_volume_group'
+
+    def __init__(self, name, disks, size, partitions=None, pe_size=None,
+                 wipe=None):
+        super(VolumeGroup, self).__init__(name, disks, size, None, None,
+                                          wipe=wipe)
+        self.partitions = list(partitions or [])
+        self.pe_size = pe_size
+
+    def members(self):
+        return list(self.partitions)
+
+    @staticmethod
+    def from_json(json):
+        name = _get_required_field(json, 'name', 'VolumeGroup')
+        disks, partitions = _get_members(json, 'VolumeGroup')
+        for field in ('filesystem', 'mountpoint'):
+            if json.get(field) is not None:
+                raise InvalidConfigException('Volume groups cannot have a %s'
+                                             % field)
+        return VolumeGroup(name, disks, _get_size(json, 'size'), partitions,
+                           _get_size(json, 'pe_size'), _get_wipe(json))
+
+
+_MIN_STRIPE_SIZE = 4 * 1024
+
+
+def _get_stripes(json):
+    stripes = json.get('stripes')
+    if stripes is not None and (isinstance(stripes, bool) or
+                                not isinstance(stripes, int) or
+                                stripes < 1):
+        raise InvalidConfigException('stripes must be a positive integer')
+    stripe_size = _get_size(json, 'stripe_size')
+    if stripe_size is not None and not stripes:
+        raise InvalidConfigException('stripe_size requires stripes')
+    if stripe_size is not None:
+        value = utils.parse_size(stripe_size)
+        # lvcreate only takes powers of two of at least a page
+        if value < _MIN_STRIPE_SIZE or value & (value - 1):
+            raise InvalidConfigException('stripe_size must be a power of two '
+                                         'of at least 4 KiB')
+    if stripes and _get_size(json, 'size') is None:
+        # Growing the volume would hand lvcreate a size that the free
+        # extents on each physical volume may not allow
+        raise InvalidConfigException('Striped logical volumes require '
+                                     '\'size\' to be configured.')
+    return stripes, stripe_size
+
+
+@register_type('logical_volume')
+class LogicalVolume(_BaseOpts):
+    """Class for representing LVM logical volumes.
+
+    A volume is either a normal one, optionally striped over several
+    physical volumes, a thin pool (thin_pool is True) or a thin volume in
+    the pool named by pool, whose size is its virtual size.  Linear volumes
+    and pools without a size fill the free space in the volume group.
+    Striped volumes must have a size.
+    """
+    __slots__ = ('volume_group', 'stripes', 'stripe_size', 'thin_pool',
+                 'pool', 'metadata_size', 'chunk')
+    add_method = 'add_logical_volume'
+
+    def __init__(self, name, volume_group, size, filesystem=None,
+                 mountpoint=None, stripes=None, stripe_size=None,
+                 thin_pool=False, pool=None, metadata_size=None, chunk=None,
+                 format_options=None, mount_options=None):
+        super(LogicalVolume, self).__init__(name, [], size, filesystem,
+                                            mountpoint, format_options,
+                                            mount_options=mount_options)
+        self.volume_group = volume_group
+        self.stripes = stripes
+        self.stripe_size = stripe_size
+        self.thin_pool = thin_pool
+        self.pool = pool
+        self.metadata_size = metadata_size
+        self.chunk = chunk
+
+    def references(self):
+        return [r for r in (self.volume_group, self.pool) if r]
+
+    def check_references(self, by_name):
+        if not isinstance(by_name[self.volume_group], VolumeGroup):
+            raise InvalidConfigException('%s is not a volume group' %
+                                         self.volume_group)
+        if self.pool is not None:
+            pool = by_name[self.pool]
+            if (not isinstance(pool, LogicalVolume) or not pool.thin_pool or
+                    pool.volume_group != self.volume_group):
+                raise InvalidConfigException('%s is not a thin pool in %s' %
+                                             (self.pool, self.volume_group))
+
+    @staticmethod
+    def from_json(json):
+        name = _get_required_field(json, 'name', 'LogicalVolume')
+        volume_group = _get_required_field(json, 'volume_group',
+                                           'LogicalVolume')
+        size = _get_size(json, 'size')
+        stripes, stripe_size = _get_stripes(json)
+        thin_pool = json.get('thin_pool', False)
+        if not isinstance(thin_pool, bool):
+            raise InvalidConfigException('thin_pool must be a boolean')
+        pool = json.get('pool')
+        if pool is not None and not isinstance(pool, six.string_types):
+            raise InvalidConfigException('pool must be the name of a thin '
+                                         'pool')
+        metadata_size = _get_size(json, 'metadata_size')
+        chunk = _get_size(json, 'chunk')
+        if not thin_pool and (metadata_size is not None or
+                              chunk is not None):
+            raise InvalidConfigException('metadata_size and chunk are only '
+                                         'for thin pools')
+        if thin_pool and pool is not None:
+            raise InvalidConfigException('A thin pool cannot be in a pool')
+        if (thin_pool or pool is not None) and stripes:
+            raise InvalidConfigException('Thin pools and volumes cannot be '
+                                         'striped')
+        if pool is not None and size is None:
+            raise InvalidConfigException('Thin volumes require \'size\' to '
+                                         'be configured.')
+        filesystem = json.get('filesystem')
+        mountpoint = json.get('mountpoint')
+        if thin_pool and (filesystem or mountpoint):
+            raise InvalidConfigException('Thin pools cannot have a '
+                                         'filesystem')
+        return LogicalVolume(name, volume_group, size, filesystem,
+                             mountpoint, stripes, stripe_size, thin_pool,
+                             pool, metadata_size, chunk,
+                             _get_format_options(json),
+                             _get_mount_options(json))
+
+
+# The block queue attributes that can be tuned, in the order they are
+# written.  The limit on nr_requests depends on the scheduler, so it goes
+# last.
+QUEUE_SETTINGS = ('scheduler', 'read_ahead_kb', 'nr_requests')
+_SCHEDULER_RE = re.compile(r'^[a-z0-9_-]+$')
+
+
+class QueueTuning(object):
+    """The block queue settings for the disks of one queue_tuning entry.
+
+    These are not partition objects: they are listed in their own section
+    of the config and applied by the queue_tuning module.
+    """
+    __slots__ = ('name', 'disks', 'scheduler', 'read_ahead_kb',
+                 'nr_requests')
+
+    def __init__(self, name, disks, scheduler=None, read_ahead_kb=None,
+                 nr_requests=None):
+        self.name = name
+        self.disks = disks
+        self.scheduler = scheduler
+        self.read_ahead_kb = read_ahead_kb
+        self.nr_requests = nr_requests
+
+    def settings(self):
+        """Return the (attribute, value) pairs this entry sets"""
+        return [(attr, getattr(self, attr)) for attr in QUEUE_SETTINGS
+                if getattr(self, attr) is not None]
+
+    @staticmethod
+    def from_json(json, name):
+        disks = _get_disks(_get_required_field(json, 'disks', 'QueueTuning'))
+        unknown = set(json) - set(('disks',) + QUEUE_SETTINGS)
+        if unknown:
+            raise InvalidConfigException('Unknown queue settings: %s' %
+                                         ', '.join(sorted(unknown)))
+        scheduler = json.get('scheduler')
+        if scheduler is not None and (
+                not isinstance(scheduler, six.string_types) or
+                not _SCHEDULER_RE.match(scheduler)):
+            raise InvalidConfigException('scheduler must be the name of an '
+                                         'I/O scheduler')
+        values = []
+        for attr, minimum in (('read_ahead_kb', 0), ('nr_requests', 1)):
+            value = json.get(attr)
+            if value is not None and (isinstance(value, bool) or
+                                      not isinstance(value, int) or
+                                      value < minimum):
+                raise InvalidConfigException(
+                    '%s must be an integer of at least %d' % (attr, minimum))
+            values.append(value)
+        tuning = QueueTuning(name, disks, scheduler, *values)
+        if not tuning.settings():
+            raise InvalidConfigException(
+                'QueueTuning JSON objects require at least one of %s' %
+                ', '.join(QUEUE_SETTINGS))
+        return tuning
+
+
+def queue_tunings_from_json(json_list):
+    """Validate the queue_tuning section of the config.
+
+    :param json_list: The list of entries, or None if there is no section.
+    :returns: a list of QueueTuning objects, in config order.
+    """
+    if json_list is None:
+        return []
+    if not isinstance(json_list, list):
+        raise InvalidConfigException('queue_tuning must be a list')
+    tunings = []
+    for i, json in enumerate(json_list):
+        if not isinstance(json, dict):
+            raise InvalidConfigException(
+                'queue_tuning entry %d is not an object' % i)
+        try:
+            tunings.append(QueueTuning.from_json(json,
+                                                 'queue_tuning[%d]' % i))
+        except InvalidConfigException as e:
+            raise InvalidConfigException('queue_tuning entry %d: %s' %
+                                         (i, e))
+    return tunings
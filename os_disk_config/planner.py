@@ -0,0 +1,349 @@
+# Copyright 2015 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Work out the layout a config would produce without loading blivet.
+
+Disk sizes and sector geometry come from a single snapshot of /sys/block,
+so planning never probes the disks and takes a fraction of a second.  The
+layout follows the same rules as the blivet provider: every disk gets a new
+GPT label, partitions are placed in config order, starts are aligned to
+the I/O hints of the disk (see io_alignment()), and a partition that may go
+on several disks goes on the one with the most free space.  RAID members
+and LVM physical volumes given as disks get a partition on each of them.
+"""
+
+import collections
+import logging
+
+from os_disk_config import fstab
+from os_disk_config import objects
+from os_disk_config import profiles
+from os_disk_config import utils
+
+
+logger = logging.getLogger(__name__)
+
+ALIGNMENT = 1024 ** 2
+# I/O hints that would align partitions to more than this are ignored, as
+# some devices report nonsense such as an optimal_io_size of 32 MiB - 512
+_MAX_ALIGNMENT = 64 * 1024 ** 2
+# The size of the GPT partition entry array, which is stored after the
+# primary header and before the backup header
+_GPT_ENTRIES_BYTES = 16384
+
+
+class PlanningException(Exception):
+    pass
+
+
+def partition_path(disk, number):
+    """Return the device path of partition number on disk"""
+    separator = 'p' if disk[-1].isdigit() else ''
+    return '/dev/%s%s%d' % (disk, separator, number)
+
+
+def io_alignment(info):
+    """Return the alignment in bytes for partition starts on a disk.
+
+    This is the least common multiple of 1 MiB and the physical_block_size,
+    minimum_io_size and optimal_io_size hints, so that partitions on 4Kn
+    drives and RAID LUNs start on a full stripe.  Hints that are not a
+    multiple of the logical block size, or would make the alignment larger
+    than 64 MiB, are ignored.
+
+    :param info: The attributes of the disk, as in
+        utils.block_devices_snapshot().
+    """
+    grain = ALIGNMENT
+    for hint in ('physical_block_size', 'minimum_io_size', 'optimal_io_size'):
+        value = info.get(hint) or 0
+        if value <= 0:
+            continue
+        aligned = utils.lcm(grain, value)
+        if value % info['logical_block_size'] or aligned > _MAX_ALIGNMENT:
+            logger.debug('Ignoring %s of %d bytes', hint, value)
+            continue
+        grain = aligned
+    return grain
+
+
+def alignment_offset(info):
+    """Return the alignment_offset of a disk in bytes, or 0 if it is unset"""
+    # The kernel reports -1 when the device cannot be aligned at all
+    return max(0, info.get('alignment_offset') or 0)
+
+
+class _Disk(object):
+    """The space left on a disk while planning"""
+    def __init__(self, name, info):
+        self.name = name
+        self.info = info
+        self.sector_size = info['logical_block_size']
+        self.sectors = info['size'] // self.sector_size
+        self.grain = io_alignment(info)
+        # The first sector that is aligned on the underlying device
+        self.offset = alignment_offset(info) // self.sector_size
+        entries = _GPT_ENTRIES_BYTES // self.sector_size
+        # The protective MBR, the primary header and entries come first
+        self.next_start = 2 + entries
+        self.last_usable = self.sectors - entries - 2
+        self.partitions = []
+
+    def grain_for(self, align=None):
+        """Return the alignment in bytes of a partition with align bytes"""
+        if align is None:
+            return self.grain
+        return utils.lcm(self.grain, align)
+
+    def align(self, sector, align=None):
+        """Round sector up to the next start aligned for align bytes"""
+        grain = self.grain_for(align) // self.sector_size
+        offset = self.offset % grain
+        sector -= offset
+        return ((sector + grain - 1) // grain) * grain + offset
+
+    def free(self, align=None):
+        return max(0, self.last_usable - self.align(self.next_start, align) +
+                   1)
+
+    def allocate(self, size, align=None):
+        count = -(-size // self.sector_size)
+        start = self.align(self.next_start, align)
+        end = start + count - 1
+        self.next_start = end + 1
+        return start, end
+
+    def layout(self):
+        return collections.OrderedDict([
+            ('size', self.sectors * self.sector_size),
+            ('sector_size', self.sector_size),
+            ('alignment', self.grain),
+            ('alignment_offset', self.offset * self.sector_size),
+            ('label', 'gpt'),
+            ('partitions', self.partitions)])
+
+
+class _Plan(object):
+    """The layout built up as objects are added, like a provider"""
+    def __init__(self, snapshot, fstab_file):
+        self._snapshot = snapshot
+        self.disks = collections.OrderedDict()
+        self.arrays = collections.OrderedDict()
+        self.volume_groups = collections.OrderedDict()
+        self.fstab = fstab.Fstab(fstab_file)
+        # The planned device path of each object, by name
+        self._paths = {}
+        # The names of the disks each object may end up on, by name
+        self._disk_names = {}
+
+    def _disk(self, d):
+        name = utils.disk_name(d)
+        if name not in self.disks:
+            if name not in self._snapshot:
+                raise PlanningException('Disk not found on the system: %s' %
+                                        name)
+            self.disks[name] = _Disk(name, self._snapshot[name])
+        return self.disks[name]
+
+    def _partition(self, name, disk_names, size, filesystem=None,
+                   mountpoint=None, align=None, fmt=None):
+        """Place a partition on one of disk_names and return its path.
+
+        :param size: The size in bytes, or None to fill the disk.
+        :param align: The alignment of the start in bytes, on top of the
+            alignment of the disk.
+        :param fmt: The items _format() returns for the partition, if it is
+            formatted.
+        """
+        candidates = [self._disk(d) for d in disk_names]
+        for disk in candidates:
+            if align is not None and align % disk.sector_size:
+                raise PlanningException('The alignment of %s is not a '
+                                        'multiple of the %d byte sectors of '
+                                        '%s' % (name, disk.sector_size,
+                                                disk.name))
+        # Stable, so ties go to the disk listed first
+        candidates.sort(key=lambda disk: -disk.free(align))
+        disk = candidates[0]
+        if size is None:
+            size = disk.free(align) * disk.sector_size
+        if not size or -(-size // disk.sector_size) > disk.free(align):
+            raise PlanningException('Not enough space for %s on %s' %
+                                    (name, ', '.join(
+                                        c.name for c in candidates)))
+        start, end = disk.allocate(size, align)
+        number = len(disk.partitions) + 1
+        path = partition_path(disk.name, number)
+        disk.partitions.append(collections.OrderedDict([
+            ('name', name),
+            ('device', path),
+            ('number', number),
+            ('start', start),
+            ('end', end),
+            ('size', (end - start + 1) * disk.sector_size),
+            ('alignment', disk.grain_for(align)),
+            ('aligned', disk.align(start, align) == start),
+            ('filesystem', filesystem),
+            ('mountpoint', mountpoint)]))
+        disk.partitions[-1].update(fmt or self._format(None))
+        return path
+
+    def _format(self, obj, disk_names=()):
+        """Return the stripe geometry, mkfs arguments and mount options of
+        obj, which is on disk_names.
+        """
+        geometry = None
+        args = None
+        options = None
+        if obj is not None:
+            self._disk_names[obj.name] = list(disk_names)
+        if obj is not None and obj.filesystem is not None:
+            disks = [self._disk(d).info for d in disk_names]
+            geometry = profiles.stripe_geometry(obj, disks)
+            try:
+                args = profiles.format_args(obj.filesystem,
+                                            obj.format_options, geometry)
+                if obj.mountpoint is not None:
+                    options = profiles.mount_options(obj.filesystem,
+                                                     obj.mount_options, disks)
+            except objects.InvalidConfigException as e:
+                raise PlanningException('%s: %s' % (obj.name, e))
+        stripe = None
+        if geometry is not None:
+            stripe = collections.OrderedDict([('unit', geometry[0]),
+                                              ('data_disks', geometry[1])])
+        return [('stripe', stripe), ('mkfs_args', args),
+                ('mount_options', options)]
+
+    def _mount(self, path, obj, fmt):
+        options = dict(fmt)['mount_options']
+        if options is not None:
+            # Nothing is formatted yet, so there are no UUIDs
+            self.fstab.add(path, obj.mountpoint, obj.filesystem, options, 0)
+
+    def _member_disks(self, obj):
+        """Return the disks under the members of an array or VG"""
+        names = [utils.disk_name(d) for d in obj.disks]
+        for member in obj.partitions:
+            names.extend(d for d in self._disk_names[member]
+                         if d not in names)
+        return names
+
+    def add_object(self, obj):
+        method = getattr(self, obj.add_method, None)
+        if method is None:
+            raise PlanningException('%s objects cannot be planned' %
+                                    obj.type_name)
+        method(obj)
+
+    def add_standard_partition(self, obj):
+        align = None
+        if obj.align is not None:
+            align = utils.parse_size(obj.align)
+        fmt = self._format(obj, [utils.disk_name(d) for d in obj.disks])
+        path = self._partition(obj.name, obj.disks,
+                               utils.parse_size(obj.size), obj.filesystem,
+                               obj.mountpoint, align, fmt)
+        self._paths[obj.name] = path
+        self._mount(path, obj, fmt)
+
+    def add_raid(self, obj):
+        size = None
+        if obj.size is not None:
+            size = utils.parse_size(obj.size)
+        members = [self._partition(obj.name, [d], size) for d in obj.disks]
+        members += [self._paths[p] for p in obj.partitions]
+        fmt = self._format(obj, self._member_disks(obj))
+        path = '/dev/md/%s' % obj.name
+        self.arrays[obj.name] = collections.OrderedDict([
+            ('device', path),
+            ('level', obj.level),
+            ('members', members),
+            ('chunk', obj.chunk),
+            ('bitmap', obj.bitmap),
+            ('assume_clean', obj.assume_clean),
+            ('filesystem', obj.filesystem),
+            ('mountpoint', obj.mountpoint)])
+        self.arrays[obj.name].update(fmt)
+        self._paths[obj.name] = path
+        self._mount(path, obj, fmt)
+
+    def add_volume_group(self, obj):
+        size = None
+        if obj.size is not None:
+            size = utils.parse_size(obj.size)
+        pvs = [self._partition(obj.name, [d], size) for d in obj.disks]
+        pvs += [self._paths[p] for p in obj.partitions]
+        self._disk_names[obj.name] = self._member_disks(obj)
+        self.volume_groups[obj.name] = collections.OrderedDict([
+            ('physical_volumes', pvs),
+            ('pe_size', obj.pe_size),
+            ('logical_volumes', [])])
+
+    def add_logical_volume(self, obj):
+        vg = self.volume_groups[obj.volume_group]
+        if obj.stripes and obj.stripes > len(vg['physical_volumes']):
+            raise PlanningException('%s cannot be striped over %d of the %d '
+                                    'physical volumes in %s' %
+                                    (obj.name, obj.stripes,
+                                     len(vg['physical_volumes']),
+                                     obj.volume_group))
+        path = '/dev/mapper/%s-%s' % (obj.volume_group.replace('-', '--'),
+                                      obj.name.replace('-', '--'))
+        fmt = self._format(obj, self._disk_names[obj.volume_group])
+        vg['logical_volumes'].append(collections.OrderedDict([
+            ('name', obj.name),
+            ('device', path),
+            ('size', obj.size),
+            ('stripes', obj.stripes),
+            ('stripe_size', obj.stripe_size),
+            ('thin_pool', obj.thin_pool),
+            ('pool', obj.pool),
+            ('filesystem', obj.filesystem),
+            ('mountpoint', obj.mountpoint)] + fmt))
+        self._paths[obj.name] = path
+        self._mount(path, obj, fmt)
+
+    def layout(self):
+        layout = collections.OrderedDict([
+            ('disks', collections.OrderedDict(
+                (name, disk.layout()) for name, disk in self.disks.items()))])
+        if self.arrays:
+            layout['arrays'] = self.arrays
+        if self.volume_groups:
+            layout['volume_groups'] = self.volume_groups
+        layout['fstab'] = self.fstab.staged
+        return layout
+
+
+def plan(objs, snapshot=None, fstab_file=fstab.FSTAB):
+    """Return the layout objs would produce.
+
+    :param objs: A list of objects as returned by objects_from_json, with
+        any disk selectors resolved.
+    :param snapshot: A snapshot to use instead of reading /sys/block.
+    :param fstab_file: The fstab file new entries are checked against.
+    :returns: a dict with the layout of each disk under "disks", any RAID
+        arrays under "arrays", any LVM volume groups under "volume_groups",
+        and the lines that would be added to fstab under "fstab".
+    :raises: PlanningException if a disk is missing or a partition does
+        not fit.
+    """
+    if snapshot is None:
+        snapshot = utils.block_devices_snapshot(
+            objects.referenced_disks(objs))
+    layout = _Plan(snapshot, fstab_file)
+    for obj in objs:
+        layout.add_object(obj)
+    return layout.layout()
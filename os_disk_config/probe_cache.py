@@ -0,0 +1,122 @@
+# Copyright 2015 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""A persistent cache of probed device topology.
+
+Probing a disk with blivet is slow, but most disks do not change between
+runs.  Each disk's topology.device_record() dicts are stored along with a
+fingerprint of the disk that is cheap to compute: its size and partition
+geometry from sysfs, the filesystem and partition properties udev found on
+it and its partitions, and a checksum of its partition table.  None of
+these change across a reboot.  Disks whose fingerprint still matches can be
+loaded from the cache instead of being probed.
+"""
+
+import hashlib
+import json
+import logging
+import os
+
+from os_disk_config import utils
+
+
+logger = logging.getLogger(__name__)
+
+CACHE_FILE = os.path.join(utils.STATE_DIR, 'devices.json')
+_RUN_UDEV_DATA = '/run/udev/data'
+_UDEV_PROPERTIES = ('E:ID_FS_', 'E:ID_PART_')
+# Enough to cover an MBR or a primary GPT header and its entries
+_PARTITION_TABLE_BYTES = 64 * 1024
+
+
+def _udev_properties(dev):
+    """Return what udev found on a device, such as its filesystem.
+
+    Only the ID_FS_* and ID_PART_* properties are kept.  They are the same
+    after a reboot, unlike the rest of the database entry and its mtime,
+    as /run is rebuilt at every boot.
+    """
+    data = utils.get_file_data(os.path.join(_RUN_UDEV_DATA, 'b' + dev))
+    return sorted(line for line in data.splitlines()
+                  if line.startswith(_UDEV_PROPERTIES))
+
+
+def _partition_table_checksum(disk):
+    try:
+        with open(os.path.join('/dev', disk), 'rb') as f:
+            return hashlib.sha256(f.read(_PARTITION_TABLE_BYTES)).hexdigest()
+    except (IOError, OSError):
+        return None
+
+
+def disk_fingerprint(disk):
+    """Return a fingerprint that changes whenever the disk is modified.
+
+    :param disk: The kernel name of the disk, e.g. "sda".
+    :returns: a string, or None if the disk does not exist.
+    """
+    state = utils.block_device_state(disk)
+    if state is None:
+        return None
+    state['udev'] = dict((name, _udev_properties(dev)) for name, dev in
+                         utils.block_device_numbers(disk).items())
+    state['table'] = _partition_table_checksum(disk)
+    return hashlib.sha256(json.dumps(state, sort_keys=True)
+                          .encode('utf-8')).hexdigest()
+
+
+class ProbeCache(object):
+    """Cached device records for each disk, keyed on disk_fingerprint().
+
+    :param filename: The file the cache is stored in.
+    """
+    def __init__(self, filename=CACHE_FILE):
+        self.filename = filename
+        self._disks = None
+
+    def _load(self):
+        if self._disks is not None:
+            return
+        self._disks = {}
+        data = utils.get_file_data(self.filename)
+        if not data:
+            return
+        try:
+            self._disks = json.loads(data)
+        except ValueError:
+            logger.warning('Ignoring corrupt device cache %s', self.filename)
+
+    def get(self, disk, fingerprint):
+        """Return the cached records for disk, or None if it has changed"""
+        self._load()
+        entry = self._disks.get(disk)
+        if entry is None or entry['fingerprint'] != fingerprint:
+            return None
+        return entry['records']
+
+    def update(self, disk, fingerprint, records):
+        """Replace the cached records for disk"""
+        self._load()
+        self._disks[disk] = {'fingerprint': fingerprint, 'records': records}
+
+    def save(self):
+        """Write the cache to disk if it has changed"""
+        self._load()
+        data = json.dumps(self._disks, sort_keys=True, indent=2) + '\n'
+        if not utils.diff(self.filename, data):
+            return
+        cache_dir = os.path.dirname(self.filename)
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        utils.write_config(self.filename, data)
@@ -0,0 +1,313 @@
+# Copyright 2015 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Named option profiles for formatting and mounting filesystems."""
+
+from os_disk_config import mdraid
+from os_disk_config import objects
+from os_disk_config import utils
+
+
+# The stripe size lvcreate uses when none is given
+_LVM_DEFAULT_STRIPE_SIZE = 64 * 1024
+_EXT_DEFAULT_BLOCK_SIZE = 4096
+# mkfs options that set the stripe geometry, which the user's take over
+_STRIPE_OPTIONS = ('su=', 'sunit=', 'stride=', 'stripe_width=',
+                   'stripe-width=')
+
+_EXT_LAZY_INIT = ['-E', 'lazy_itable_init=1,lazy_journal_init=1']
+
+# Profile name: {filesystem: extra mkfs arguments}
+FORMAT_PROFILES = {
+    # Skip the slow parts of mkfs and leave them to the kernel at runtime
+    'fast': {
+        'ext3': _EXT_LAZY_INIT + ['-E', 'nodiscard'],
+        'ext4': _EXT_LAZY_INIT + ['-E', 'nodiscard'],
+        'xfs': ['-K'],
+    },
+    # Few inodes, for big data disks holding mostly large files
+    'largefile': {
+        'ext3': ['-T', 'largefile4'] + _EXT_LAZY_INIT,
+        'ext4': ['-T', 'largefile4'] + _EXT_LAZY_INIT,
+    },
+    # Do not discard every block of the device before formatting it
+    'nodiscard': {
+        'ext3': ['-E', 'nodiscard'],
+        'ext4': ['-E', 'nodiscard'],
+        'xfs': ['-K'],
+    },
+}
+
+
+_NOATIME = ['noatime', 'nodiratime']
+_XFS_TUNING = ['inode64', 'logbsize=256k']
+
+# Profile name: {filesystem: mount options}, where None is any filesystem
+# that is not listed
+MOUNT_PROFILES = {
+    # Fewer, larger journal commits save seeks on rotating disks
+    'hdd': {
+        None: _NOATIME,
+        'ext3': _NOATIME + ['commit=60'],
+        'ext4': _NOATIME + ['commit=60'],
+        'xfs': _NOATIME + _XFS_TUNING,
+    },
+    # Online discard stalls SATA drives without queued TRIM, so freed space
+    # has to be trimmed by fstrim.timer, which is not enabled here
+    'ssd': {
+        None: _NOATIME,
+        'xfs': _NOATIME + _XFS_TUNING,
+    },
+    # NVMe drives cope with discarding blocks as they are freed
+    'nvme': {
+        None: _NOATIME,
+        'ext4': _NOATIME + ['discard'],
+        'xfs': _NOATIME + _XFS_TUNING + ['discard'],
+    },
+}
+# The profile "auto" picks for a device, from the slowest of its disks
+_DEVICE_CLASSES = ('hdd', 'ssd', 'nvme')
+
+
+def _merge_extended_options(args):
+    """Combine every "-E" argument into one, as mke2fs only honours one"""
+    merged = []
+    extended = []
+    args = iter(args)
+    for arg in args:
+        if arg == '-E':
+            try:
+                extended.extend(next(args).split(','))
+            except StopIteration:
+                raise objects.InvalidConfigException('-E needs a value')
+        else:
+            merged.append(arg)
+    if extended:
+        merged.extend(['-E', ','.join(extended)])
+    return merged
+
+
+def _hints_geometry(hints):
+    """Return the stripe described by a disk's I/O hints, if any"""
+    minimum = hints.get('minimum_io_size') or 0
+    optimal = hints.get('optimal_io_size') or 0
+    # Plain disks report their block size as minimum_io_size
+    if (minimum <= (hints.get('physical_block_size') or 0) or
+            optimal <= minimum or optimal % minimum):
+        return None
+    return minimum, optimal // minimum
+
+
+def stripe_geometry(obj, hints=()):
+    """Return the stripe geometry of the device obj creates.
+
+    RAID arrays are striped over their data disks in chunks and striped
+    logical volumes over their stripes.  Standard partitions take the
+    stripe that the minimum_io_size and optimal_io_size hints of their
+    disks describe, as hardware RAID LUNs report, if every disk they may
+    be placed on agrees.
+
+    :param obj: An object from objects_from_json, with disk selectors
+        resolved.
+    :param hints: The I/O hints of each disk a standard partition may be
+        placed on, as in utils.block_devices_snapshot().
+    :returns: a (stripe unit in bytes, number of data disks) tuple, or None
+        if the device is not striped.
+    """
+    if isinstance(obj, objects.RaidArray):
+        chunk = mdraid.DEFAULT_CHUNK
+        if obj.chunk is not None:
+            chunk = utils.parse_size(obj.chunk)
+        geometry = (chunk, mdraid.data_disks(
+            obj.level, len(obj.disks) + len(obj.partitions)))
+    elif isinstance(obj, objects.LogicalVolume):
+        stripe_size = _LVM_DEFAULT_STRIPE_SIZE
+        if obj.stripe_size is not None:
+            stripe_size = utils.parse_size(obj.stripe_size)
+        geometry = (stripe_size, obj.stripes or 1)
+    elif isinstance(obj, objects.StandardPartition) and hints:
+        geometries = set(_hints_geometry(h) for h in hints)
+        if len(geometries) != 1:
+            return None
+        geometry = geometries.pop()
+    else:
+        return None
+    if geometry is None or geometry[1] < 2:
+        return None
+    return geometry
+
+
+def _ext_block_size(args):
+    args = list(args)
+    for i, arg in enumerate(args[:-1]):
+        if arg == '-b':
+            try:
+                return int(args[i + 1])
+            except ValueError:
+                break
+    return _EXT_DEFAULT_BLOCK_SIZE
+
+
+def stripe_args(filesystem, geometry, args=()):
+    """Return the mkfs arguments that match a stripe geometry.
+
+    :param filesystem: The filesystem type, e.g. "xfs".
+    :param geometry: A tuple as returned by stripe_geometry(), or None.
+    :param args: The other mkfs arguments.  Nothing is returned if these
+        already set the stripe geometry.
+    :returns: a list of arguments to pass to mkfs, which is empty for
+        filesystems without stripe settings.
+    """
+    if geometry is None or any(option in arg for arg in args
+                               for option in _STRIPE_OPTIONS):
+        return []
+    unit, width = geometry
+    if filesystem == 'xfs':
+        return ['-d', 'su=%d,sw=%d' % (unit, width)]
+    if filesystem in ('ext3', 'ext4'):
+        block_size = _ext_block_size(args)
+        if unit % block_size:
+            return []
+        stride = unit // block_size
+        return ['-E', 'stride=%d,stripe_width=%d' % (stride, stride * width)]
+    return []
+
+
+def _split_format_options(format_options):
+    """Return the profile name and mkfs arguments in format_options"""
+    if isinstance(format_options, list):
+        return None, format_options
+    if isinstance(format_options, dict):
+        return format_options.get('profile'), format_options.get('args', [])
+    return format_options, []
+
+
+def check_format_options(filesystem, format_options):
+    """Check that format_options can be used to create filesystem.
+
+    :param filesystem: The filesystem type, or None if it is not known.
+    :param format_options: The format_options of an object, see
+        objects._get_format_options.
+    :raises: objects.InvalidConfigException if the profile does not exist
+        or does not support filesystem, or the arguments are incomplete.
+    """
+    profile, args = _split_format_options(format_options)
+    if profile and profile not in FORMAT_PROFILES:
+        raise objects.InvalidConfigException(
+            'Unknown format profile %s, must be one of: %s' %
+            (profile, ', '.join(sorted(FORMAT_PROFILES))))
+    if (profile and filesystem is not None and
+            filesystem not in FORMAT_PROFILES[profile]):
+        raise objects.InvalidConfigException(
+            'Format profile %s is not available for %s' %
+            (profile, filesystem))
+    _merge_extended_options(args)
+
+
+def format_args(filesystem, format_options, geometry=None):
+    """Return the extra mkfs arguments for a partition.
+
+    :param filesystem: The filesystem type, e.g. "ext4".
+    :param format_options: The format_options of an object, see
+        objects._get_format_options.
+    :param geometry: The stripe geometry of the device, as returned by
+        stripe_geometry(), or None.
+    :returns: a list of arguments to pass to mkfs.
+    """
+    if not format_options:
+        return _merge_extended_options(stripe_args(filesystem, geometry))
+    profile, args = _split_format_options(format_options)
+    result = []
+    if profile:
+        try:
+            result = list(FORMAT_PROFILES[profile][filesystem])
+        except KeyError:
+            raise objects.InvalidConfigException(
+                'Format profile %s is not available for %s' %
+                (profile, filesystem))
+    result += list(args)
+    return _merge_extended_options(stripe_args(filesystem, geometry, result) +
+                                   result)
+
+
+def device_class(disks):
+    """Return the mount profile that suits the disks under a device.
+
+    :param disks: The attributes of each disk, as in
+        utils.block_devices_snapshot().
+    :returns: "hdd" if any disk is rotational, "nvme" if they all use NVMe,
+        "ssd" otherwise, or None if disks is empty.
+    """
+    classes = set()
+    for info in disks:
+        if info.get('rotational'):
+            classes.add('hdd')
+        elif info.get('transport') == 'nvme':
+            classes.add('nvme')
+        else:
+            classes.add('ssd')
+    for device_class in _DEVICE_CLASSES:
+        if device_class in classes:
+            return device_class
+    return None
+
+
+def _split_mount_options(mount_options):
+    """Return the profile name and mount options in mount_options"""
+    if isinstance(mount_options, list):
+        return None, mount_options
+    if isinstance(mount_options, dict):
+        return (mount_options.get('profile'),
+                mount_options.get('options', []))
+    return mount_options, []
+
+
+def check_mount_options(mount_options):
+    """Check that the profile in mount_options exists.
+
+    :param mount_options: The mount_options of an object, see
+        objects._get_mount_options.
+    :raises: objects.InvalidConfigException if it names an unknown profile.
+    """
+    profile, _ = _split_mount_options(mount_options)
+    if profile and profile != 'auto' and profile not in MOUNT_PROFILES:
+        raise objects.InvalidConfigException(
+            'Unknown mount profile %s, must be one of: auto, %s' %
+            (profile, ', '.join(sorted(MOUNT_PROFILES))))
+
+
+def mount_options(filesystem, mount_options, disks=()):
+    """Return the options to mount a filesystem with.
+
+    :param filesystem: The filesystem type, e.g. "xfs".
+    :param mount_options: The mount_options of an object, see
+        objects._get_mount_options.
+    :param disks: The attributes of the disks under the device, which the
+        "auto" profile is chosen from.
+    :returns: a comma-separated string of options, "defaults" if there are
+        none.
+    """
+    if not mount_options:
+        return 'defaults'
+    check_mount_options(mount_options)
+    profile, options = _split_mount_options(mount_options)
+    if profile == 'auto':
+        profile = device_class(disks)
+    result = []
+    if profile:
+        profile_options = MOUNT_PROFILES[profile]
+        result = list(profile_options.get(filesystem,
+                                          profile_options[None]))
+    result.extend(o for o in options if o not in result)
+    return ','.join(result) or 'defaults'
@@ -0,0 +1,74 @@
+# Copyright 2015 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Find disk config providers by name without importing them up front.
+
+Providers are DiskConfigBase subclasses registered under the
+os_disk_config.providers entry point group.  The built in ones are also
+known here, so they can be found without scanning the installed
+distributions, which is slow, or when running from a source tree.
+"""
+
+import importlib
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+NAMESPACE = 'os_disk_config.providers'
+DEFAULT = 'blivet'
+
+_BUILTIN = {
+    'blivet': 'os_disk_config.impl_blivet:BlivetDiskConfig',
+    'sfdisk': 'os_disk_config.impl_sfdisk:SfdiskDiskConfig',
+}
+
+
+class ProviderNotFound(Exception):
+    pass
+
+
+def builtin_names():
+    return sorted(_BUILTIN)
+
+
+def _import(target):
+    module, _, attr = target.partition(':')
+    return getattr(importlib.import_module(module), attr)
+
+
+def _entry_point(name):
+    try:
+        import pkg_resources
+    except ImportError:
+        return None
+    for entry_point in pkg_resources.iter_entry_points(NAMESPACE, name):
+        return entry_point
+    return None
+
+
+def load(name):
+    """Import and return the provider class called name.
+
+    :raises: ProviderNotFound if there is no such provider.
+    """
+    if name in _BUILTIN:
+        return _import(_BUILTIN[name])
+    entry_point = _entry_point(name)
+    if entry_point is None:
+        raise ProviderNotFound('Unknown provider: %s.  Built in providers '
+                               'are: %s' % (name,
+                                            ', '.join(builtin_names())))
+    logger.debug('Loading provider %s from %s', name, entry_point)
+    return entry_point.load()
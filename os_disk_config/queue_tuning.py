@@ -0,0 +1,163 @@
+# Copyright 2015 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Tuning the block queues of disks, and keeping it across reboots.
+
+The queue_tuning section of the config lists disks, by name or selector,
+with the scheduler, read_ahead_kb and nr_requests to give their queues.
+The settings are written to sysfs straight away, and to a udev rules file
+that applies them again whenever the disks appear.
+"""
+
+import collections
+import logging
+import os
+
+from os_disk_config import impl_base
+from os_disk_config import objects
+from os_disk_config import utils
+
+
+logger = logging.getLogger(__name__)
+
+_SYS_BLOCK = '/sys/block'
+RULES_FILE = '/etc/udev/rules.d/61-os-disk-config-queue.rules'
+
+
+def disk_settings(tunings):
+    """Return the settings of each disk.
+
+    A disk may be matched by several entries, in which case later entries
+    override earlier ones.
+
+    :param tunings: A list of objects.QueueTuning, with any selectors
+        resolved.
+    :returns: an OrderedDict of disk name: OrderedDict of attribute: value.
+    """
+    settings = collections.OrderedDict()
+    for tuning in tunings:
+        for disk in tuning.disks:
+            settings.setdefault(utils.disk_name(disk), {}).update(
+                tuning.settings())
+    for disk, values in settings.items():
+        settings[disk] = collections.OrderedDict(
+            (attr, values[attr]) for attr in objects.QUEUE_SETTINGS
+            if attr in values)
+    return settings
+
+
+def _queue_path(disk, attr):
+    return os.path.join(_SYS_BLOCK, disk, 'queue', attr)
+
+
+def _schedulers(disk):
+    """Return the schedulers available for disk, and the one in use"""
+    with open(_queue_path(disk, 'scheduler')) as f:
+        names = f.read().split()
+    current = [n.strip('[]') for n in names if n.startswith('[')]
+    available = [n.strip('[]') for n in names]
+    return available, current[0] if current else available[0]
+
+
+def current_settings(disk):
+    """Return the current value of every tunable attribute of disk"""
+    current = {'scheduler': _schedulers(disk)[1]}
+    for attr in objects.QUEUE_SETTINGS[1:]:
+        with open(_queue_path(disk, attr)) as f:
+            current[attr] = int(f.read().strip())
+    return current
+
+
+def udev_rules(settings, snapshot):
+    """Return the contents of a udev rules file that applies settings.
+
+    Disks are matched by their WWN where they have one, as kernel names
+    can change between boots.
+
+    :param settings: The settings of each disk, as from disk_settings().
+    :param snapshot: The attributes of the disks, as in
+        utils.block_devices_snapshot().
+    """
+    lines = ['# Generated by os-disk-config from the queue_tuning section '
+             'of its config.']
+    for disk, values in settings.items():
+        wwn = snapshot.get(disk, {}).get('wwn')
+        match = 'ATTRS{wwid}=="%s"' % wwn if wwn else 'KERNEL=="%s"' % disk
+        lines.append('ACTION=="add|change", SUBSYSTEM=="block", '
+                     'ENV{DEVTYPE}=="disk", %s, %s' %
+                     (match, ', '.join('ATTR{queue/%s}="%s"' % item
+                                       for item in values.items())))
+    return '\n'.join(lines) + '\n'
+
+
+def apply(settings, noop=False, rules_file=RULES_FILE):
+    """Write settings to sysfs and persist them in a udev rules file.
+
+    Nothing is changed unless every disk exists and offers the requested
+    scheduler.  Only values that differ are written, and the rules file
+    is only replaced if its contents change.
+
+    :param settings: The settings of each disk, as from disk_settings().
+    :param noop: If True, only report what would be changed.
+    :param rules_file: The udev rules file to write.
+    :returns: a dict with the settings that differ under "disks", as disk
+        name: attribute: {"current": value, "planned": value}, and the new
+        contents of the rules file under "files" if it changed.
+    :raises: impl_base.DiskApplyException if any disk could not be tuned.
+    """
+    failures = {}
+    changes = collections.OrderedDict()
+    for disk, values in settings.items():
+        try:
+            current = current_settings(disk)
+            available = _schedulers(disk)[0]
+        except (IOError, OSError, ValueError) as e:
+            failures[disk] = e
+            continue
+        scheduler = values.get('scheduler')
+        if scheduler is not None and scheduler not in available:
+            failures[disk] = ValueError('%s is not available, only: %s' %
+                                        (scheduler, ', '.join(available)))
+            continue
+        changes[disk] = collections.OrderedDict(
+            (attr, {'current': current[attr], 'planned': value})
+            for attr, value in values.items() if current[attr] != value)
+    if failures:
+        raise impl_base.DiskApplyException(failures)
+
+    for disk, disk_changes in changes.items():
+        for attr, change in disk_changes.items():
+            logger.info('Setting %s of %s to %s (was %s)', attr, disk,
+                        change['planned'], change['current'])
+            if noop:
+                continue
+            try:
+                with open(_queue_path(disk, attr), 'w') as f:
+                    f.write('%s\n' % change['planned'])
+            except (IOError, OSError) as e:
+                failures.setdefault(disk, e)
+
+    files = {}
+    rules = udev_rules(settings, utils.block_devices_snapshot(list(settings)))
+    if utils.diff(rules_file, rules):
+        files[rules_file] = rules
+        if not noop:
+            rules_dir = os.path.dirname(rules_file)
+            if not os.path.isdir(rules_dir):
+                os.makedirs(rules_dir)
+            utils.write_config(rules_file, rules)
+    if failures:
+        raise impl_base.DiskApplyException(failures)
+    return {'disks': collections.OrderedDict(
+        (disk, c) for disk, c in changes.items() if c), 'files': files}
@@ -0,0 +1,128 @@
+# Copyright 2015 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+import json
+import os
+
+import fixtures
+import mock
+from oslotest import base
+
+from os_disk_config import batch
+from os_disk_config import objects
+
+GIB = 1024 ** 3
+
+
+class TestBatch(base.BaseTestCase):
+    def setUp(self):
+        super(TestBatch, self).setUp()
+        self.tmpdir = self.useFixture(fixtures.TempDir()).path
+        self.objs = objects.objects_from_json([
+            {'type': 'standard', 'name': 'data',
+             'disks': [{'rotational': False, 'unused': True}],
+             'size': '512 MiB', 'filesystem': 'xfs', 'mountpoint': '/data'}])
+
+    def _inventory(self, name, disks):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'w') as f:
+            json.dump(disks, f)
+        return path
+
+    def test_load_inventory_defaults(self):
+        path = self._inventory('a.json', {
+            'sda': {'size': '10 GiB', 'mounted': True},
+            'nvme0n1': {'size': GIB, 'logical_block_size': 4096,
+                        'transport': 'nvme'}})
+        snapshot, mounted = batch.load_inventory(path)
+        self.assertEqual(set(['sda']), mounted)
+        self.assertEqual(10 * GIB, snapshot['sda']['size'])
+        self.assertEqual('sda', snapshot['sda']['name'])
+        self.assertEqual(512, snapshot['sda']['physical_block_size'])
+        self.assertEqual(4096, snapshot['nvme0n1']['physical_block_size'])
+        self.assertNotIn('mounted', snapshot['sda'])
+
+    def test_load_inventory_invalid(self):
+        for disks in ([], {'sda': {}}, {'sda': {'size': None}},
+                      {'sda': {'size': True}}):
+            path = self._inventory('bad.json', disks)
+            self.assertRaises(ValueError, batch.load_inventory, path)
+
+    def test_load_inventory_attribute_types(self):
+        for attrs in ({'logical_block_size': '4096'},
+                      {'optimal_io_size': True},
+                      {'alignment_offset': -1},
+                      {'logical_block_size': 0},
+                      {'physical_block_size': 0},
+                      {'partitions': 1.5},
+                      {'rotational': 1},
+                      {'mounted': 'yes'},
+                      {'transport': 3},
+                      {'holders': 'dm-0'}):
+            attrs['size'] = '1 GiB'
+            path = self._inventory('bad.json', {'sda': attrs})
+            self.assertRaises(ValueError, batch.load_inventory, path)
+
+    def test_inventory_files(self):
+        for name in ('b.json', 'a.json', '.c.json', 'README'):
+            self._inventory(name, {})
+        self.assertEqual([os.path.join(self.tmpdir, f)
+                          for f in ('a.json', 'b.json')],
+                         batch.inventory_files(self.tmpdir))
+
+    def test_plan_inventory(self):
+        path = self._inventory('host.json', {
+            'sda': {'size': '100 GiB', 'rotational': True},
+            'sdb': {'size': '200 GiB', 'mounted': True},
+            'sdc': {'size': '300 GiB'}})
+        result = batch.plan_inventory(self.objs, path)
+        self.assertEqual('host.json', result['inventory'])
+        self.assertEqual(['sdc'], list(result['layout']['disks']))
+        # The objects are left with their selectors for the next inventory
+        self.assertIsInstance(self.objs[0].disks[0], dict)
+
+    def test_plan_inventory_errors(self):
+        path = self._inventory('host.json', {'sda': {'size': '100 GiB',
+                                                     'rotational': True}})
+        result = batch.plan_inventory(self.objs, path)
+        self.assertNotIn('layout', result)
+        self.assertIn('matched 0 disks', result['error'])
+        result = batch.plan_inventory(
+            self.objs, os.path.join(self.tmpdir, 'missing.json'))
+        self.assertIn('error', result)
+        path = self._inventory('host.json', {
+            'sda': {'size': '100 GiB', 'logical_block_size': '4096'}})
+        result = batch.plan_inventory(self.objs, path)
+        self.assertIn('logical_block_size of disk sda', result['error'])
+
+    @mock.patch('os_disk_config.planner.plan',
+                side_effect=TypeError('boom'))
+    def test_plan_inventory_unexpected_error(self, mock_plan):
+        path = self._inventory('host.json', {'sda': {'size': '100 GiB'}})
+        result = batch.plan_inventory(self.objs, path)
+        self.assertEqual('Unexpected error: boom', result['error'])
+
+    def test_plan_batch_processes(self):
+        paths = [self._inventory('host%d.json' % i,
+                                 {'sda': {'size': '%d GiB' % (i + 1)}})
+                 for i in range(5)]
+        paths.append(self._inventory('hdd.json', {
+            'sda': {'size': '1 GiB', 'rotational': True}}))
+        results = list(batch.plan_batch(self.objs, paths, jobs=3))
+        # Results keep the order of the inventories
+        self.assertEqual([os.path.basename(p) for p in paths],
+                         [r['inventory'] for r in results])
+        self.assertEqual([(i + 1) * GIB for i in range(5)],
+                         [r['layout']['disks']['sda']['size']
+                          for r in results[:5]])
+        self.assertIn('error', results[5])
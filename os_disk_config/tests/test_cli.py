@@ -14,9 +14,13 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import json
 import os.path
+import subprocess
 import sys
 
+import fixtures
+import mock
 from oslotest import base
 import six
 
@@ -46,3 +50,175 @@ class TestCli(base.BaseTestCase):
         sys.stderr.close()
         sys.stderr = orig_stderr
         return (stdout, stderr)
+
+    @mock.patch('os_disk_config.utils.block_devices_snapshot')
+    def test_noop_plan(self, mock_snapshot):
+        mock_snapshot.return_value = {
+            'vdb': {'size': 10 * 1024 ** 3, 'logical_block_size': 512,
+                    'physical_block_size': 512, 'alignment_offset': 0}}
+        tmpdir = self.useFixture(fixtures.TempDir()).path
+        config = os.path.join(tmpdir, 'config.yaml')
+        with open(config, 'w') as f:
+            f.write('partitions:\n'
+                    '  - {type: standard, name: test1, disks: [vdb],\n'
+                    '     size: 5 GiB}\n'
+                    'version: 0.0.1\n')
+        stdout, _ = self.run_cli('os-disk-config --noop --no-cache -c %s' %
+                                 config)
+        layout = json.loads(stdout)
+        part = layout['disks']['vdb']['partitions'][0]
+        self.assertEqual('/dev/vdb1', part['device'])
+        self.assertEqual(2048, part['start'])
+
+    def test_malformed_config(self):
+        config = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                              'config.yaml')
+        with open(config, 'w') as f:
+            f.write('partitions: [\n')
+        _, stderr = self.run_cli('os-disk-config --no-cache --metrics-file= '
+                                 '-c %s' % config, exitcodes=(1,))
+        self.assertNotIn('Traceback', stderr)
+
+    @mock.patch('os_disk_config.loader.load_config')
+    def test_invalid_objects(self, mock_load):
+        config = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                              'config.yaml')
+        open(config, 'w').close()
+        for config_data in (
+                {'partitions': [{'type': 'floppy', 'name': 'a'}]},
+                {'partitions': [], 'queue_tuning': [{'scheduler': 1}]}):
+            mock_load.return_value = config_data
+            self.run_cli('os-disk-config --metrics-file= -c %s' % config,
+                         exitcodes=(1,))
+
+    @mock.patch('os_disk_config.utils.mounts', return_value=[])
+    @mock.patch('os_disk_config.utils.block_devices_snapshot',
+                return_value={})
+    @mock.patch('os_disk_config.loader.load_config')
+    def test_selector_matches_nothing(self, mock_load, mock_snapshot,
+                                      mock_mounts):
+        mock_load.return_value = {'partitions': [
+            {'type': 'standard', 'name': 'test1', 'size': '5 GiB',
+             'disks': [{'transport': 'nvme'}]}]}
+        config = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                              'config.yaml')
+        open(config, 'w').close()
+        self.run_cli('os-disk-config --metrics-file= -c %s' % config,
+                     exitcodes=(1,))
+
+    @mock.patch('os_disk_config.wipe.wipe_disks')
+    @mock.patch('os_disk_config.mdraid.restore_sync_speeds')
+    @mock.patch('os_disk_config.providers.load')
+    @mock.patch('os_disk_config.converge.has_state', return_value=True)
+    @mock.patch('os_disk_config.converge.is_converged', return_value=False)
+    @mock.patch('os_disk_config.loader.load_config')
+    def test_converge_never_wipes(self, mock_load, mock_converged,
+                                  mock_state, mock_provider, mock_restore,
+                                  mock_wipe):
+        mock_load.return_value = {'partitions': [
+            {'type': 'standard', 'name': 'test1', 'disks': ['vdb'],
+             'size': '5 GiB', 'wipe': True}]}
+        provider = mock_provider.return_value.from_cli.return_value
+        provider.disks.return_value = ['/dev/vdb']
+        provider.layout_matches.return_value = False
+        config = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                              'config.yaml')
+        open(config, 'w').close()
+        self.run_cli('os-disk-config --converge --metrics-file= -c %s' %
+                     config, exitcodes=(1,))
+        self.assertFalse(mock_wipe.called)
+        self.assertFalse(provider.add_object.called)
+
+    @mock.patch('os_disk_config.wipe.wipe_disks')
+    @mock.patch('os_disk_config.mdraid.restore_sync_speeds')
+    @mock.patch('os_disk_config.loader.load_config')
+    def test_unsupported_objects_not_wiped(self, mock_load, mock_restore,
+                                           mock_wipe):
+        mock_load.return_value = {'partitions': [
+            {'type': 'raid', 'name': 'md0', 'level': 1,
+             'disks': ['vdb', 'vdc'], 'wipe': True}]}
+        config = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                              'config.yaml')
+        open(config, 'w').close()
+        self.run_cli('os-disk-config -p sfdisk --metrics-file= -c %s' %
+                     config, exitcodes=(1,))
+        self.assertFalse(mock_wipe.called)
+
+    @mock.patch('os_disk_config.loader.load_config')
+    def test_noop_unsupported_objects(self, mock_load):
+        mock_load.return_value = {'partitions': [
+            {'type': 'raid', 'name': 'md0', 'level': 1,
+             'disks': ['vdb', 'vdc']}]}
+        config = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                              'config.yaml')
+        open(config, 'w').close()
+        stdout, _ = self.run_cli('os-disk-config -p sfdisk --noop '
+                                 '--metrics-file= -c %s' % config,
+                                 exitcodes=(1,))
+        self.assertEqual('', stdout)
+
+    @mock.patch('os_disk_config.wipe.wipe_disks')
+    @mock.patch('os_disk_config.mdraid.restore_sync_speeds')
+    @mock.patch('os_disk_config.providers.load')
+    @mock.patch('os_disk_config.loader.load_config')
+    def test_provider_noop(self, mock_load, mock_provider, mock_restore,
+                           mock_wipe):
+        mock_load.return_value = {'partitions': [
+            {'type': 'standard', 'name': 'test1', 'disks': ['vdb'],
+             'size': '5 GiB', 'wipe': True}]}
+        provider = mock_provider.return_value.from_cli.return_value
+        provider.disks.return_value = ['/dev/vdb']
+        provider.apply.return_value = {'/etc/fstab': '+/dev/vdb1'}
+        config = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                              'config.yaml')
+        open(config, 'w').close()
+        stdout, _ = self.run_cli('os-disk-config --provider-noop '
+                                 '--metrics-file= -c %s' % config)
+        self.assertEqual({'files': {'/etc/fstab': '+/dev/vdb1'}},
+                         json.loads(stdout))
+        provider.apply.assert_called_once_with(noop=True)
+        mock_wipe.assert_called_once_with(mock.ANY, jobs=mock.ANY,
+                                          noop=True)
+        self.assertFalse(mock_restore.called)
+
+
+# Runs the CLI in a fresh interpreter and reports its exit status and
+# which slow modules it imported
+_STARTUP_SCRIPT = '''
+import sys
+from os_disk_config import cli
+try:
+    status = cli.main(sys.argv)
+except SystemExit as e:
+    status = e.code
+print(status)
+print(sorted(m for m in sys.modules
+             if m == 'blivet' or m.startswith('blivet.') or
+             m == 'os_disk_config.impl_blivet'))
+'''
+
+
+class TestStartup(base.BaseTestCase):
+    def _imported(self, status, *args):
+        output = subprocess.check_output(
+            [sys.executable, '-c', _STARTUP_SCRIPT, '--metrics-file='] +
+            list(args),
+            stderr=subprocess.STDOUT, universal_newlines=True)
+        lines = output.strip().splitlines()
+        self.assertNotIn('Traceback', output)
+        self.assertEqual(str(status), lines[-2])
+        return lines[-1]
+
+    def test_version(self):
+        self.assertEqual('[]', self._imported(0, '--version'))
+
+    def test_invalid_config(self):
+        tmpdir = self.useFixture(fixtures.TempDir()).path
+        config = os.path.join(tmpdir, 'config.yaml')
+        with open(config, 'w') as f:
+            f.write('partitions:\n  - {type: floppy, name: a}\n'
+                    'version: 0.0.1\n')
+        self.assertEqual('[]', self._imported(1, '--no-cache', '-c', config))
+
+    def test_missing_config(self):
+        self.assertEqual('[]', self._imported(1, '-c', '/nonexistent'))
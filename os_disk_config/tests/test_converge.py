@@ -0,0 +1,270 @@
+# Copyright 2015 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+
+import fixtures
+import mock
+from oslotest import base
+
+from os_disk_config import converge
+from os_disk_config import objects
+from os_disk_config import topology
+
+
+def _write(path, data):
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as f:
+        f.write(data)
+
+
+class TestConverge(base.BaseTestCase):
+    def setUp(self):
+        super(TestConverge, self).setUp()
+        tmpdir = self.useFixture(fixtures.TempDir()).path
+        self.sys_block = os.path.join(tmpdir, 'sys', 'block')
+        self.state_file = os.path.join(tmpdir, 'state', 'converge.json')
+        self.fstab = os.path.join(tmpdir, 'fstab')
+        _write(os.path.join(self.sys_block, 'sdb', 'size'), '2097152\n')
+        self._add_partition('sdb1', 2048, 1048576)
+        self.useFixture(fixtures.MonkeyPatch(
+            'os_disk_config.utils._SYS_BLOCK', self.sys_block))
+        self.useFixture(fixtures.MonkeyPatch(
+            'os_disk_config.fstab.FSTAB', self.fstab))
+        self.mounts = [('/dev/sdb1', '/mnt/test', 'ext4')]
+        self.useFixture(fixtures.MonkeyPatch(
+            'os_disk_config.utils.mounts', lambda: self.mounts))
+        self.objs = [objects.StandardPartition('test', ['sdb'], '512 MiB',
+                                               'ext4', '/mnt/test')]
+
+    def _add_partition(self, name, start, size):
+        part_dir = os.path.join(self.sys_block, 'sdb', name)
+        _write(os.path.join(part_dir, 'partition'), '1\n')
+        _write(os.path.join(part_dir, 'start'), '%d\n' % start)
+        _write(os.path.join(part_dir, 'size'), '%d\n' % size)
+
+    def test_not_recorded(self):
+        self.assertFalse(converge.is_converged(self.objs, self.state_file))
+
+    def test_recorded(self):
+        converge.record(self.objs, self.state_file)
+        self.assertTrue(converge.is_converged(self.objs, self.state_file))
+
+    def test_config_changed(self):
+        converge.record(self.objs, self.state_file)
+        self.objs[0].size = '256 MiB'
+        self.assertFalse(converge.is_converged(self.objs, self.state_file))
+
+    def test_devices_changed(self):
+        converge.record(self.objs, self.state_file)
+        self._add_partition('sdb2', 1050624, 2048)
+        self.assertFalse(converge.is_converged(self.objs, self.state_file))
+
+    def test_mounts_changed(self):
+        converge.record(self.objs, self.state_file)
+        self.mounts = []
+        self.assertFalse(converge.is_converged(self.objs, self.state_file))
+
+    def test_raid_changed(self):
+        self.objs = [objects.RaidArray('md0', ['sdb'], None, 'xfs', None,
+                                       'raid1')]
+        converge.record(self.objs, self.state_file)
+        for field, value in (('level', 'raid0'), ('chunk', '512 KiB'),
+                             ('bitmap', 'none'), ('partitions', ['test'])):
+            changed = objects.RaidArray('md0', ['sdb'], None, 'xfs', None,
+                                        'raid1')
+            setattr(changed, field, value)
+            self.assertFalse(converge.is_converged([changed],
+                                                   self.state_file))
+
+    def test_lvm_changed(self):
+        def _objs(**kwargs):
+            lv = objects.LogicalVolume('data', 'vg0', '1 GiB', 'xfs')
+            for field, value in kwargs.items():
+                setattr(lv, field, value)
+            return [objects.VolumeGroup('vg0', ['sdb'], None), lv]
+        converge.record(_objs(), self.state_file)
+        self.assertTrue(converge.is_converged(_objs(), self.state_file))
+        for changes in ({'volume_group': 'vg1'}, {'stripes': 2},
+                        {'stripes': 2, 'stripe_size': '64 KiB'},
+                        {'thin_pool': True}, {'pool': 'pool'}):
+            self.assertFalse(converge.is_converged(_objs(**changes),
+                                                   self.state_file))
+        objs = _objs()
+        objs[0].pe_size = '32 MiB'
+        self.assertFalse(converge.is_converged(objs, self.state_file))
+
+    def test_record_unchanged(self):
+        converge.record(self.objs, self.state_file)
+        with mock.patch('os_disk_config.utils.write_config') as mock_write:
+            converge.record(self.objs, self.state_file)
+        self.assertFalse(mock_write.called)
+
+
+class TestLayoutMatches(base.BaseTestCase):
+    def setUp(self):
+        super(TestLayoutMatches, self).setUp()
+        self.record = {'name': 'sdb1', 'path': '/dev/sdb1',
+                       'parents': ['sdb'], 'partition': True,
+                       'size': 512 * 1024 ** 2 - 4096, 'part_uuid': None,
+                       'fs_type': 'ext4', 'uuid': None, 'mountpoint': None}
+        self.mounts = [('/dev/sdb1', '/mnt/test', 'ext4')]
+        self.obj = objects.StandardPartition('test', ['sdb'], '512 MiB',
+                                             'ext4', '/mnt/test')
+        self.objs = [self.obj]
+
+    def _matches(self, *records):
+        index = topology.DeviceIndex.from_records([self.record] +
+                                                  list(records))
+        return converge.layout_matches(self.objs, index, self.mounts)
+
+    def _record(self, name, parents, fs_type, size=0, partition=False,
+                level=None):
+        return {'name': name, 'path': '/dev/%s' % name, 'parents': parents,
+                'partition': partition, 'size': size, 'part_uuid': None,
+                'fs_type': fs_type, 'uuid': None, 'mountpoint': None,
+                'level': level}
+
+    def test_matches(self):
+        self.assertTrue(self._matches())
+
+    def test_wrong_size(self):
+        self.record['size'] = 256 * 1024 ** 2
+        self.assertFalse(self._matches())
+
+    def test_no_size(self):
+        self.obj.size = None
+        self.record['size'] = 10 * 1024 ** 3
+        self.assertTrue(self._matches())
+
+    def test_wrong_filesystem(self):
+        self.record['fs_type'] = 'xfs'
+        self.assertFalse(self._matches())
+
+    def test_wrong_disk(self):
+        self.record['parents'] = ['sdc']
+        self.assertFalse(self._matches())
+
+    def test_no_mountpoint(self):
+        self.obj.mountpoint = None
+        self.mounts = []
+        self.assertTrue(self._matches())
+        self.record['fs_type'] = None
+        self.assertFalse(self._matches())
+
+    def test_unmounted(self):
+        self.mounts = []
+        self.assertFalse(self._matches())
+
+    def test_partition_matched_once(self):
+        self.obj.mountpoint = None
+        self.objs = [self.obj, objects.StandardPartition(
+            'other', ['sdb'], '512 MiB', 'ext4', None)]
+        self.assertFalse(self._matches())
+        other = self._record('sdb2', ['sdb'], 'ext4', self.record['size'],
+                             partition=True)
+        self.assertTrue(self._matches(other))
+
+    def test_raid(self):
+        self.obj.mountpoint = None
+        self.obj.filesystem = None
+        self.objs = [
+            self.obj,
+            objects.RaidArray('md0', [], None, 'xfs', '/srv', 'raid1',
+                              partitions=['test', 'other']),
+            objects.StandardPartition('other', ['sdc'], None, None, None)]
+        self.record['fs_type'] = 'mdmember'
+        other = self._record('sdc1', ['sdc'], 'mdmember', partition=True)
+        array = self._record('md0', ['sdb1', 'sdc1'], 'xfs')
+        self.mounts = [('/dev/md/md0', '/srv', 'xfs')]
+        self.assertFalse(self._matches(other))
+        self.mounts = [('/dev/md0', '/srv', 'xfs')]
+        self.assertTrue(self._matches(other, array))
+        array['fs_type'] = 'ext4'
+        self.assertFalse(self._matches(other, array))
+
+    def test_raid_structure(self):
+        self.objs = [objects.RaidArray('md0', ['sdb', 'sdc'], None, 'xfs',
+                                       None, 'raid1')]
+        array = self._record('md0', ['sdb1', 'sdc1'], 'xfs', level='raid1')
+        self.assertTrue(self._matches(array))
+        array['level'] = 'raid0'
+        self.assertFalse(self._matches(array))
+        array['level'] = 'raid1'
+        array['parents'] = ['sdb1', 'sdc1', 'sdd1']
+        self.assertFalse(self._matches(array))
+
+    @mock.patch('os.path.realpath')
+    def test_raid_mounted_by_kernel_name(self, mock_realpath):
+        links = {'/dev/md/md0': '/dev/md127'}
+        mock_realpath.side_effect = lambda path: links.get(path, path)
+        self.obj.mountpoint = None
+        self.obj.filesystem = None
+        self.objs = [
+            self.obj,
+            objects.RaidArray('md0', [], None, 'xfs', '/srv', 'raid1',
+                              partitions=['test'])]
+        self.record['fs_type'] = 'mdmember'
+        array = self._record('md0', ['sdb1'], 'xfs')
+        array['path'] = '/dev/md/md0'
+        self.mounts = [('/dev/md127', '/srv', 'xfs')]
+        self.assertTrue(self._matches(array))
+
+    def test_lvm(self):
+        self.objs = [
+            objects.VolumeGroup('vg-0', ['sdb'], None),
+            objects.LogicalVolume('data', 'vg-0', '1 GiB', 'xfs')]
+        self.record['fs_type'] = 'lvmpv'
+        vg = self._record('vg-0', ['sdb1'], None)
+        self.assertFalse(self._matches(vg))
+        lv = self._record('vg-0-data', ['vg-0'], 'xfs', 1024 ** 3)
+        self.assertTrue(self._matches(vg, lv))
+        lv['size'] = 2 * 1024 ** 3
+        self.assertFalse(self._matches(vg, lv))
+
+    def test_lvm_structure(self):
+        vg_obj = objects.VolumeGroup('vg0', ['sdb'], None, pe_size='4 MiB')
+        lv_obj = objects.LogicalVolume('data', 'vg0', '1 GiB', 'xfs')
+        self.objs = [vg_obj, lv_obj]
+        self.record['fs_type'] = 'lvmpv'
+        vg = self._record('vg0', ['sdb1'], None)
+        vg['pe_size'] = 4 * 1024 ** 2
+        lv = self._record('vg0-data', ['vg0'], 'xfs', 1024 ** 3)
+        lv['type'] = 'lvmlv'
+        lv['stripes'] = 1
+        self.assertTrue(self._matches(vg, lv))
+        vg['pe_size'] = 32 * 1024 ** 2
+        self.assertFalse(self._matches(vg, lv))
+        vg['pe_size'] = 4 * 1024 ** 2
+        # Striped, but a linear volume is wanted
+        lv['stripes'] = 2
+        self.assertFalse(self._matches(vg, lv))
+        lv_obj.stripes = 2
+        lv_obj.stripe_size = '64 KiB'
+        lv['stripe_size'] = 128 * 1024
+        self.assertFalse(self._matches(vg, lv))
+        lv['stripe_size'] = 64 * 1024
+        self.assertTrue(self._matches(vg, lv))
+        lv['type'] = 'lvmthinpool'
+        self.assertFalse(self._matches(vg, lv))
+
+    def test_lv_moved(self):
+        self.objs = [objects.LogicalVolume('data', 'vg0', '1 GiB', 'xfs',
+                                           '/mnt/test')]
+        lv = self._record('vg1-data', ['vg1'], 'xfs', 1024 ** 3)
+        self.mounts = [('/dev/vg1-data', '/mnt/test', 'xfs')]
+        self.assertFalse(self._matches(lv))
+        lv['parents'] = ['vg0']
+        self.assertTrue(self._matches(lv))
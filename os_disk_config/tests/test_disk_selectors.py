@@ -0,0 +1,134 @@
+# Copyright 2015 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import mock
+from oslotest import base
+
+from os_disk_config import disk_selectors
+from os_disk_config import objects
+
+TIB = 1024 ** 4
+
+
+def _disk(name, size, rotational=False, transport='sata', model=None,
+          wwn=None, partitions=0, holders=()):
+    return {'name': name, 'size': size, 'rotational': rotational,
+            'removable': False, 'transport': transport, 'model': model,
+            'wwn': wwn, 'partitions': partitions, 'holders': list(holders)}
+
+
+SNAPSHOT = dict((d['name'], d) for d in [
+    _disk('sda', 8 * TIB, rotational=True, model='ST8000NM',
+          wwn='naa.5000c5001'),
+    _disk('sdb', 2 * TIB, rotational=True, model='ST2000NM',
+          wwn='naa.5000c5002', partitions=2),
+    _disk('sdc', 8 * TIB, rotational=True, model='ST8000NM',
+          wwn='naa.5000c5003'),
+    _disk('sdd', TIB, model='SSD 860', wwn='naa.5002538e1'),
+    _disk('sde', TIB // 2, model='SSD 860', wwn='naa.5002538e2'),
+    _disk('nvme0n1', 2 * TIB, transport='nvme', holders=['md0']),
+])
+
+
+class TestSelect(base.BaseTestCase):
+    def _select(self, mounted=frozenset(), **selector):
+        return disk_selectors.select(selector, SNAPSHOT, mounted)
+
+    def test_rotational_larger_than(self):
+        self.assertEqual(['sda', 'sdc'],
+                         self._select(rotational=True, min_size='4 TiB'))
+
+    def test_transport(self):
+        self.assertEqual(['nvme0n1'], self._select(transport='nvme'))
+
+    def test_wwn_prefix(self):
+        self.assertEqual(['sda', 'sdb', 'sdc'],
+                         self._select(wwn='naa.5000c5*'))
+
+    def test_model_glob(self):
+        self.assertEqual(['sdd', 'sde'], self._select(model='SSD*'))
+
+    def test_smallest_unused_ssds(self):
+        self.assertEqual(['sde', 'sdd'],
+                         self._select(rotational=False, unused=True,
+                                      order='smallest', count=2))
+
+    def test_largest_ties_by_name(self):
+        self.assertEqual(['sda', 'sdc'],
+                         self._select(rotational=True, order='largest',
+                                      count=2))
+
+    def test_mounted_disk_is_used(self):
+        self.assertEqual(['sde'],
+                         self._select(mounted=set(['sdd']), model='SSD*',
+                                      unused=True))
+
+    def test_max_size(self):
+        self.assertEqual(['sdd', 'sde'], self._select(max_size='1 TiB'))
+
+    def test_no_match(self):
+        self.assertRaises(objects.InvalidConfigException,
+                          self._select, transport='usb')
+
+    def test_too_few_matches(self):
+        self.assertRaises(objects.InvalidConfigException,
+                          self._select, transport='nvme', count=2)
+
+
+class TestResolveObjects(base.BaseTestCase):
+    def _obj(self, name, disks):
+        return objects.StandardPartition.from_json(
+            {'name': name, 'disks': disks, 'size': '1 GiB'})
+
+    @mock.patch('os_disk_config.utils.mounts')
+    @mock.patch('os_disk_config.utils.block_devices_snapshot')
+    def test_resolve(self, mock_snapshot, mock_mounts):
+        mock_snapshot.return_value = SNAPSHOT
+        mock_mounts.return_value = [('/dev/sdd1', '/', 'xfs')]
+        objs = [self._obj('a', [{'model': 'SSD*'}]),
+                self._obj('b', ['sda', {'rotational': True, 'unused': True}]),
+                self._obj('c', ['sdb'])]
+        disk_selectors.resolve_objects(objs)
+        self.assertEqual(['sdd', 'sde'], objs[0].disks)
+        self.assertEqual(['sda', 'sdc'], objs[1].disks)
+        self.assertEqual(['sdb'], objs[2].disks)
+        self.assertEqual(1, mock_snapshot.call_count)
+        self.assertEqual(['sdd', 'sde', 'sda', 'sdc', 'sdb'],
+                         objects.referenced_disks(objs))
+
+    def test_unused_disks_not_shared(self):
+        objs = [self._obj('a', [{'model': 'SSD*', 'unused': True,
+                                 'count': 1}]),
+                self._obj('b', [{'model': 'SSD*', 'unused': True,
+                                 'count': 1}]),
+                self._obj('c', [{'model': 'SSD*', 'unused': True}])]
+        self.assertRaises(objects.InvalidConfigException,
+                          disk_selectors.resolve_objects, objs, SNAPSHOT,
+                          set())
+        self.assertEqual(['sdd'], objs[0].disks)
+        self.assertEqual(['sde'], objs[1].disks)
+
+    def test_queue_tuning_does_not_take_disks(self):
+        tuning = objects.QueueTuning.from_json(
+            {'disks': [{'model': 'SSD*'}], 'scheduler': 'none'}, 'tuning')
+        objs = [tuning, self._obj('a', [{'model': 'SSD*', 'unused': True}])]
+        disk_selectors.resolve_objects(objs, SNAPSHOT, set())
+        self.assertEqual(['sdd', 'sde'], objs[1].disks)
+
+    @mock.patch('os_disk_config.utils.block_devices_snapshot')
+    def test_no_selectors(self, mock_snapshot):
+        objs = [self._obj('a', ['sda'])]
+        disk_selectors.resolve_objects(objs)
+        self.assertEqual(['sda'], objs[0].disks)
+        self.assertFalse(mock_snapshot.called)
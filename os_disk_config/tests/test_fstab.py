@@ -0,0 +1,75 @@
+# Copyright 2015 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+
+import fixtures
+from oslotest import base
+
+from os_disk_config import fstab
+
+
+FSTAB = '''UUID=c3dbe26e-e200-496e-af8e-d3071afe1a29 /  ext4  defaults  1 1
+LABEL=data /mnt/data xfs defaults 0 2
+#/dev/sdc1 /mnt/old ext4 defaults 0 2
+'''
+
+
+class TestFstab(base.BaseTestCase):
+    def setUp(self):
+        super(TestFstab, self).setUp()
+        self.filename = os.path.join(
+            self.useFixture(fixtures.TempDir()).path, 'fstab')
+        with open(self.filename, 'w') as f:
+            f.write(FSTAB)
+        self.fstab = fstab.Fstab(self.filename)
+
+    def test_conflicts(self):
+        # Mountpoint already in the file
+        self.assertFalse(self.fstab.add('/dev/sdb1', '/', 'ext4', 'defaults'))
+        # Source already in the file, with different case
+        self.assertFalse(self.fstab.add(
+            'uuid=C3DBE26E-E200-496E-AF8E-D3071AFE1A29', '/mnt/a', 'ext4',
+            'defaults'))
+        self.assertFalse(self.fstab.add('LABEL=data', '/mnt/b', 'xfs',
+                                        'defaults'))
+        # Commented out entries do not conflict
+        self.assertTrue(self.fstab.add('/dev/sdc1', '/mnt/old', 'ext4',
+                                       'defaults'))
+        # Nor may two staged entries
+        self.assertFalse(self.fstab.add('/dev/sdd1', '/mnt/old', 'ext4',
+                                        'defaults'))
+        self.assertEqual(['/dev/sdc1 /mnt/old ext4 defaults 0 1'],
+                         self.fstab.staged)
+
+    def test_commit(self):
+        self.assertFalse(self.fstab.commit())
+        self.fstab.add('UUID=1234', '/mnt/a', 'xfs', 'noatime', 0, 2)
+        self.fstab.add('UUID=5678', '/mnt/b', 'ext4', 'defaults', 1)
+        diff = self.fstab.diff()
+        self.assertTrue(self.fstab.commit())
+        expected = FSTAB + (
+            '\n%s\nUUID=1234 /mnt/a xfs noatime 0 2\n'
+            '\n%s\nUUID=5678 /mnt/b ext4 defaults 1 1\n' %
+            (fstab.ENTRY_COMMENT, fstab.ENTRY_COMMENT))
+        self.assertEqual(expected, open(self.filename).read())
+        self.assertIn('+UUID=1234 /mnt/a xfs noatime 0 2', diff)
+        self.assertEqual([], self.fstab.staged)
+        self.assertEqual(['fstab'], os.listdir(os.path.dirname(self.filename)))
+
+    def test_missing_file(self):
+        os.unlink(self.filename)
+        self.fstab.add('UUID=1234', '/mnt/a', 'xfs', 'defaults')
+        self.assertEqual('\n%s\nUUID=1234 /mnt/a xfs defaults 0 1\n' %
+                         fstab.ENTRY_COMMENT, self.fstab.render())
@@ -12,14 +12,20 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import os
+
+import fixtures
 import mock
 from oslotest import base
 
+from os_disk_config import fstab
 from os_disk_config import impl_blivet
+from os_disk_config import impl_sfdisk
+from os_disk_config import objects
 
-BLKID_OUT = '''50607425-3e50-48e2-846d-ed253d54c5c9
-ext4
-db17ca07-01'''
+BLKID_OUT = '''DEVNAME=/dev/vdb1
+UUID=50607425-3e50-48e2-846d-ed253d54c5c9
+'''
 
 FSTAB = ['UUID=c3dbe26e-e200-496e-af8e-d3071afe1a29 /  ext4  defaults  1 1']
 FSTAB_EXISTING = [
@@ -37,6 +43,12 @@ FSTAB_COMMENTED = [
 
 
 class TestBase(base.BaseTestCase):
+    def setUp(self):
+        super(TestBase, self).setUp()
+        self.useFixture(fixtures.MonkeyPatch(
+            'os_disk_config.utils._DEV_DISK_BY_UUID',
+            self.useFixture(fixtures.TempDir()).path))
+
     @mock.patch('blivet.Blivet')
     @mock.patch('subprocess.check_output')
     def test_get_uuid(self, mock_check_output, _):
@@ -44,6 +56,12 @@ class TestBase(base.BaseTestCase):
         mock_check_output.return_value = BLKID_OUT
         self.assertEqual(dc.get_uuid('/dev/vdb1'),
                          '50607425-3e50-48e2-846d-ed253d54c5c9')
+        mock_check_output.assert_called_once_with(
+            ['blkid', '-p', '-s', 'UUID', '-o', 'export', '/dev/vdb1'],
+            universal_newlines=True)
+        # The result is cached
+        dc.get_uuid('/dev/vdb1')
+        self.assertEqual(1, mock_check_output.call_count)
 
     @mock.patch('blivet.Blivet')
     @mock.patch('subprocess.check_output')
@@ -58,15 +76,63 @@ class TestBase(base.BaseTestCase):
 
     def _check_added(self, data, added, mock_check_output):
         mock_check_output.return_value = BLKID_OUT
-        m = mock.mock_open()
-        m().readlines.return_value = data
-        with mock.patch('os_disk_config.impl_base.open', m, create=True):
-            dc = impl_blivet.BlivetDiskConfig()
-            dc.add_to_fstab('/dev/sda1', '/mnt/test', 'ext4', 'defaults',
-                            False)
-            args = ['/etc/fstab']
-            if added:
-                args.append('a')
-            m.assert_called_with(*args)
-            self.assertTrue(m().readlines.called)
-            self.assertEqual(added, m().write.called)
+        filename = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                                'fstab')
+        with open(filename, 'w') as f:
+            f.write('\n'.join(data) + '\n')
+        dc = impl_blivet.BlivetDiskConfig()
+        dc._fstab = fstab.Fstab(filename)
+        self.assertEqual(added, dc.add_to_fstab('/dev/vdb1', '/mnt/test',
+                                                'ext4', 'defaults', False))
+        # Nothing is written until the staged entries are committed
+        self.assertEqual(data, open(filename).read().splitlines())
+
+        changes = dc.write_fstab(noop=False)
+        lines = open(filename).read().splitlines()
+        if added:
+            self.assertEqual([filename], list(changes))
+            self.assertEqual(
+                'UUID=50607425-3e50-48e2-846d-ed253d54c5c9 /mnt/test ext4 '
+                'defaults 0 1', lines[-1])
+        else:
+            self.assertEqual({}, changes)
+            self.assertEqual(data, lines)
+
+    @mock.patch('blivet.Blivet')
+    @mock.patch('subprocess.check_output')
+    def test_add_to_fstab_noop(self, mock_check_output, _):
+        filename = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                                'fstab')
+        dc = impl_blivet.BlivetDiskConfig()
+        dc._fstab = fstab.Fstab(filename)
+        dc.add_to_fstab('/dev/vdb1', '/mnt/test', 'ext4', 'defaults', False,
+                        noop=True)
+        changes = dc.write_fstab(noop=True)
+        self.assertFalse(mock_check_output.called)
+        self.assertIn('+/dev/vdb1 /mnt/test ext4 defaults 0 1',
+                      changes[filename])
+        self.assertFalse(os.path.exists(filename))
+
+    @mock.patch('blivet.Blivet')
+    def test_link_disks(self, _):
+        dc = impl_blivet.BlivetDiskConfig()
+        dc.link_disks(['sda', 'sdb'])
+        dc.link_disks(['sdc'])
+        dc.link_disks(['sdd', 'sdb'])
+        self.assertEqual('sda,sdb,sdd', dc.disk_group_name('sdd'))
+        self.assertEqual('sdc', dc.disk_group_name('sdc'))
+
+
+class TestSupports(base.BaseTestCase):
+    def test_supports(self):
+        objs = [objects.StandardPartition('a', ['sda'], '1 GiB', None, None),
+                objects.RaidArray('md0', ['sda', 'sdb'], None, None, None,
+                                  'raid1'),
+                objects.VolumeGroup('vg', ['sdc'], None),
+                objects.LogicalVolume('lv', 'vg', '1 GiB')]
+        self.assertEqual([True] * 4,
+                         [impl_blivet.BlivetDiskConfig.supports(o)
+                          for o in objs])
+        self.assertEqual([True, False, False, False],
+                         [impl_sfdisk.SfdiskDiskConfig.supports(o)
+                          for o in objs])
@@ -13,13 +13,19 @@
 # under the License.
 
 import json
+import os
+import subprocess
 
 import blivet
+import fixtures
 import mock
 from oslotest import base
+import testtools
 
+from os_disk_config import impl_base
 from os_disk_config import impl_blivet
 from os_disk_config import objects
+from os_disk_config import topology
 
 STANDARD_PARTITION_JSON = '''
 {
@@ -38,6 +44,36 @@ STANDARD_PARTITION_JSON = '''
 GET = 'os_disk_config.impl_blivet.BlivetDiskConfig._get_partition'
 CREATE = 'os_disk_config.impl_blivet.BlivetDiskConfig._create_partition'
 FORMAT = 'os_disk_config.impl_blivet.BlivetDiskConfig._format_partition'
+IMAGE_SIZE = 64 * 1024 * 1024
+
+
+def _disk_images_available():
+    """Whether blivet can build a devicetree from disk image files here"""
+    devicetree = getattr(blivet, 'devicetree', None)
+    if not hasattr(getattr(devicetree, 'DeviceTree', None),
+                   'setupDiskImages'):
+        return False
+    if os.geteuid() != 0:
+        return False
+    try:
+        subprocess.check_output(['losetup', '--find'])
+    except (OSError, subprocess.CalledProcessError):
+        return False
+    return True
+
+
+def _mock_device(name, device_type, parents=None):
+    device = mock.Mock()
+    device.name = name
+    device.path = '/dev/%s' % name
+    device.type = device_type
+    device.parents = parents or []
+    device.uuid = None
+    device.size = 1024 ** 4
+    device.format.type = 'ext4'
+    device.format.uuid = None
+    device.format.mountpoint = '/mnt/test'
+    return device
 
 
 class TestStandardPartition(base.BaseTestCase):
@@ -48,12 +84,81 @@ class TestStandardPartition(base.BaseTestCase):
         self.addCleanup(self.patcher.stop)
         self.mock_blivet = self.patcher.start()
         self.mock_blivet.return_value = self.blivet_instance
+        self.blivet_instance.devices = []
         self.dc = impl_blivet.BlivetDiskConfig()
         self.dc.add_to_fstab = mock.Mock()
+        self.dc._uuids = mock.Mock()
 
     def test_constructor(self):
         self.blivet_instance.reset.assert_called_once_with()
 
+    def test_constructor_scan_disks(self):
+        self.blivet_instance.config = mock.Mock()
+        self.blivet_instance.config.exclusiveDisks = []
+        impl_blivet.BlivetDiskConfig(scan_disks=['sda', 'sdb'])
+        self.assertEqual(['sda', 'sdb'],
+                         self.blivet_instance.config.exclusiveDisks)
+        self.assertEqual(2, self.blivet_instance.reset.call_count)
+
+    def _cached_provider(self, cached_disks):
+        sda = _mock_device('sda', 'disk')
+        sda1 = _mock_device('sda1', 'partition', [sda])
+        sdb = _mock_device('sdb', 'disk')
+        records = {'sda': [topology.device_record(sda),
+                           topology.device_record(sda1)],
+                   'sdb': [topology.device_record(sdb)]}
+        cache = mock.Mock()
+        cache.get.side_effect = lambda disk, fp: (
+            records[disk] if disk in cached_disks else None)
+        self.blivet_instance.config = mock.Mock()
+        self.blivet_instance.reset.reset_mock()
+        self.blivet_instance.devices = [sda, sda1, sdb]
+        dc = impl_blivet.BlivetDiskConfig(scan_disks=['sda', 'sdb'],
+                                          cache=cache)
+        self.assertFalse(self.blivet_instance.reset.called)
+        return dc, cache
+
+    @mock.patch('os_disk_config.probe_cache.disk_fingerprint')
+    def test_cached_scan(self, mock_fingerprint):
+        dc, cache = self._cached_provider(['sda', 'sdb'])
+        # Nothing is probed while every disk is in the cache
+        self.assertEqual(['/dev/sda', '/dev/sdb'], dc.disks())
+        self.assertEqual('/dev/sda1', dc.get_partition_info('sda1')['path'])
+        self.assertFalse(self.blivet_instance.reset.called)
+
+        # Adding objects needs the real devicetree
+        with mock.patch.object(dc, '_get_partition'):
+            dc.add_standard_partition(mock.Mock(filesystem=None))
+        self.blivet_instance.reset.assert_called_once_with()
+        self.assertEqual(['sda', 'sdb'],
+                         self.blivet_instance.config.exclusiveDisks)
+        # The fingerprints are not computed again for the update
+        self.assertEqual(2, mock_fingerprint.call_count)
+        self.assertEqual(2, cache.update.call_count)
+
+    @mock.patch('os_disk_config.probe_cache.disk_fingerprint')
+    def test_cached_scan_changed_disk(self, mock_fingerprint):
+        dc, cache = self._cached_provider(['sda'])
+        sda, sda1, sdb = self.blivet_instance.devices
+        # Only the changed disk is probed
+        self.blivet_instance.devices = [sdb]
+        self.assertEqual(['/dev/sdb', '/dev/sda'], dc.disks())
+        self.assertEqual('/dev/sda1', dc.get_partition_info('sda1')['path'])
+        self.blivet_instance.reset.assert_called_once_with()
+        self.assertEqual(['sdb'], self.blivet_instance.config.exclusiveDisks)
+        cache.update.assert_called_once_with(
+            'sdb', mock_fingerprint.return_value,
+            [topology.device_record(sdb)])
+        self.assertTrue(cache.save.called)
+
+        # Adding objects needs every disk in the devicetree
+        self.blivet_instance.devices = [sda, sda1, sdb]
+        with mock.patch.object(dc, '_get_partition'):
+            dc.add_standard_partition(mock.Mock(filesystem=None))
+        self.assertEqual(2, self.blivet_instance.reset.call_count)
+        self.assertEqual(['sda', 'sdb'],
+                         self.blivet_instance.config.exclusiveDisks)
+
     @mock.patch(GET)
     @mock.patch(CREATE)
     @mock.patch(FORMAT)
@@ -111,7 +216,7 @@ class TestStandardPartition(base.BaseTestCase):
         obj_json = json.loads(STANDARD_PARTITION_JSON)
         obj = objects.StandardPartition.from_json(
             obj_json.get('partitions')[0])
-        device = mock.Mock()
+        device = _mock_device('sda', 'disk')
         self.blivet_instance.devicetree = mock.Mock()
         self.blivet_instance.devicetree.resolveDevice = mock.Mock(
             return_value=device)
@@ -128,6 +233,45 @@ class TestStandardPartition(base.BaseTestCase):
             size=blivet.Size('1 TiB'), parents=[device], weight=-100)
         self.assertEqual(-200, self.dc._next_weight)
 
+    @mock.patch('os_disk_config.utils.block_device_io_hints')
+    def test_get_partition_alignment(self, mock_hints):
+        mock_hints.return_value = {
+            'logical_block_size': 512, 'physical_block_size': 4096,
+            'minimum_io_size': 65536, 'optimal_io_size': 196608,
+            'alignment_offset': 0}
+        device = _mock_device('sda', 'disk')
+        self.blivet_instance.devicetree = mock.Mock()
+        self.blivet_instance.devicetree.resolveDevice = mock.Mock(
+            return_value=device)
+        obj = objects.StandardPartition('a', ['sda'], '1 GiB', None, None)
+        self.dc._get_partition(obj)
+        mock_hints.assert_called_once_with('sda')
+        # 3 MiB, the least common multiple of 1 MiB and the stripe
+        self.assertEqual(6144, device.format._alignment.grainSize)
+        self.assertEqual(0, device.format._alignment.offset)
+        self.assertEqual(6143, device.format._endAlignment.offset)
+
+        # An override only applies to its own partition
+        obj.align = '4 MiB'
+        partition = self.dc._get_partition(obj)
+        self.assertEqual(1, mock_hints.call_count)
+        self.assertEqual(6144, device.format._alignment.grainSize)
+        self.assertEqual([(partition, 4 * 1024 ** 2)],
+                         self.dc._aligned_partitions)
+
+    @mock.patch('os_disk_config.utils.block_device_io_hints')
+    def test_get_partition_no_hints(self, mock_hints):
+        mock_hints.return_value = None
+        device = _mock_device('sda', 'disk')
+        device.format._alignment = None
+        self.blivet_instance.devicetree = mock.Mock()
+        self.blivet_instance.devicetree.resolveDevice = mock.Mock(
+            return_value=device)
+        self.dc._get_partition(objects.StandardPartition('a', ['sda'],
+                                                         '1 GiB', None,
+                                                         None))
+        self.assertIsNone(device.format._alignment)
+
     @mock.patch('blivet.partitioning.doPartitioning')
     def test_create_partition(self, mock_doPart):
         partition = mock.Mock()
@@ -135,6 +279,72 @@ class TestStandardPartition(base.BaseTestCase):
         self.blivet_instance.createDevice.assert_called_once_with(partition)
         mock_doPart.assert_called_once_with(self.blivet_instance)
 
+    def _aligned_partition(self, disk, start, align):
+        partition = _mock_device('%s1' % disk.name, 'partition', [disk])
+        partition.disk = disk
+        partition.req_start_sector = None
+        partition.partedPartition.geometry.start = start
+        self.dc._aligned_partitions.append((partition, align))
+        return partition
+
+    @mock.patch('blivet.partitioning.doPartitioning')
+    def test_create_partition_align(self, mock_doPart):
+        sda = _mock_device('sda', 'disk')
+        sda.format.sectorSize = 512
+        sda.format.alignment.grainSize = 6144
+        sda.format.alignment.offset = 0
+        partition = self._aligned_partition(sda, 6144, 4 * 1024 ** 2)
+        aligned = self._aligned_partition(sda, 24576, 4 * 1024 ** 2)
+
+        def allocate(storage):
+            if partition.req_start_sector is not None:
+                partition.partedPartition.geometry.start = (
+                    partition.req_start_sector)
+                aligned.partedPartition.geometry.start = 49152
+        mock_doPart.side_effect = allocate
+
+        self.dc._create_partition(partition)
+        self.assertEqual(2, mock_doPart.call_count)
+        # 12 MiB, the least common multiple of 3 MiB and 4 MiB
+        self.assertEqual(24576, partition.req_start_sector)
+        self.assertEqual([sda], partition.req_disks)
+        self.assertIsNone(aligned.req_start_sector)
+
+    def test_pin_aligned_partitions(self):
+        sda = _mock_device('sda', 'disk')
+        sda.format.sectorSize = 512
+        sda.format.alignment.grainSize = 2048
+        sda.format.alignment.offset = 7
+        sdb = _mock_device('sdb', 'disk')
+        sdb.format.sectorSize = 4096
+        sdb.format.alignment.grainSize = 256
+        sdb.format.alignment.offset = 0
+        first = self._aligned_partition(sda, 2055, 8 * 1024 ** 2)
+        later = self._aligned_partition(sda, 4103, 8 * 1024 ** 2)
+        other = self._aligned_partition(sdb, 256, 4 * 1024 ** 2)
+        self.assertTrue(self.dc._pin_aligned_partitions())
+        # Only the first partition on each disk is moved per run
+        self.assertEqual(16391, first.req_start_sector)
+        self.assertIsNone(later.req_start_sector)
+        self.assertEqual(1024, other.req_start_sector)
+
+        later.partedPartition.geometry.start = 32775
+        self.assertFalse(self.dc._pin_aligned_partitions())
+
+    @mock.patch('blivet.partitioning.doPartitioning')
+    def test_create_partition_deferred(self, mock_doPart):
+        self.dc._defer_allocation = True
+        self.dc._create_partition(_mock_device('req0', 'partition'))
+        self.dc._create_partition(_mock_device('req1', 'partition'))
+        self.assertEqual(2, self.blivet_instance.createDevice.call_count)
+        self.assertFalse(mock_doPart.called)
+
+        self.dc.apply(True)
+        mock_doPart.assert_called_once_with(self.blivet_instance)
+        # Nothing new was queued, so planning again is a no-op
+        self.dc.plan()
+        mock_doPart.assert_called_once_with(self.blivet_instance)
+
     @mock.patch('blivet.formats.getFormat')
     def test_format_partition(self, mock_getFormat):
         obj_json = json.loads(STANDARD_PARTITION_JSON)
@@ -151,20 +361,94 @@ class TestStandardPartition(base.BaseTestCase):
                                                device='/dev/sda')
         self.blivet_instance.formatDevice.assert_called_once_with(
             partition, mock_filesystem)
+        self.assertEqual([], partition.formatArgs)
+
+    @mock.patch('os_disk_config.utils.block_device_io_hints')
+    @mock.patch('blivet.formats.getFormat')
+    def test_format_partition_stripe(self, mock_getFormat, mock_hints):
+        mock_hints.return_value = {'physical_block_size': 512,
+                                   'minimum_io_size': 65536,
+                                   'optimal_io_size': 327680}
+        obj = objects.StandardPartition('a', ['/dev/sda'], '1 GiB', 'xfs',
+                                        None)
+        partition = mock.Mock()
+        self.dc._format_partition(obj, partition)
+        mock_hints.assert_called_once_with('sda')
+        self.assertEqual(['-d', 'su=65536,sw=5'], partition.formatArgs)
+
+        array = objects.RaidArray('md0', ['sda', 'sdb', 'sdc'], None, 'ext4',
+                                  None, 'raid0', chunk='256 KiB')
+        self.dc._format_partition(array, partition)
+        self.assertEqual(['-E', 'stride=64,stripe_width=192'],
+                         partition.formatArgs)
+
+    @mock.patch('os_disk_config.utils.block_devices_snapshot')
+    @mock.patch('blivet.formats.getFormat')
+    def test_format_partition_mount_options(self, mock_getFormat,
+                                            mock_snapshot):
+        mock_snapshot.return_value = {'sda': {'rotational': True}}
+        obj = objects.StandardPartition('a', ['sda'], '1 GiB', 'ext4',
+                                        '/srv', mount_options='auto')
+        partition = mock.Mock()
+        partition.path = '/dev/sda1'
+        partition.disks = [_mock_device('sda', 'disk')]
+        self.dc._format_partition(obj, partition)
+        mock_snapshot.assert_called_once_with(['sda'])
+        mock_getFormat.assert_called_once_with(
+            'ext4', device='/dev/sda1',
+            mountopts='noatime,nodiratime,commit=60')
+
+    @mock.patch('blivet.formats.getFormat')
+    def test_format_partition_options(self, mock_getFormat):
+        obj_json = json.loads(STANDARD_PARTITION_JSON)
+        part_json = obj_json.get('partitions')[0]
+        part_json['format_options'] = {'profile': 'largefile',
+                                       'args': ['-m', '0']}
+        obj = objects.StandardPartition.from_json(part_json)
+        partition = mock.Mock()
+
+        self.dc._format_partition(obj, partition)
+
+        self.assertEqual(['-T', 'largefile4', '-m', '0', '-E',
+                          'lazy_itable_init=1,lazy_journal_init=1'],
+                         partition.formatArgs)
 
     def _setup_for_apply(self):
         partition = mock.Mock()
+        partition.path = '/dev/sda1'
         partition.format = mock.Mock()
         partition.format.mount = mock.Mock()
         mountpoint = mock.Mock()
         self.dc._mounts = [(partition, mountpoint)]
+        create_disk = mock.Mock()
+        create_format = mock.Mock()
+        create_format.device = partition
+        create_format.format = mock.Mock(spec=blivet.formats.fs.FS)
+        devicetree = mock.Mock()
+        devicetree._actions = [create_disk, create_format]
+        devicetree.findActions.side_effect = lambda: list(devicetree._actions)
+        self.blivet_instance.devicetree = devicetree
+        return create_format
 
     def test_apply(self):
-        self._setup_for_apply()
+        create_format = self._setup_for_apply()
+        calls = []
+        self.blivet_instance.doIt.side_effect = lambda: calls.append('doit')
+        create_format.execute.side_effect = lambda: calls.append('mkfs')
         self.dc.apply(False)
         self.blivet_instance.doIt.assert_called_once_with()
+        # Filesystems are created and timed after doIt
+        self.assertEqual(['doit', 'mkfs'], calls)
+        self.assertEqual(['/dev/sda1'], list(self.dc.format_times))
+        self.assertEqual(['/dev/sda1'],
+                         list(self.dc.timer.report()['devices']['mkfs']))
         self.dc._mounts[0][0].format.mount.assert_called_once_with(
             mountpoint=self.dc._mounts[0][1])
+        self.dc._uuids.invalidate.assert_called_once_with(['/dev/sda1'])
+        self.dc._uuids.prime.assert_called_once_with(['/dev/sda1'])
+        phases = self.dc.timer.report()['phases']
+        for phase in ('doit', 'uuid', 'mount'):
+            self.assertEqual(1, phases[phase]['calls'])
 
     def test_apply_noop(self):
         self._setup_for_apply()
@@ -173,14 +457,416 @@ class TestStandardPartition(base.BaseTestCase):
         self.assertFalse(self.dc._mounts[0][0].format.mount.called)
 
     def test_disks(self):
-        sda = mock.Mock()
-        sda.path = '/dev/sda'
-        sda.parents = []
-        sda1 = mock.Mock()
-        sda1.path = '/dev/sda1'
-        sda1.parents = [sda]
-        sdb = mock.Mock()
-        sdb.path = '/dev/sdb'
-        sdb.parents = []
+        sda = _mock_device('sda', 'disk')
+        sda1 = _mock_device('sda1', 'partition', [sda])
+        sdb = _mock_device('sdb', 'disk')
         self.blivet_instance.devices = [sda, sda1, sdb]
         self.assertEqual(['/dev/sda', '/dev/sdb'], self.dc.disks())
+
+    def test_get_partition_info(self):
+        sda = _mock_device('sda', 'disk')
+        sda1 = _mock_device('sda1', 'partition', [sda])
+        sda1.format.uuid = '41a155bc-0032-4794-a321-d71402e8d7d3'
+        self.blivet_instance.devices = [sda, sda1]
+        expected = {'name': 'sda1', 'fs_type': 'ext4', 'path': '/dev/sda1',
+                    'uuid': '41a155bc-0032-4794-a321-d71402e8d7d3',
+                    'mountpoint': '/mnt/test'}
+        for key in ('sda1', '/dev/sda1',
+                    '41a155bc-0032-4794-a321-d71402e8d7d3'):
+            self.assertEqual(expected, self.dc.get_partition_info(key))
+        # Only partitions are matched
+        self.assertEqual({}, self.dc.get_partition_info('sda'))
+        self.assertEqual({}, self.dc.get_partition_info('sdb1'))
+
+    @mock.patch('os_disk_config.utils.mounts')
+    def test_layout_matches(self, mock_mounts):
+        obj_json = json.loads(STANDARD_PARTITION_JSON)
+        obj = objects.StandardPartition.from_json(
+            obj_json.get('partitions')[0])
+        sda = _mock_device('sda', 'disk')
+        sda1 = _mock_device('sda1', 'partition', [sda])
+        self.blivet_instance.devices = [sda, sda1]
+        mock_mounts.return_value = [('/dev/sda1', '/mnt/test', 'ext4')]
+        self.assertTrue(self.dc.layout_matches([obj]))
+        mock_mounts.return_value = [('/dev/sda1', '/mnt/other', 'ext4')]
+        self.assertFalse(self.dc.layout_matches([obj]))
+
+    def _mock_disk_device(self, name, disk=None):
+        if disk is None:
+            device = mock.Mock()
+        else:
+            device = mock.Mock(spec=blivet.devices.PartitionDevice)
+            device.exists = True
+            device.isExtended = False
+            device.partitioned = False
+            device.format = mock.Mock()
+            device.originalFormat = mock.Mock()
+        device.name = name
+        device.path = '/dev/%s' % name
+        device.disks = [disk or device]
+        return device
+
+    def _setup_for_parallel_apply(self):
+        self.dc.jobs = 2
+        self.dc.link_disks(['sda', 'sdb'])
+        sda = self._mock_disk_device('sda')
+        sdc = self._mock_disk_device('sdc')
+        sda1 = self._mock_disk_device('sda1', sda)
+        sdc1 = self._mock_disk_device('sdc1', sdc)
+        self.devices = [sda, sda1, sdc, sdc1]
+        actions = []
+        for device in (sda, sda1, sdc, sdc1):
+            action = mock.Mock()
+            action.device = device
+            actions.append(action)
+        for device in (sda1, sdc1):
+            action = mock.Mock()
+            action.device = device
+            action.format = mock.Mock(spec=blivet.formats.fs.FS)
+            actions.append(action)
+        self.blivet_instance.devicetree = mock.Mock()
+        self.blivet_instance.devicetree.devices = self.devices
+        self.blivet_instance.devicetree.findActions.return_value = actions
+        self.dc._mounts = [(sda1, '/mnt/a'), (sdc1, '/mnt/c')]
+        return actions
+
+    def test_apply_parallel(self):
+        actions = self._setup_for_parallel_apply()
+        self.dc.apply(False)
+        self.assertFalse(self.blivet_instance.doIt.called)
+        self.blivet_instance.devicetree.sortActions.assert_called_once_with()
+        for action in actions:
+            action.execute.assert_called_once_with()
+        for partition, mountpoint in self.dc._mounts:
+            partition.format.mount.assert_called_once_with(
+                mountpoint=mountpoint)
+        self.assertEqual(2, self.dc.add_to_fstab.call_count)
+        self.assertEqual(set(['/dev/sda1', '/dev/sdc1']),
+                         set(self.dc.format_times))
+        self.assertEqual(set(['/dev/sda1', '/dev/sdc1']),
+                         set(self.dc.timer.report()['devices']['mkfs']))
+
+    def test_apply_parallel_prepares_actions(self):
+        actions = self._setup_for_parallel_apply()
+        sda, sda1, sdc, sdc1 = self.devices
+        sda1.updateName.side_effect = lambda: setattr(sda1, 'path',
+                                                      '/dev/sda2')
+        self.dc.apply(False)
+        # As DeviceTree.processActions would before executing anything
+        sda.format.resetPartedDisk.assert_called_once_with()
+        for device in self.devices:
+            device.preCommitFixup.assert_called_once_with()
+        self.blivet_instance.devicetree.pruneActions.assert_called_once_with()
+        # The partitions are renamed after each action in their group
+        self.assertEqual(2, sda1.updateName.call_count)
+        self.assertEqual('/dev/sda2', sda1.format.device)
+        self.assertEqual(2, sdc1.updateName.call_count)
+        self.assertEqual(6, len(actions))
+
+    def test_apply_parallel_extended_partition(self):
+        actions = self._setup_for_parallel_apply()
+        sda = self.devices[0]
+        extended = self._mock_disk_device('sda4', sda)
+        extended.exists = False
+        extended.isExtended = True
+        self.devices.append(extended)
+        self.blivet_instance.devicetree._actions = []
+        self.blivet_instance.devicetree.findActions.side_effect = (
+            lambda **kwargs: [] if kwargs else actions)
+        self.dc.apply(False)
+        created = self.blivet_instance.devicetree._actions
+        self.assertEqual(1, len(created))
+        self.assertIs(extended, created[0].device)
+
+    def test_apply_parallel_failure(self):
+        actions = self._setup_for_parallel_apply()
+        actions[1].execute.side_effect = RuntimeError('boom')
+        e = self.assertRaises(impl_base.DiskApplyException,
+                              self.dc.apply, False)
+        self.assertEqual(['sda,sdb'], list(e.failures))
+        # The group on sdc is independent and still gets configured, but
+        # the failed group's filesystem is not created
+        actions[3].execute.assert_called_once_with()
+        actions[5].execute.assert_called_once_with()
+        self.assertFalse(actions[4].execute.called)
+        self.dc.add_to_fstab.assert_called_once_with(
+            '/dev/sdc1', '/mnt/c', mock.ANY, mock.ANY, mock.ANY, noop=False)
+
+
+class TestRaidArray(base.BaseTestCase):
+    def setUp(self):
+        super(TestRaidArray, self).setUp()
+        self.blivet_instance = mock.Mock(spec=blivet.Blivet)
+        self.useFixture(fixtures.MockPatch(
+            'blivet.Blivet', return_value=self.blivet_instance))
+        self.sda = _mock_device('sda', 'disk')
+        self.sdb = _mock_device('sdb', 'disk')
+        self.blivet_instance.devices = [self.sda, self.sdb]
+        self.useFixture(fixtures.MockPatch(
+            'blivet.partitioning.doPartitioning'))
+        self.get_format = self.useFixture(fixtures.MockPatch(
+            'blivet.formats.getFormat')).mock
+
+        def _new_partition(size, parents, weight, **kwargs):
+            partition = _mock_device(parents[0].name + '1', 'partition',
+                                     parents)
+            partition.disks = parents
+            return partition
+        self.blivet_instance.newPartition.side_effect = _new_partition
+        self.array_cls = self.useFixture(fixtures.MockPatch(
+            'os_disk_config.impl_blivet.MDRaidArrayDevice')).mock
+        self.array = _mock_device('data', 'mdarray')
+        self.array.disks = [self.sda, self.sdb]
+        self.array_cls.return_value = self.array
+        self.dc = impl_blivet.BlivetDiskConfig()
+        self.dc._uuids = mock.Mock()
+        self.dc.add_to_fstab = mock.Mock()
+
+    def _raid(self, **kwargs):
+        json = {'type': 'raid', 'name': 'data', 'level': 1,
+                'disks': ['sda', 'sdb']}
+        json.update(kwargs)
+        return objects.object_from_json(json)
+
+    def test_add_raid_disks(self):
+        self.dc.add_object(self._raid(size='10 GiB', chunk=None,
+                                      assume_clean=True, bitmap='internal',
+                                      filesystem='xfs', mountpoint='/srv'))
+        calls = self.blivet_instance.newPartition.call_args_list
+        self.assertEqual([[self.sda], [self.sdb]],
+                         [c[1]['parents'] for c in calls])
+        self.assertEqual(self.get_format.return_value, calls[0][1]['format'])
+        self.assertNotIn('grow', calls[0][1])
+        self.get_format.assert_any_call('mdmember')
+        kwargs = self.array_cls.call_args[1]
+        self.assertEqual('raid1', kwargs['level'])
+        self.assertEqual(2, kwargs['memberDevices'])
+        self.assertTrue(kwargs['assume_clean'])
+        self.assertEqual('internal', kwargs['bitmap'])
+        self.blivet_instance.createDevice.assert_called_with(self.array)
+        self.assertEqual([(self.array, '/srv')], self.dc._mounts)
+        self.assertEqual('sda,sdb', self.dc.disk_group_name('sda'))
+
+    def test_add_raid_whole_disks(self):
+        self.dc.add_object(self._raid(level=0, chunk='256 KiB'))
+        calls = self.blivet_instance.newPartition.call_args_list
+        self.assertTrue(calls[0][1]['grow'])
+        self.assertEqual(256 * 1024, self.array_cls.call_args[1]['chunk'])
+        self.assertEqual([], self.dc._mounts)
+
+    def test_add_raid_partitions(self):
+        objs = objects.objects_from_json([
+            {'type': 'standard', 'name': 'a', 'disks': ['sda'],
+             'size': '1 GiB'},
+            {'type': 'standard', 'name': 'b', 'disks': ['sdb'],
+             'size': '1 GiB'},
+            {'type': 'raid', 'name': 'data', 'level': 1,
+             'partitions': ['a', 'b']}])
+        for obj in objs:
+            self.dc.add_object(obj)
+        parents = self.array_cls.call_args[1]['parents']
+        self.assertEqual(['sda1', 'sdb1'], [p.name for p in parents])
+        self.blivet_instance.formatDevice.assert_any_call(
+            parents[0], self.get_format.return_value)
+
+    def test_too_few_members(self):
+        obj = self._raid(level=5, disks=[{'rotational': True}])
+        obj.disks = ['sda', 'sdb']
+        self.assertRaises(objects.InvalidConfigException,
+                          self.dc.add_object, obj)
+
+    @mock.patch('os_disk_config.mdraid.raise_sync_speed')
+    def test_sync_speed(self, mock_raise):
+        self.dc.add_object(self._raid(sync_speed_min=50000))
+        self.array.path = '/dev/md/data'
+        self.blivet_instance.devicetree = mock.Mock()
+        self.blivet_instance.devicetree.findActions.return_value = []
+        self.dc.apply(noop=False)
+        mock_raise.assert_called_once_with('/dev/md/data', 50000, None)
+
+
+class TestMDRaidArrayDevice(base.BaseTestCase):
+    @mock.patch('os_disk_config.mdraid.create_array')
+    def test_create(self, mock_create_array):
+        sda1 = _mock_device('sda1', 'partition')
+        sdb1 = _mock_device('sdb1', 'partition')
+        with mock.patch.object(impl_blivet.MDRaidArrayDevice, 'path',
+                               new_callable=mock.PropertyMock,
+                               create=True) as mock_path:
+            mock_path.return_value = '/dev/md/data'
+            array = impl_blivet.MDRaidArrayDevice(
+                'data', level='raid10', parents=[sda1, sdb1],
+                memberDevices=2, totalDevices=2, chunk=512 * 1024,
+                bitmap='none', assume_clean=True)
+            array.parents = [sda1, sdb1]
+            array._create()
+        mock_create_array.assert_called_once_with(
+            '/dev/md/data', 'raid10', ['/dev/sda1', '/dev/sdb1'],
+            chunk=512 * 1024, bitmap='none', assume_clean=True)
+
+
+class TestLvm(base.BaseTestCase):
+    def setUp(self):
+        super(TestLvm, self).setUp()
+        self.blivet_instance = mock.Mock(spec=blivet.Blivet)
+        self.useFixture(fixtures.MockPatch(
+            'blivet.Blivet', return_value=self.blivet_instance))
+        self.sda = _mock_device('sda', 'disk')
+        self.sdb = _mock_device('sdb', 'disk')
+        self.blivet_instance.devices = [self.sda, self.sdb]
+        self.useFixture(fixtures.MockPatch(
+            'blivet.partitioning.doPartitioning'))
+        self.get_format = self.useFixture(fixtures.MockPatch(
+            'blivet.formats.getFormat')).mock
+
+        def _new_partition(size, parents, weight, **kwargs):
+            partition = _mock_device(parents[0].name + '1', 'partition',
+                                     parents)
+            partition.disks = parents
+            return partition
+        self.blivet_instance.newPartition.side_effect = _new_partition
+        self.vg = _mock_device('vg0', 'lvmvg')
+        self.blivet_instance.newVG.return_value = self.vg
+
+        def _new_lv(name, parents, **kwargs):
+            return _mock_device('vg0-' + name, 'lvmlv', parents)
+        self.blivet_instance.newLV.side_effect = _new_lv
+        self.striped_cls = self.useFixture(fixtures.MockPatch(
+            'os_disk_config.impl_blivet.StripedLogicalVolumeDevice',
+            side_effect=_new_lv)).mock
+        self.dc = impl_blivet.BlivetDiskConfig()
+
+    def _add(self, *json_list):
+        objs = objects.objects_from_json(
+            [{'type': 'volume_group', 'name': 'vg0',
+              'disks': ['sda', 'sdb']}] + list(json_list))
+        for obj in objs:
+            self.dc.add_object(obj)
+
+    def _lv(self, name='lv0', **kwargs):
+        json = {'type': 'logical_volume', 'name': name,
+                'volume_group': 'vg0', 'size': '10 GiB'}
+        json.update(kwargs)
+        return json
+
+    def test_volume_group(self):
+        self.vg.parents = []
+        self._add()
+        calls = self.blivet_instance.newPartition.call_args_list
+        self.assertEqual(2, len(calls))
+        self.assertTrue(calls[0][1]['grow'])
+        self.get_format.assert_called_with('lvmpv')
+        kwargs = self.blivet_instance.newVG.call_args[1]
+        self.assertEqual('vg0', kwargs['name'])
+        self.assertEqual(['sda1', 'sdb1'],
+                         [p.name for p in kwargs['parents']])
+        self.blivet_instance.createDevice.assert_called_with(self.vg)
+        self.assertEqual('sda,sdb', self.dc.disk_group_name('sda'))
+
+    def test_striped(self):
+        self.vg.parents = [mock.Mock(), mock.Mock()]
+        self._add(self._lv(stripes=2, stripe_size='64 KiB',
+                           filesystem='xfs', mountpoint='/srv'))
+        kwargs = self.striped_cls.call_args[1]
+        self.assertEqual(2, kwargs['stripes'])
+        self.assertEqual(64 * 1024, kwargs['stripe_size'])
+        self.assertEqual([self.vg], kwargs['parents'])
+        self.assertEqual(['vg0-lv0'], [d.name for d, _ in self.dc._mounts])
+
+    def test_too_many_stripes(self):
+        self.vg.parents = [mock.Mock(), mock.Mock()]
+        self.assertRaises(objects.InvalidConfigException, self._add,
+                          self._lv(stripes=3))
+
+    def test_thin(self):
+        self.vg.parents = []
+        self._add(self._lv('pool', thin_pool=True, size=None,
+                           metadata_size='1 GiB'),
+                  self._lv('thin', pool='pool', size='1 TiB',
+                           filesystem='xfs', mountpoint='/scratch'))
+        pool_call, thin_call = self.blivet_instance.newLV.call_args_list
+        self.assertTrue(pool_call[1]['thin_pool'])
+        self.assertTrue(pool_call[1]['grow'])
+        self.assertEqual(blivet.Size('1 GiB'), pool_call[1]['metadatasize'])
+        self.assertEqual(['vg0-pool'],
+                         [p.name for p in thin_call[1]['parents']])
+        self.assertTrue(thin_call[1]['thin_volume'])
+        self.assertEqual(blivet.Size('1 TiB'), thin_call[1]['size'])
+        self.assertEqual([(mock.ANY, '/scratch')], self.dc._mounts)
+
+
+class TestStripedLogicalVolumeDevice(base.BaseTestCase):
+    @mock.patch('subprocess.check_call')
+    def test_create(self, mock_check_call):
+        lv = impl_blivet.StripedLogicalVolumeDevice('lv0', stripes=4,
+                                                    stripe_size=64 * 1024)
+        with mock.patch.multiple(impl_blivet.StripedLogicalVolumeDevice,
+                                 lvname=mock.DEFAULT, size=mock.DEFAULT,
+                                 vg=mock.DEFAULT, create=True) as attrs:
+            attrs['lvname'] = 'lv0'
+            lv.lvname = 'lv0'
+            lv.size = blivet.Size('10 GiB')
+            lv.vg = mock.Mock()
+            lv.vg.name = 'vg0'
+            lv._create()
+        mock_check_call.assert_called_once_with(
+            ['lvcreate', '--yes', '--name', 'lv0', '--size',
+             '%db' % (10 * 1024 ** 3), '--stripes', '4', '--stripesize',
+             '64', 'vg0'])
+
+
+@testtools.skipUnless(_disk_images_available(),
+                      'blivet cannot set up disk images here')
+class TestDiskImages(base.BaseTestCase):
+    """Apply configs to a real devicetree built from disk image files"""
+    def setUp(self):
+        super(TestDiskImages, self).setUp()
+        tmpdir = self.useFixture(fixtures.TempDir()).path
+        self.images = {}
+        for name in ('disk1', 'disk2'):
+            path = os.path.join(tmpdir, '%s.img' % name)
+            with open(path, 'wb') as f:
+                f.truncate(IMAGE_SIZE)
+            self.images[name] = path
+        real_blivet = blivet.Blivet
+
+        def _new_blivet():
+            storage = real_blivet()
+            storage.config.diskImages = dict(self.images)
+            # reset() replaces the devicetree, so it is looked up late
+            self.addCleanup(
+                lambda: storage.devicetree.teardownDiskImages())
+            return storage
+        self.useFixture(fixtures.MockPatch('blivet.Blivet',
+                                           side_effect=_new_blivet))
+
+    def _apply(self, jobs):
+        objs = objects.objects_from_json([
+            {'type': 'standard', 'name': 'a', 'disks': ['disk1'],
+             'size': '16 MiB', 'filesystem': 'ext4'},
+            {'type': 'standard', 'name': 'b', 'disks': ['disk1'],
+             'size': '16 MiB', 'filesystem': 'ext4'},
+            {'type': 'standard', 'name': 'c', 'disks': ['disk2'],
+             'size': '16 MiB', 'filesystem': 'ext4'}])
+        dc = impl_blivet.BlivetDiskConfig(jobs=jobs,
+                                          scan_disks=sorted(self.images))
+        for obj in objs:
+            dc.add_object(obj)
+        dc.apply(False)
+        return dc
+
+    def _check_layout(self, dc):
+        storage = blivet.Blivet()
+        storage.reset()
+        paths = sorted(p.path for p in storage.partitions
+                       if p.format.type == 'ext4')
+        self.assertEqual(3, len(paths))
+        # The partitions were given the names they have on disk
+        self.assertEqual(paths, sorted(dc._devices_by_name[name].path
+                                       for name in ('a', 'b', 'c')))
+
+    def test_apply(self):
+        self._check_layout(self._apply(jobs=1))
+
+    def test_apply_parallel(self):
+        self._check_layout(self._apply(jobs=2))
@@ -0,0 +1,125 @@
+# Copyright 2015 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import subprocess
+
+import fixtures
+import mock
+from oslotest import base
+
+from os_disk_config import impl_base
+from os_disk_config import impl_sfdisk
+from os_disk_config import objects
+
+GIB = 1024 ** 3
+
+
+class TestSfdiskScript(base.BaseTestCase):
+    def test_script(self):
+        disk = {'partitions': [{'name': 'a', 'start': 2048, 'end': 4095},
+                               {'name': 'b"c', 'start': 4096,
+                                'end': 8191}]}
+        self.assertEqual(
+            'label: gpt\nunit: sectors\n\n'
+            'start=2048, size=2048, type=%s, name="a"\n'
+            'start=4096, size=4096, type=%s, name="bc"\n' %
+            (impl_sfdisk.LINUX_FILESYSTEM, impl_sfdisk.LINUX_FILESYSTEM),
+            impl_sfdisk.sfdisk_script(disk))
+
+
+class TestSfdiskDiskConfig(base.BaseTestCase):
+    def setUp(self):
+        super(TestSfdiskDiskConfig, self).setUp()
+        disk = {'size': 10 * GIB, 'logical_block_size': 512,
+                'physical_block_size': 512, 'alignment_offset': 0}
+        self.useFixture(fixtures.MockPatch(
+            'os_disk_config.utils.block_devices_snapshot',
+            return_value={'sda': dict(disk), 'sdb': dict(disk),
+                          'sdc': dict(disk)}))
+        self.run = self.useFixture(fixtures.MockPatch(
+            'os_disk_config.impl_sfdisk._run')).mock
+        self.dc = impl_sfdisk.SfdiskDiskConfig(jobs=2,
+                                               scan_disks=['sda', 'sdb'])
+        self.dc.add_to_fstab = mock.Mock()
+        self.dc._uuids = mock.Mock()
+        self.dc.write_fstab = mock.Mock(return_value={})
+
+    def _add(self, name, disks, filesystem='xfs', format_options=None):
+        self.dc.add_object(objects.StandardPartition(
+            name, disks, '1 GiB', filesystem, None, format_options))
+
+    def _commands(self):
+        return [c[0][0] for c in self.run.call_args_list]
+
+    def test_disks(self):
+        self.assertEqual(['/dev/sda', '/dev/sdb'], self.dc.disks())
+
+    def test_one_sfdisk_per_disk(self):
+        self._add('a', ['sda'])
+        self._add('b', ['sda'], format_options='fast')
+        self._add('c', ['sdb'], filesystem=None)
+        self.dc.apply(noop=False)
+        commands = self._commands()
+        sfdisk = [c for c in commands if c[0] == 'sfdisk']
+        self.assertEqual(['/dev/sda', '/dev/sdb'],
+                         sorted(c[-1] for c in sfdisk))
+        mkfs = sorted(c for c in commands if c[0].startswith('mkfs'))
+        self.assertEqual([['mkfs.xfs', '-K', '/dev/sda2'],
+                          ['mkfs.xfs', '/dev/sda1']], mkfs)
+        self.assertIn(['udevadm', 'settle'], commands)
+        self.assertEqual(set(['/dev/sda1', '/dev/sda2']),
+                         set(self.dc.timer.report()['devices']['mkfs']))
+
+    def test_failed_disk(self):
+        def _run(cmd, data=None):
+            if cmd[0] == 'sfdisk' and cmd[-1] == '/dev/sdb':
+                raise subprocess.CalledProcessError(1, cmd)
+        self.run.side_effect = _run
+        self._add('a', ['sda'])
+        self._add('b', ['sdb'])
+        e = self.assertRaises(impl_base.DiskApplyException, self.dc.apply,
+                              False)
+        self.assertEqual(['sdb'], list(e.failures))
+        mkfs = [c for c in self._commands() if c[0].startswith('mkfs')]
+        self.assertEqual([['mkfs.xfs', '/dev/sda1']], mkfs)
+        self.dc.write_fstab.assert_called_once_with(noop=False)
+
+    @mock.patch('os.path.isdir', return_value=True)
+    def test_mount_options(self, mock_isdir):
+        self.dc.add_object(objects.StandardPartition(
+            'a', ['sda'], '1 GiB', 'xfs', '/srv', mount_options='ssd'))
+        self.dc.apply(noop=False)
+        self.assertIn(['mount', '-t', 'xfs', '-o',
+                       'noatime,nodiratime,inode64,logbsize=256k',
+                       '/dev/sda1', '/srv'], self._commands())
+        self.dc.add_to_fstab.assert_called_once_with(
+            '/dev/sda1', '/srv', 'xfs',
+            'noatime,nodiratime,inode64,logbsize=256k', False)
+
+    @mock.patch('os.path.isdir', return_value=True)
+    def test_failed_mount(self, mock_isdir):
+        def _run(cmd, data=None):
+            if cmd[0] == 'mount' and cmd[-1] == '/b':
+                raise subprocess.CalledProcessError(32, cmd)
+        self.run.side_effect = _run
+        for name, disk in (('a', 'sda'), ('b', 'sdb')):
+            self.dc.add_object(objects.StandardPartition(
+                name, [disk], '1 GiB', 'xfs', '/' + name))
+        e = self.assertRaises(impl_base.DiskApplyException, self.dc.apply,
+                              False)
+        self.assertEqual(['sdb'], list(e.failures))
+        # Only the filesystem that was mounted goes in fstab
+        self.dc.add_to_fstab.assert_called_once_with(
+            '/dev/sda1', '/a', 'xfs', 'defaults', False)
+        self.dc.write_fstab.assert_called_once_with(noop=False)
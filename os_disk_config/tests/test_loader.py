@@ -0,0 +1,95 @@
+# Copyright 2015 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+
+import fixtures
+import mock
+from oslotest import base
+import six
+
+from os_disk_config import loader
+from os_disk_config import objects
+
+
+JSON_CONFIG = '{"version": "0.0.1", "partitions": []}'
+YAML_CONFIG = '''
+version: 0.0.1
+partitions:
+    - name: test1
+      disks: [vdb]
+      size: 5 GiB
+      type: standard
+'''
+
+
+class TestLoader(base.BaseTestCase):
+    def setUp(self):
+        super(TestLoader, self).setUp()
+        self.tmpdir = self.useFixture(fixtures.TempDir()).path
+        self.useFixture(fixtures.MonkeyPatch(
+            'os_disk_config.loader.CACHE_DIR',
+            os.path.join(self.tmpdir, 'cache')))
+        self.mock_check_version = self.useFixture(fixtures.MockPatch(
+            'os_disk_config.objects.check_version')).mock
+        self.filename = os.path.join(self.tmpdir, 'config.yaml')
+
+    def _write(self, data):
+        with open(self.filename, 'w') as f:
+            f.write(data)
+
+    def test_parse_json(self):
+        config = loader.parse_config(JSON_CONFIG)
+        self.assertEqual({'version': '0.0.1', 'partitions': []}, config)
+        self.mock_check_version.assert_called_once_with(config)
+
+    def test_parse_yaml(self):
+        config = loader.parse_config(YAML_CONFIG)
+        self.assertEqual('test1', config['partitions'][0]['name'])
+        # Flow style yaml looks like json but is not
+        config = loader.parse_config('{version: 0.0.1}')
+        self.assertEqual({'version': '0.0.1'}, config)
+
+    def test_parse_unsafe_yaml(self):
+        self.assertRaises(objects.InvalidConfigException,
+                          loader.parse_config,
+                          'version: !!python/object/apply:os.getcwd []')
+
+    def test_parse_not_a_mapping(self):
+        self.assertRaises(objects.InvalidConfigException,
+                          loader.parse_config, '- a\n- b\n')
+
+    def test_cache(self):
+        self._write(YAML_CONFIG)
+        config = loader.load_config(self.filename)
+        with mock.patch.object(loader, 'parse_config') as mock_parse:
+            self.assertEqual(config, loader.load_config(self.filename))
+            self.assertFalse(mock_parse.called)
+            # Bypassing the cache parses the file again
+            loader.load_config(self.filename, use_cache=False)
+            self.assertTrue(mock_parse.called)
+
+    def test_cache_invalidated(self):
+        self._write(YAML_CONFIG)
+        loader.load_config(self.filename)
+        self._write(YAML_CONFIG.replace('5 GiB', '6 GiB'))
+        config = loader.load_config(self.filename)
+        self.assertEqual('6 GiB', config['partitions'][0]['size'])
+
+    def test_stdin(self):
+        self.useFixture(fixtures.MonkeyPatch('sys.stdin',
+                                             six.StringIO(YAML_CONFIG)))
+        config = loader.load_config('-')
+        self.assertEqual('test1', config['partitions'][0]['name'])
+        self.assertFalse(os.path.exists(loader.CACHE_DIR))
@@ -0,0 +1,115 @@
+# Copyright 2015 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import json
+import os
+
+import fixtures
+import mock
+from oslotest import base
+
+from os_disk_config import mdraid
+
+
+class TestCreateCommand(base.BaseTestCase):
+    def test_defaults(self):
+        self.assertEqual(['mdadm', '--create', '/dev/md/data', '--run',
+                          '--level=raid1', '--raid-devices=2', '/dev/sda1',
+                          '/dev/sdb1'],
+                         mdraid.create_command('/dev/md/data', 'raid1',
+                                               ['/dev/sda1', '/dev/sdb1']))
+
+    def test_options(self):
+        cmd = mdraid.create_command('/dev/md/data', 'raid10',
+                                    ['/dev/sda1', '/dev/sdb1'],
+                                    chunk=512 * 1024, bitmap='none',
+                                    assume_clean=True)
+        self.assertEqual(['--chunk=512', '--bitmap=none', '--assume-clean',
+                          '/dev/sda1', '/dev/sdb1'], cmd[6:])
+
+    @mock.patch('subprocess.check_call')
+    def test_create_array(self, mock_check_call):
+        mdraid.create_array('/dev/md/data', 'raid1', ['/dev/sda1'],
+                            assume_clean=True)
+        self.assertEqual(
+            [mock.call(mdraid.create_command('/dev/md/data', 'raid1',
+                                             ['/dev/sda1'],
+                                             assume_clean=True)),
+             mock.call(['udevadm', 'settle'])],
+            mock_check_call.call_args_list)
+
+
+class TestDataDisks(base.BaseTestCase):
+    def test_data_disks(self):
+        self.assertEqual(4, mdraid.data_disks('raid0', 4))
+        self.assertEqual(1, mdraid.data_disks('raid1', 2))
+        self.assertEqual(3, mdraid.data_disks('raid5', 4))
+        self.assertEqual(2, mdraid.data_disks('raid6', 4))
+        self.assertEqual(3, mdraid.data_disks('raid10', 6))
+
+
+class TestSyncSpeed(base.BaseTestCase):
+    def setUp(self):
+        super(TestSyncSpeed, self).setUp()
+        tmpdir = self.useFixture(fixtures.TempDir()).path
+        self.sys_block = os.path.join(tmpdir, 'sys')
+        self.useFixture(fixtures.MonkeyPatch(
+            'os_disk_config.mdraid._SYS_BLOCK', self.sys_block))
+        self.state_file = os.path.join(tmpdir, 'state', 'sync-speeds.json')
+        self.md_dir = os.path.join(self.sys_block, 'md127', 'md')
+        os.makedirs(self.md_dir)
+        self._write('sync_action', 'resync')
+
+    def _write(self, name, value):
+        with open(os.path.join(self.md_dir, name), 'w') as f:
+            f.write('%s\n' % value)
+
+    def _read(self, name):
+        with open(os.path.join(self.md_dir, name)) as f:
+            return f.read().strip()
+
+    def _state(self):
+        with open(self.state_file) as f:
+            return json.load(f)
+
+    def test_raise_and_restore(self):
+        mdraid.raise_sync_speed('md127', 50000, 500000, self.state_file)
+        self.assertEqual('50000', self._read('sync_speed_min'))
+        self.assertEqual('500000', self._read('sync_speed_max'))
+        self.assertEqual(['md127'], self._state())
+
+        # Still resyncing
+        self.assertEqual([], mdraid.restore_sync_speeds(self.state_file))
+        self.assertEqual('50000', self._read('sync_speed_min'))
+
+        self._write('sync_action', 'idle')
+        self.assertEqual(['md127'],
+                         mdraid.restore_sync_speeds(self.state_file))
+        self.assertEqual('system', self._read('sync_speed_min'))
+        self.assertEqual('system', self._read('sync_speed_max'))
+        self.assertEqual([], self._state())
+
+    def test_only_max(self):
+        mdraid.raise_sync_speed('md127', speed_max=500000,
+                                state_file=self.state_file)
+        self.assertFalse(os.path.exists(os.path.join(self.md_dir,
+                                                     'sync_speed_min')))
+
+    def test_array_gone(self):
+        mdraid.raise_sync_speed('md126', None, None, self.state_file)
+        self.assertEqual(['md126'],
+                         mdraid.restore_sync_speeds(self.state_file))
+
+    def test_no_state(self):
+        self.assertEqual([], mdraid.restore_sync_speeds(self.state_file))
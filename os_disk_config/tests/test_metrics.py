@@ -0,0 +1,75 @@
+# Copyright 2015 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import json
+import os
+
+import fixtures
+from oslotest import base
+
+from os_disk_config import metrics
+
+
+class TestPhaseTimer(base.BaseTestCase):
+    def setUp(self):
+        super(TestPhaseTimer, self).setUp()
+        self.timer = metrics.PhaseTimer()
+        self.timer.record('scan', 1.5)
+        self.timer.record('mkfs', 2.0, device='/dev/sdb1')
+        self.timer.record('mkfs', 3.0, device='/dev/sdc1')
+        with self.timer.phase('mount'):
+            pass
+
+    def test_report(self):
+        report = self.timer.report()
+        self.assertEqual(['scan', 'mkfs', 'mount'], list(report['phases']))
+        self.assertEqual({'calls': 2, 'seconds': 5.0},
+                         report['phases']['mkfs'])
+        self.assertEqual(1, report['phases']['mount']['calls'])
+        self.assertEqual({'/dev/sdb1': 2.0, '/dev/sdc1': 3.0},
+                         report['devices']['mkfs'])
+
+    def test_phase_records_on_error(self):
+        def _fail():
+            with self.timer.phase('doit'):
+                raise RuntimeError()
+        self.assertRaises(RuntimeError, _fail)
+        self.assertEqual(1, self.timer.report()['phases']['doit']['calls'])
+
+    def test_render_textfile(self):
+        text = self.timer.render_textfile()
+        self.assertIn('# TYPE os_disk_config_phase_seconds gauge\n', text)
+        self.assertIn('os_disk_config_phase_seconds{phase="mkfs"} 5.000000\n',
+                      text)
+        self.assertIn('os_disk_config_phase_calls{phase="mkfs"} 2\n', text)
+        self.assertIn('os_disk_config_device_seconds{phase="mkfs",'
+                      'device="/dev/sdb1"} 2.000000\n', text)
+        self.assertIn('os_disk_config_last_run_timestamp_seconds ', text)
+
+    def test_write(self):
+        tmpdir = self.useFixture(fixtures.TempDir()).path
+        json_file = os.path.join(tmpdir, 'state', 'metrics.json')
+        textfile = os.path.join(tmpdir, 'os_disk_config.prom')
+        self.timer.write_json(json_file)
+        self.timer.write_textfile(textfile)
+        with open(json_file) as f:
+            self.assertEqual(1.5, json.load(f)['phases']['scan']['seconds'])
+        with open(textfile) as f:
+            self.assertEqual(self.timer.render_textfile().splitlines()[:3],
+                             f.read().splitlines()[:3])
+
+    def test_summary(self):
+        lines = self.timer.summary()
+        self.assertEqual(4, len(lines))
+        self.assertTrue(lines[2].startswith('mkfs'))
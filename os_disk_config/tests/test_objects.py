@@ -47,3 +47,327 @@ class TestVersions(base.BaseTestCase):
         d = dict()
         self.assertRaises(objects.InvalidConfigException,
                           objects.check_version, d)
+
+
+class TestReferencedDisks(base.BaseTestCase):
+    def test_referenced_disks(self):
+        objs = [objects.StandardPartition('a', ['sda', 'sdb'], '1 GiB', None,
+                                          None),
+                None,
+                objects.StandardPartition('b', ['/dev/sdb', 'sdc'], '1 GiB',
+                                          None, None)]
+        self.assertEqual(['sda', 'sdb', 'sdc'],
+                         objects.referenced_disks(objs))
+
+
+class TestFormatOptions(base.BaseTestCase):
+    def _from_json(self, format_options, filesystem='ext4'):
+        return objects.StandardPartition.from_json(
+            {'name': 'a', 'disks': ['sda'], 'size': '1 GiB',
+             'filesystem': filesystem, 'format_options': format_options})
+
+    def test_valid(self):
+        for format_options in (None, 'fast', ['-m', '0'],
+                               {'profile': 'fast'}, {'args': ['-m', '0']}):
+            obj = self._from_json(format_options)
+            self.assertEqual(format_options, obj.format_options)
+
+    def test_invalid(self):
+        for format_options in (5, {'profile': 'fast', 'extra': 1},
+                               {'args': '-m 0'}, 'turbo', ['-E'],
+                               {'profile': 'fast', 'args': ['-m', '0', '-E']}):
+            self.assertRaises(objects.InvalidConfigException,
+                              self._from_json, format_options)
+
+    def test_profile_filesystem(self):
+        self.assertRaises(objects.InvalidConfigException,
+                          self._from_json, 'largefile', 'xfs')
+        # The filesystem may be given later for raid members and such
+        self.assertEqual('largefile', self._from_json('largefile',
+                                                      None).format_options)
+
+
+class TestAlign(base.BaseTestCase):
+    def _from_json(self, align):
+        return objects.StandardPartition.from_json(
+            {'name': 'a', 'disks': ['sda'], 'size': '1 GiB', 'align': align})
+
+    def test_valid(self):
+        self.assertEqual('4 MiB', self._from_json('4 MiB').align)
+        self.assertIsNone(self._from_json(None).align)
+
+    def test_invalid(self):
+        for align in ('wide', '0', [4096]):
+            self.assertRaises(objects.InvalidConfigException,
+                              self._from_json, align)
+
+
+class TestMountOptions(base.BaseTestCase):
+    def _from_json(self, mount_options, type_name='standard'):
+        return objects.object_from_json(
+            {'type': type_name, 'name': 'a', 'disks': ['sda', 'sdb'],
+             'size': '1 GiB', 'level': 1, 'filesystem': 'xfs',
+             'mount_options': mount_options})
+
+    def test_valid(self):
+        for mount_options in (None, 'auto', ['noatime'],
+                              {'profile': 'ssd', 'options': ['nobarrier']}):
+            for type_name in ('standard', 'raid'):
+                obj = self._from_json(mount_options, type_name)
+                self.assertEqual(mount_options, obj.mount_options)
+
+    def test_invalid(self):
+        for mount_options in (5, {'profile': 'ssd', 'args': []},
+                              {'options': 'noatime'}, 'tape',
+                              {'profile': 'tape', 'options': []}):
+            self.assertRaises(objects.InvalidConfigException,
+                              self._from_json, mount_options)
+
+
+class TestWipe(base.BaseTestCase):
+    def _obj(self, disks, wipe):
+        return objects.StandardPartition.from_json(
+            {'name': 'a', 'disks': disks, 'size': '1 GiB', 'wipe': wipe})
+
+    def test_wipe_requests(self):
+        objs = [self._obj(['sda', 'sdb'], True),
+                self._obj(['sdb'], 'signatures'),
+                self._obj(['sdc'], 'zero'),
+                self._obj(['sdd'], False)]
+        self.assertEqual({'sda': 'signatures', 'sdb': 'signatures',
+                          'sdc': 'zero'},
+                         objects.wipe_requests(objs))
+
+    def test_conflicting_modes(self):
+        objs = [self._obj(['sda'], 'zero'), self._obj(['sda'], 'discard')]
+        self.assertRaises(objects.InvalidConfigException,
+                          objects.wipe_requests, objs)
+
+    def test_invalid_mode(self):
+        self.assertRaises(objects.InvalidConfigException,
+                          self._obj, ['sda'], 'shred')
+
+
+class TestObjectsFromJson(base.BaseTestCase):
+    def _part(self, name, **kwargs):
+        json = {'type': 'standard', 'name': name, 'disks': ['sda'],
+                'size': '1 GiB'}
+        json.update(kwargs)
+        return json
+
+    def test_objects_from_json(self):
+        objs = objects.objects_from_json([self._part('a'), self._part('b')])
+        self.assertEqual(['a', 'b'], [o.name for o in objs])
+        self.assertIsInstance(objs[0], objects.StandardPartition)
+        self.assertEqual('standard', objs[0].type_name)
+        # Disk names are shared between objects
+        self.assertIs(objs[0].disks[0], objs[1].disks[0])
+
+    def test_slots(self):
+        obj = objects.object_from_json(self._part('a'))
+        self.assertFalse(hasattr(obj, '__dict__'))
+        self.assertRaises(AttributeError, setattr, obj, 'typo', 1)
+
+    def test_unknown_type(self):
+        self.assertRaises(objects.InvalidConfigException,
+                          objects.object_from_json,
+                          self._part('a', type='floppy'))
+
+    def test_errors_name_entry(self):
+        e = self.assertRaises(objects.InvalidConfigException,
+                              objects.objects_from_json,
+                              [self._part('a'), self._part('b', disks='sda')])
+        self.assertIn('entry 1', str(e))
+
+    def test_duplicate_name(self):
+        self.assertRaises(objects.InvalidConfigException,
+                          objects.objects_from_json,
+                          [self._part('a'), self._part('a')])
+
+    def test_not_an_object(self):
+        self.assertRaises(objects.InvalidConfigException,
+                          objects.objects_from_json, ['sda'])
+
+
+class TestDiskSelectors(base.BaseTestCase):
+    def _obj(self, disks):
+        return objects.StandardPartition.from_json(
+            {'name': 'a', 'disks': disks, 'size': '1 GiB'})
+
+    def test_valid(self):
+        selector = {'rotational': False, 'unused': True, 'min_size': '1 TiB',
+                    'order': 'smallest', 'count': 2}
+        self.assertEqual(['sda', selector],
+                         self._obj(['sda', selector]).disks)
+
+    def test_invalid(self):
+        for selector in ({'colour': 'red'}, {'count': 2},
+                         {'rotational': 'yes'}, {'min_size': 'big'},
+                         {'model': 'X', 'count': 0},
+                         {'model': 'X', 'order': 'random'}):
+            self.assertRaises(objects.InvalidConfigException,
+                              self._obj, [selector])
+
+    def test_invalid_entry(self):
+        self.assertRaises(objects.InvalidConfigException, self._obj, [1])
+
+
+class TestRaidArray(base.BaseTestCase):
+    def _from_json(self, **kwargs):
+        json = {'type': 'raid', 'name': 'md0', 'level': 1,
+                'disks': ['sda', 'sdb']}
+        json.update(kwargs)
+        return objects.object_from_json(json)
+
+    def test_from_json(self):
+        obj = self._from_json(level='10', chunk='512 KiB', bitmap='internal',
+                              assume_clean=True, sync_speed_min=50000,
+                              sync_speed_max=500000, filesystem='xfs',
+                              mountpoint='/srv')
+        self.assertIsInstance(obj, objects.RaidArray)
+        self.assertEqual('raid10', obj.level)
+        self.assertEqual(['sda', 'sdb'], obj.disks)
+        self.assertIsNone(obj.size)
+        self.assertEqual('512 KiB', obj.chunk)
+        self.assertTrue(obj.assume_clean)
+        self.assertEqual((50000, 500000),
+                         (obj.sync_speed_min, obj.sync_speed_max))
+        self.assertEqual('raid0', self._from_json(level=0).level)
+
+    def test_invalid(self):
+        for kwargs in ({'level': None}, {'level': 'raid7'},
+                       {'level': 5}, {'disks': [], 'partitions': []},
+                       {'chunk': '64 KiB'}, {'chunk': 'big', 'level': 0},
+                       {'bitmap': 'external'},
+                       {'bitmap': 'internal', 'level': 0},
+                       {'assume_clean': 'yes'}, {'sync_speed_min': 0},
+                       {'sync_speed_min': 10, 'sync_speed_max': 5},
+                       {'partitions': 'a'}):
+            self.assertRaises(objects.InvalidConfigException,
+                              self._from_json, **kwargs)
+
+    def test_selectors_counted_later(self):
+        obj = self._from_json(level=6, disks=[{'rotational': True}])
+        self.assertEqual([{'rotational': True}], obj.disks)
+        obj.disks = ['sda', 'sdb', 'sdc']
+        e = self.assertRaises(objects.InvalidConfigException,
+                              objects.check_disks, [obj])
+        self.assertEqual('md0: raid6 needs at least 4 members', str(e))
+        obj.disks.append('sdd')
+        objects.check_disks([obj])
+
+    def _part(self, name, **kwargs):
+        json = {'type': 'standard', 'name': name, 'disks': ['sda'],
+                'size': '1 GiB'}
+        json.update(kwargs)
+        return json
+
+    def _raid(self, partitions):
+        return {'type': 'raid', 'name': 'md0', 'level': 1,
+                'partitions': partitions}
+
+    def test_partition_members(self):
+        objs = objects.objects_from_json([self._part('a'), self._part('b'),
+                                          self._raid(['a', 'b'])])
+        self.assertEqual(['a', 'b'], objs[2].references())
+
+    def test_invalid_partition_members(self):
+        for json_list in ([self._raid(['a', 'b']), self._part('a'),
+                           self._part('b')],
+                          [self._part('a', filesystem='xfs'), self._part('b'),
+                           self._raid(['a', 'b'])],
+                          [self._part('a'), self._part('b'),
+                           self._raid(['a', 'b']), self._raid(['a', 'b'])]):
+            self.assertRaises(objects.InvalidConfigException,
+                              objects.objects_from_json, json_list)
+
+
+class TestLvm(base.BaseTestCase):
+    def _vg(self, **kwargs):
+        json = {'type': 'volume_group', 'name': 'vg0',
+                'disks': ['sda', 'sdb']}
+        json.update(kwargs)
+        return json
+
+    def _lv(self, name='lv0', **kwargs):
+        json = {'type': 'logical_volume', 'name': name,
+                'volume_group': 'vg0', 'size': '10 GiB'}
+        json.update(kwargs)
+        return json
+
+    def test_from_json(self):
+        objs = objects.objects_from_json([
+            self._vg(pe_size='4 MiB'),
+            self._lv(stripes=2, stripe_size='64 KiB', filesystem='xfs',
+                     mountpoint='/srv'),
+            self._lv('pool', thin_pool=True, metadata_size='1 GiB',
+                     chunk='64 KiB'),
+            self._lv('thin', pool='pool', size='1 TiB'),
+            self._lv('rest', size=None)])
+        vg, lv, pool, thin, rest = objs
+        self.assertIsInstance(vg, objects.VolumeGroup)
+        self.assertEqual(['sda', 'sdb'], objects.referenced_disks([vg]))
+        self.assertEqual('4 MiB', vg.pe_size)
+        self.assertEqual((2, '64 KiB'), (lv.stripes, lv.stripe_size))
+        self.assertEqual([], lv.disks)
+        self.assertTrue(pool.thin_pool)
+        self.assertEqual(['vg0', 'pool'], thin.references())
+        self.assertIsNone(rest.size)
+
+    def test_invalid(self):
+        for lv in ({'stripes': 0}, {'stripe_size': '64 KiB'},
+                   {'stripes': 2, 'size': None},
+                   {'stripes': 2, 'stripe_size': '96 KiB'},
+                   {'stripes': 2, 'stripe_size': '2 KiB'},
+                   {'thin_pool': 'yes'}, {'metadata_size': '1 GiB'},
+                   {'thin_pool': True, 'stripes': 2},
+                   {'thin_pool': True, 'filesystem': 'xfs'},
+                   {'pool': 'pool', 'size': None}):
+            self.assertRaises(objects.InvalidConfigException,
+                              objects.object_from_json, self._lv(**lv))
+        self.assertRaises(objects.InvalidConfigException,
+                          objects.object_from_json,
+                          self._vg(filesystem='xfs'))
+
+    def test_invalid_references(self):
+        for json_list in ([self._lv(), self._vg()],
+                          [self._vg(name='vg0', type='raid', level=1),
+                           self._lv()],
+                          [self._vg(), self._lv('pool'),
+                           self._lv(pool='pool')],
+                          [self._vg(), self._vg(name='vg1'),
+                           self._lv('pool', volume_group='vg1',
+                                    thin_pool=True),
+                           self._lv(pool='pool')]):
+            self.assertRaises(objects.InvalidConfigException,
+                              objects.objects_from_json, json_list)
+
+    def test_shared_volume_group(self):
+        objs = objects.objects_from_json([self._vg(), self._lv('a'),
+                                          self._lv('b')])
+        self.assertEqual(3, len(objs))
+
+
+class TestQueueTuning(base.BaseTestCase):
+    def test_from_json(self):
+        tunings = objects.queue_tunings_from_json([
+            {'disks': [{'rotational': False}], 'scheduler': 'none',
+             'read_ahead_kb': 0},
+            {'disks': ['sda'], 'nr_requests': 256}])
+        self.assertEqual([('scheduler', 'none'), ('read_ahead_kb', 0)],
+                         tunings[0].settings())
+        self.assertEqual('queue_tuning[1]', tunings[1].name)
+        self.assertEqual([], objects.queue_tunings_from_json(None))
+
+    def test_invalid(self):
+        for json in ({'scheduler': 'none'}, {'disks': ['sda']},
+                     {'disks': ['sda'], 'scheduler': 'mq deadline'},
+                     {'disks': ['sda'], 'read_ahead_kb': -1},
+                     {'disks': ['sda'], 'nr_requests': 0},
+                     {'disks': ['sda'], 'nr_requests': True},
+                     {'disks': ['sda'], 'rq_affinity': 2}):
+            e = self.assertRaises(objects.InvalidConfigException,
+                                  objects.queue_tunings_from_json, [json])
+            self.assertIn('entry 0', str(e))
+        self.assertRaises(objects.InvalidConfigException,
+                          objects.queue_tunings_from_json, {'sda': {}})
@@ -0,0 +1,267 @@
+# Copyright 2015 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+
+import fixtures
+from oslotest import base
+
+from os_disk_config import objects
+from os_disk_config import planner
+
+GIB = 1024 ** 3
+
+
+def _disk(size, logical=512, physical=512, alignment_offset=0,
+          optimal=0):
+    return {'size': size, 'logical_block_size': logical,
+            'physical_block_size': physical, 'minimum_io_size': physical,
+            'optimal_io_size': optimal, 'alignment_offset': alignment_offset}
+
+
+class TestIoAlignment(base.BaseTestCase):
+    def test_default(self):
+        self.assertEqual(1024 ** 2, planner.io_alignment(_disk(GIB)))
+        self.assertEqual(1024 ** 2,
+                         planner.io_alignment(_disk(GIB, 4096, 4096)))
+
+    def test_raid_stripe(self):
+        # Three data disks with a 64 KiB chunk
+        self.assertEqual(3 * 1024 ** 2,
+                         planner.io_alignment(_disk(GIB, optimal=196608)))
+        self.assertEqual(4 * 1024 ** 2,
+                         planner.io_alignment(_disk(GIB,
+                                                    optimal=4 * 1024 ** 2)))
+
+    def test_bogus_hints_ignored(self):
+        for optimal in (33553920, 1000):
+            self.assertEqual(1024 ** 2,
+                             planner.io_alignment(_disk(GIB, optimal=optimal)))
+
+    def test_alignment_offset(self):
+        self.assertEqual(3584, planner.alignment_offset(
+            _disk(GIB, alignment_offset=3584)))
+        self.assertEqual(0, planner.alignment_offset(
+            _disk(GIB, alignment_offset=-1)))
+
+
+class TestPlan(base.BaseTestCase):
+    def setUp(self):
+        super(TestPlan, self).setUp()
+        tmpdir = self.useFixture(fixtures.TempDir()).path
+        self.fstab = os.path.join(tmpdir, 'fstab')
+        self.snapshot = {'sda': _disk(10 * GIB), 'sdb': _disk(20 * GIB),
+                         'nvme0n1': _disk(10 * GIB, 4096, 4096)}
+
+    def _plan(self, *objs):
+        return planner.plan(list(objs), self.snapshot, self.fstab)
+
+    def _part(self, name, disks, size, filesystem=None, mountpoint=None):
+        return objects.StandardPartition(name, disks, size, filesystem,
+                                         mountpoint)
+
+    def test_sequential_layout(self):
+        layout = self._plan(self._part('a', ['sda'], '1 GiB', 'xfs', '/a'),
+                            self._part('b', ['sda'], '100 MB'),
+                            self._part('c', ['sda'], '1 GiB'))
+        sda = layout['disks']['sda']
+        self.assertEqual(512, sda['sector_size'])
+        self.assertEqual(1024 ** 2, sda['alignment'])
+        parts = sda['partitions']
+        self.assertEqual(['/dev/sda1', '/dev/sda2', '/dev/sda3'],
+                         [p['device'] for p in parts])
+        self.assertEqual(2048, parts[0]['start'])
+        self.assertEqual(2048 + 2 * 1024 ** 2 - 1, parts[0]['end'])
+        self.assertEqual(GIB, parts[0]['size'])
+        # 100 MB is not a whole number of MiB, so the next start rounds up
+        self.assertEqual(parts[0]['end'] + 1, parts[1]['start'])
+        self.assertEqual(0, parts[2]['start'] % 2048)
+        self.assertTrue(all(p['aligned'] for p in parts))
+        self.assertEqual(['/dev/sda1 /a xfs defaults 0 1'], layout['fstab'])
+
+    def test_nvme_4k_sectors(self):
+        layout = self._plan(self._part('a', ['/dev/nvme0n1'], '1 GiB'))
+        disk = layout['disks']['nvme0n1']
+        self.assertEqual(4096, disk['sector_size'])
+        part = disk['partitions'][0]
+        self.assertEqual('/dev/nvme0n1p1', part['device'])
+        self.assertEqual(256, part['start'])
+        self.assertEqual(GIB // 4096, part['end'] - part['start'] + 1)
+
+    def test_most_free_disk(self):
+        layout = self._plan(self._part('a', ['sda', 'sdb'], '1 GiB'),
+                            self._part('b', ['sda', 'sdb'], '1 GiB'))
+        self.assertEqual(['a', 'b'], [p['name'] for p in
+                                      layout['disks']['sdb']['partitions']])
+        self.assertEqual([], layout['disks']['sda']['partitions'])
+
+    def test_alignment_offset(self):
+        self.snapshot['sda'] = _disk(10 * GIB, alignment_offset=3584)
+        part = self._plan(self._part('a', ['sda'], '1 GiB'))
+        start = part['disks']['sda']['partitions'][0]['start']
+        self.assertEqual(2048 + 7, start)
+
+    def test_does_not_fit(self):
+        self.assertRaises(planner.PlanningException, self._plan,
+                          self._part('a', ['sda'], '10 GiB'))
+
+    def test_missing_disk(self):
+        self.assertRaises(planner.PlanningException, self._plan,
+                          self._part('a', ['sdz'], '1 GiB'))
+
+    def test_existing_fstab_entry(self):
+        with open(self.fstab, 'w') as f:
+            f.write('/dev/vda1 /a ext4 defaults 0 1\n')
+        layout = self._plan(self._part('a', ['sda'], '1 GiB', 'xfs', '/a'))
+        self.assertEqual([], layout['fstab'])
+
+    def test_raid(self):
+        objs = [self._part('a', ['sda'], '1 GiB'),
+                self._part('b', ['sdb'], '1 GiB'),
+                objects.RaidArray('data', ['sda', 'sdb'], None, 'xfs',
+                                  '/srv', 'raid1'),
+                objects.RaidArray('small', [], None, None, None, 'raid1',
+                                  partitions=['a', 'b'])]
+        layout = self._plan(*objs)
+        sda = layout['disks']['sda']['partitions']
+        self.assertEqual(['a', 'data'], [p['name'] for p in sda])
+        # Fills the rest of the disk
+        self.assertEqual(10 * GIB // 512 - 34, sda[1]['end'])
+        data = layout['arrays']['data']
+        self.assertEqual('/dev/md/data', data['device'])
+        self.assertEqual(['/dev/sda2', '/dev/sdb2'], data['members'])
+        self.assertEqual(['/dev/sda1', '/dev/sdb1'],
+                         layout['arrays']['small']['members'])
+        self.assertEqual(['/dev/md/data /srv xfs defaults 0 1'],
+                         layout['fstab'])
+
+    def test_stripe_geometry(self):
+        self.snapshot['sdc'] = _disk(10 * GIB, optimal=196608)
+        self.snapshot['sdc']['minimum_io_size'] = 65536
+        objs = [objects.RaidArray('data', ['sda', 'sdb', 'nvme0n1'], None,
+                                  'xfs', '/srv', 'raid5', chunk='128 KiB'),
+                objects.StandardPartition('lun', ['sdc'], '1 GiB', 'ext4',
+                                          None, format_options=['-m', '0'])]
+        layout = self._plan(*objs)
+        data = layout['arrays']['data']
+        self.assertEqual({'unit': 128 * 1024, 'data_disks': 2},
+                         data['stripe'])
+        self.assertEqual(['-d', 'su=131072,sw=2'], data['mkfs_args'])
+        lun = layout['disks']['sdc']['partitions'][0]
+        self.assertEqual({'unit': 65536, 'data_disks': 3}, lun['stripe'])
+        self.assertEqual(['-m', '0', '-E', 'stride=16,stripe_width=48'],
+                         lun['mkfs_args'])
+        member = layout['disks']['sda']['partitions'][0]
+        self.assertIsNone(member['stripe'])
+        self.assertIsNone(member['mkfs_args'])
+
+    def test_mount_options(self):
+        self.snapshot['sda']['rotational'] = True
+        self.snapshot['nvme0n1']['transport'] = 'nvme'
+        objs = objects.objects_from_json([
+            {'type': 'standard', 'name': 'fast', 'disks': ['nvme0n1'],
+             'size': '1 GiB', 'filesystem': 'ext4', 'mountpoint': '/fast',
+             'mount_options': 'auto'},
+            {'type': 'raid', 'name': 'md0', 'level': 1,
+             'disks': ['sda', 'nvme0n1'], 'filesystem': 'xfs',
+             'mountpoint': '/srv', 'mount_options': 'auto'},
+            {'type': 'standard', 'name': 'plain', 'disks': ['sdb'],
+             'size': '1 GiB', 'filesystem': 'xfs', 'mountpoint': '/plain'}])
+        layout = self._plan(*objs)
+        fast = layout['disks']['nvme0n1']['partitions'][0]
+        self.assertEqual('noatime,nodiratime,discard', fast['mount_options'])
+        # The slowest disk in the array decides
+        self.assertEqual('noatime,nodiratime,inode64,logbsize=256k',
+                         layout['arrays']['md0']['mount_options'])
+        self.assertEqual(
+            ['/dev/nvme0n1p1 /fast ext4 noatime,nodiratime,discard 0 1',
+             '/dev/md/md0 /srv xfs noatime,nodiratime,inode64,logbsize=256k '
+             '0 1',
+             '/dev/sdb1 /plain xfs defaults 0 1'],
+            layout['fstab'])
+
+    def test_unknown_profile(self):
+        obj = objects.StandardPartition('a', ['sda'], '1 GiB', 'xfs', None,
+                                        format_options='largefile')
+        self.assertRaises(planner.PlanningException, self._plan, obj)
+
+    def test_optimal_io_size(self):
+        self.snapshot['sdc'] = _disk(10 * GIB, optimal=196608)
+        layout = self._plan(self._part('a', ['sdc'], '1 GiB'),
+                            self._part('b', ['sdc'], '1 GiB'))
+        sdc = layout['disks']['sdc']
+        self.assertEqual(3 * 1024 ** 2, sdc['alignment'])
+        starts = [p['start'] for p in sdc['partitions']]
+        self.assertEqual([6144, 343 * 6144], starts)
+        for part in sdc['partitions']:
+            self.assertEqual(0, part['start'] * 512 % 196608)
+            self.assertEqual(3 * 1024 ** 2, part['alignment'])
+            self.assertTrue(part['aligned'])
+
+    def test_align_override(self):
+        objs = objects.objects_from_json([
+            {'type': 'standard', 'name': 'a', 'disks': ['sda'],
+             'size': '1 MiB'},
+            {'type': 'standard', 'name': 'b', 'disks': ['sda'],
+             'size': '1 GiB', 'align': '8 MiB'},
+            {'type': 'standard', 'name': 'c', 'disks': ['sda'],
+             'size': '1 GiB', 'align': '4 KiB'}])
+        a, b, c = self._plan(*objs)['disks']['sda']['partitions']
+        self.assertEqual(2048, a['start'])
+        self.assertEqual(16384, b['start'])
+        self.assertEqual(8 * 1024 ** 2, b['alignment'])
+        self.assertEqual(b['end'] + 1, c['start'])
+        # An override smaller than the disk alignment does not lower it
+        self.assertEqual(1024 ** 2, c['alignment'])
+
+    def test_align_override_stripe(self):
+        self.snapshot['sdc'] = _disk(10 * GIB, optimal=196608)
+        obj = objects.StandardPartition('a', ['sdc'], '1 GiB', None, None,
+                                        align='4 MiB')
+        part = self._plan(obj)['disks']['sdc']['partitions'][0]
+        # Both the 4 MiB override and the 3 MiB stripe alignment
+        self.assertEqual(12 * 1024 ** 2, part['alignment'])
+        self.assertEqual(24576, part['start'])
+        self.assertTrue(part['aligned'])
+
+    def test_align_not_whole_sectors(self):
+        obj = objects.StandardPartition('a', ['nvme0n1'], '1 GiB', None, None,
+                                        align='512')
+        self.assertRaises(planner.PlanningException, self._plan, obj)
+
+    def test_lvm(self):
+        objs = objects.objects_from_json([
+            {'type': 'volume_group', 'name': 'vg-data',
+             'disks': ['sda', 'sdb']},
+            {'type': 'logical_volume', 'name': 'srv', 'size': '4 GiB',
+             'volume_group': 'vg-data', 'stripes': 2, 'filesystem': 'xfs',
+             'mountpoint': '/srv'},
+            {'type': 'logical_volume', 'name': 'pool', 'size': None,
+             'volume_group': 'vg-data', 'thin_pool': True}])
+        layout = self._plan(*objs)
+        vg = layout['volume_groups']['vg-data']
+        self.assertEqual(['/dev/sda1', '/dev/sdb1'], vg['physical_volumes'])
+        srv, pool = vg['logical_volumes']
+        self.assertEqual('/dev/mapper/vg--data-srv', srv['device'])
+        self.assertEqual(2, srv['stripes'])
+        self.assertTrue(pool['thin_pool'])
+        self.assertEqual(['/dev/mapper/vg--data-srv /srv xfs defaults 0 1'],
+                         layout['fstab'])
+
+    def test_too_many_stripes(self):
+        objs = objects.objects_from_json([
+            {'type': 'volume_group', 'name': 'vg0', 'disks': ['sda']},
+            {'type': 'logical_volume', 'name': 'lv0', 'size': '1 GiB',
+             'volume_group': 'vg0', 'stripes': 2}])
+        self.assertRaises(planner.PlanningException, self._plan, *objs)
@@ -0,0 +1,79 @@
+# Copyright 2015 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+
+import fixtures
+from oslotest import base
+
+from os_disk_config import probe_cache
+
+
+class TestProbeCache(base.BaseTestCase):
+    def setUp(self):
+        super(TestProbeCache, self).setUp()
+        tmpdir = self.useFixture(fixtures.TempDir()).path
+        self.sys_block = os.path.join(tmpdir, 'block')
+        self.udev = os.path.join(tmpdir, 'udev')
+        os.makedirs(os.path.join(self.sys_block, 'sdb'))
+        os.makedirs(self.udev)
+        self._write(os.path.join(self.sys_block, 'sdb', 'size'), '2048')
+        self._write(os.path.join(self.sys_block, 'sdb', 'dev'), '8:16')
+        self._write(os.path.join(self.udev, 'b8:16'), '')
+        self.useFixture(fixtures.MonkeyPatch(
+            'os_disk_config.utils._SYS_BLOCK', self.sys_block))
+        self.useFixture(fixtures.MonkeyPatch(
+            'os_disk_config.probe_cache._RUN_UDEV_DATA', self.udev))
+        self.filename = os.path.join(tmpdir, 'state', 'devices.json')
+
+    def _write(self, path, data):
+        with open(path, 'w') as f:
+            f.write(data)
+
+    def test_fingerprint(self):
+        first = probe_cache.disk_fingerprint('sdb')
+        self.assertEqual(first, probe_cache.disk_fingerprint('sdb'))
+        self._write(os.path.join(self.sys_block, 'sdb', 'size'), '4096')
+        second = probe_cache.disk_fingerprint('sdb')
+        self.assertNotEqual(first, second)
+        # A new filesystem found by udev also changes it
+        self._write(os.path.join(self.udev, 'b8:16'),
+                    'I:1234\nE:ID_FS_TYPE=xfs\n')
+        third = probe_cache.disk_fingerprint('sdb')
+        self.assertNotEqual(second, third)
+        # udev rebuilding its database at boot does not
+        self._write(os.path.join(self.udev, 'b8:16'),
+                    'I:5678\nE:ID_FS_TYPE=xfs\n')
+        os.utime(os.path.join(self.udev, 'b8:16'), (0, 0))
+        self.assertEqual(third, probe_cache.disk_fingerprint('sdb'))
+
+    def test_fingerprint_missing_disk(self):
+        self.assertIsNone(probe_cache.disk_fingerprint('sdz'))
+
+    def test_cache(self):
+        records = [{'name': 'sdb', 'parents': []}]
+        cache = probe_cache.ProbeCache(self.filename)
+        self.assertIsNone(cache.get('sdb', 'fp1'))
+        cache.update('sdb', 'fp1', records)
+        cache.save()
+
+        cache = probe_cache.ProbeCache(self.filename)
+        self.assertEqual(records, cache.get('sdb', 'fp1'))
+        self.assertIsNone(cache.get('sdb', 'fp2'))
+
+    def test_corrupt_cache(self):
+        os.makedirs(os.path.dirname(self.filename))
+        self._write(self.filename, '{not json')
+        cache = probe_cache.ProbeCache(self.filename)
+        self.assertIsNone(cache.get('sdb', 'fp1'))
@@ -0,0 +1,151 @@
+# Copyright 2015 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from oslotest import base
+
+from os_disk_config import objects
+from os_disk_config import profiles
+
+
+class TestFormatArgs(base.BaseTestCase):
+    def test_no_options(self):
+        self.assertEqual([], profiles.format_args('ext4', None))
+
+    def test_raw_args(self):
+        self.assertEqual(['-m', '0'], profiles.format_args('ext4',
+                                                           ['-m', '0']))
+
+    def test_profile(self):
+        self.assertEqual(['-K'], profiles.format_args('xfs', 'fast'))
+        self.assertEqual(
+            ['-E', 'lazy_itable_init=1,lazy_journal_init=1,nodiscard'],
+            profiles.format_args('ext4', 'fast'))
+
+    def test_profile_and_args(self):
+        self.assertEqual(
+            ['-K', '-f'],
+            profiles.format_args('xfs', {'profile': 'nodiscard',
+                                         'args': ['-f']}))
+
+    def test_unknown_profile(self):
+        self.assertRaises(objects.InvalidConfigException,
+                          profiles.format_args, 'xfs', 'largefile')
+        self.assertRaises(objects.InvalidConfigException,
+                          profiles.format_args, 'ext4', 'turbo')
+
+    def test_dangling_extended_option(self):
+        self.assertRaises(objects.InvalidConfigException,
+                          profiles.format_args, 'ext4', ['-m', '0', '-E'])
+
+    def test_stripe_geometry(self):
+        self.assertEqual(['-d', 'su=65536,sw=3'],
+                         profiles.format_args('xfs', None, (65536, 3)))
+        self.assertEqual(
+            ['-E', 'stride=16,stripe_width=48,lazy_itable_init=1,'
+             'lazy_journal_init=1,nodiscard'],
+            profiles.format_args('ext4', 'fast', (65536, 3)))
+
+    def test_stripe_geometry_overridden(self):
+        self.assertEqual(['-d', 'su=4k,sw=2'],
+                         profiles.format_args('xfs', ['-d', 'su=4k,sw=2'],
+                                              (65536, 3)))
+
+
+class TestStripeArgs(base.BaseTestCase):
+    def test_ext_block_size(self):
+        self.assertEqual(['-E', 'stride=64,stripe_width=128'],
+                         profiles.stripe_args('ext4', (65536, 2),
+                                              ['-b', '1024']))
+        # The unit is smaller than a block
+        self.assertEqual([], profiles.stripe_args('ext4', (2048, 2)))
+
+    def test_no_stripe_settings(self):
+        self.assertEqual([], profiles.stripe_args('vfat', (65536, 2)))
+        self.assertEqual([], profiles.stripe_args('xfs', None))
+
+
+class TestStripeGeometry(base.BaseTestCase):
+    def _raid(self, level, disks, chunk=None):
+        return objects.RaidArray('md0', disks, None, 'xfs', None, level,
+                                 chunk=chunk)
+
+    def test_raid(self):
+        disks = ['sda', 'sdb', 'sdc', 'sdd']
+        self.assertEqual((65536, 3), profiles.stripe_geometry(
+            self._raid('raid5', disks, '64 KiB')))
+        self.assertEqual((512 * 1024, 2), profiles.stripe_geometry(
+            self._raid('raid6', disks)))
+        self.assertEqual((512 * 1024, 2), profiles.stripe_geometry(
+            self._raid('raid10', disks)))
+        self.assertIsNone(profiles.stripe_geometry(
+            self._raid('raid1', disks[:2])))
+
+    def test_logical_volume(self):
+        lv = objects.LogicalVolume('lv0', 'vg0', '1 GiB', 'xfs', stripes=4)
+        self.assertEqual((65536, 4), profiles.stripe_geometry(lv))
+        lv.stripe_size = '256 KiB'
+        self.assertEqual((256 * 1024, 4), profiles.stripe_geometry(lv))
+        self.assertIsNone(profiles.stripe_geometry(
+            objects.LogicalVolume('lv1', 'vg0', '1 GiB', 'xfs')))
+
+    def test_partition_hints(self):
+        part = objects.StandardPartition('a', ['sda', 'sdb'], '1 GiB', 'xfs',
+                                         None)
+        lun = {'physical_block_size': 512, 'minimum_io_size': 65536,
+               'optimal_io_size': 262144}
+        disk = {'physical_block_size': 4096, 'minimum_io_size': 4096,
+                'optimal_io_size': 0}
+        self.assertEqual((65536, 4),
+                         profiles.stripe_geometry(part, [lun, lun]))
+        self.assertIsNone(profiles.stripe_geometry(part, [lun, disk]))
+        self.assertIsNone(profiles.stripe_geometry(part, [disk]))
+        self.assertIsNone(profiles.stripe_geometry(part))
+
+
+class TestMountOptions(base.BaseTestCase):
+    HDD = {'rotational': True, 'transport': 'sas'}
+    SSD = {'rotational': False, 'transport': 'sata'}
+    NVME = {'rotational': False, 'transport': 'nvme'}
+
+    def test_defaults(self):
+        self.assertEqual('defaults', profiles.mount_options('xfs', None))
+        self.assertEqual('defaults', profiles.mount_options('xfs', []))
+
+    def test_profile(self):
+        self.assertEqual('noatime,nodiratime,commit=60',
+                         profiles.mount_options('ext4', 'hdd'))
+        self.assertEqual('noatime,nodiratime',
+                         profiles.mount_options('vfat', 'nvme'))
+
+    def test_options(self):
+        self.assertEqual('noatime,nodiratime,discard,nobarrier',
+                         profiles.mount_options(
+                             'ext4', {'profile': 'nvme',
+                                      'options': ['noatime', 'nobarrier']}))
+        self.assertEqual('ro', profiles.mount_options('xfs', ['ro']))
+
+    def test_auto(self):
+        self.assertEqual('noatime,nodiratime,inode64,logbsize=256k,discard',
+                         profiles.mount_options('xfs', 'auto', [self.NVME]))
+        self.assertEqual('defaults', profiles.mount_options('xfs', 'auto'))
+
+    def test_device_class(self):
+        self.assertEqual('hdd', profiles.device_class([self.NVME, self.HDD]))
+        self.assertEqual('ssd', profiles.device_class([self.NVME, self.SSD]))
+        self.assertEqual('nvme', profiles.device_class([self.NVME]))
+        self.assertIsNone(profiles.device_class([]))
+
+    def test_unknown_profile(self):
+        self.assertRaises(objects.InvalidConfigException,
+                          profiles.mount_options, 'xfs', 'tape')
@@ -0,0 +1,154 @@
+# Copyright 2015 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Behaviour every provider must share, run against each of them."""
+
+import os
+
+import fixtures
+import mock
+from oslotest import base
+
+from os_disk_config import impl_base
+from os_disk_config import objects
+from os_disk_config import providers
+from os_disk_config.tests import test_impl_blivet
+
+GIB = 1024 ** 3
+UUID = '11111111-2222-3333-4444-555555555555'
+
+
+def _make_blivet_provider(test):
+    """Return a BlivetDiskConfig on a mocked devicetree with sda and sdb"""
+    from os_disk_config import impl_blivet
+
+    blivet_instance = mock.Mock()
+    test.useFixture(fixtures.MockPatch('blivet.Blivet',
+                                       return_value=blivet_instance))
+    test.useFixture(fixtures.MockPatch('blivet.partitioning.doPartitioning'))
+    test.useFixture(fixtures.MockPatch('blivet.formats.getFormat'))
+    sda = test_impl_blivet._mock_device('sda', 'disk')
+    sdb = test_impl_blivet._mock_device('sdb', 'disk')
+    blivet_instance.devices = [sda, sdb]
+    blivet_instance.devicetree.findActions.return_value = []
+
+    def _new_partition(size, parents, weight):
+        partition = test_impl_blivet._mock_device('%s1' % parents[0].name,
+                                                  'partition', parents)
+        partition.disks = parents
+        partition.format.name = 'xfs'
+        partition.format.options = 'defaults'
+        partition.format.dump = False
+        test.executed.append(partition.format.mount)
+        return partition
+    blivet_instance.newPartition.side_effect = _new_partition
+    test.executed.append(blivet_instance.doIt)
+    return impl_blivet.BlivetDiskConfig()
+
+
+def _make_sfdisk_provider(test):
+    """Return a SfdiskDiskConfig for a snapshot with sda and sdb"""
+    from os_disk_config import impl_sfdisk
+
+    disk = {'size': 10 * GIB, 'logical_block_size': 512,
+            'physical_block_size': 512, 'alignment_offset': 0}
+    test.useFixture(fixtures.MockPatch(
+        'os_disk_config.utils.block_devices_snapshot',
+        return_value={'sda': dict(disk), 'sdb': dict(disk)}))
+    run = test.useFixture(fixtures.MockPatch(
+        'os_disk_config.impl_sfdisk._run')).mock
+    test.executed.append(run)
+    return impl_sfdisk.SfdiskDiskConfig()
+
+
+class ProviderTests(object):
+    """Tests run against every provider.
+
+    Subclasses set make_provider to a function that takes the test case and
+    returns a provider with disks sda and sdb, appending to test.executed
+    every mock that actually changes the system.
+    """
+    make_provider = None
+
+    def setUp(self):
+        super(ProviderTests, self).setUp()
+        # Mocks that must not be called in noop mode
+        self.executed = []
+        self.provider = self.make_provider(self)
+        tmpdir = self.useFixture(fixtures.TempDir()).path
+        self.provider._fstab.filename = os.path.join(tmpdir, 'fstab')
+        self.mountpoint = os.path.join(tmpdir, 'a')
+        self.provider._uuids = mock.Mock()
+        self.provider._uuids.get.return_value = UUID
+
+    def _add(self, disks):
+        self.provider.add_object(objects.StandardPartition(
+            'a', disks, '1 GiB', 'xfs', self.mountpoint))
+
+    def test_is_provider(self):
+        self.assertIsInstance(self.provider, impl_base.DiskConfigBase)
+
+    def test_disks(self):
+        self.assertEqual(['/dev/sda', '/dev/sdb'],
+                         sorted(self.provider.disks()))
+
+    def test_apply_noop(self):
+        self._add(['sda'])
+        changes = self.provider.apply(noop=True)
+        diff = changes[self.provider._fstab.filename]
+        self.assertIn('+/dev/sda1 %s xfs defaults 0 1' % self.mountpoint,
+                      diff)
+        for executed in self.executed:
+            self.assertFalse(executed.called)
+        self.assertFalse(os.path.exists(self.provider._fstab.filename))
+
+    def test_apply(self):
+        self._add(['sda'])
+        self.provider.apply(noop=False)
+        for executed in self.executed:
+            self.assertTrue(executed.called)
+        with open(self.provider._fstab.filename) as f:
+            self.assertIn('UUID=%s %s xfs defaults 0 1' %
+                          (UUID, self.mountpoint), f.read())
+        self.provider._uuids.prime.assert_called_once_with(['/dev/sda1'])
+
+    def test_disk_groups(self):
+        self._add(['sda', 'sdb'])
+        self.assertEqual('sda,sdb', self.provider.disk_group_name('sdb'))
+
+
+class TestBlivetProvider(ProviderTests, base.BaseTestCase):
+    make_provider = staticmethod(_make_blivet_provider)
+
+
+class TestSfdiskProvider(ProviderTests, base.BaseTestCase):
+    make_provider = staticmethod(_make_sfdisk_provider)
+
+
+class TestRegistry(base.BaseTestCase):
+    def test_builtin(self):
+        from os_disk_config import impl_sfdisk
+        self.assertIs(impl_sfdisk.SfdiskDiskConfig, providers.load('sfdisk'))
+
+    @mock.patch('os_disk_config.providers._entry_point')
+    def test_entry_point(self, mock_entry_point):
+        provider_cls = mock.Mock()
+        mock_entry_point.return_value.load.return_value = provider_cls
+        self.assertIs(provider_cls, providers.load('custom'))
+        mock_entry_point.assert_called_once_with('custom')
+
+    @mock.patch('os_disk_config.providers._entry_point')
+    def test_unknown(self, mock_entry_point):
+        mock_entry_point.return_value = None
+        self.assertRaises(providers.ProviderNotFound, providers.load, 'nope')
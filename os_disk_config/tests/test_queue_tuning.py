@@ -0,0 +1,135 @@
+# Copyright 2015 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+
+import fixtures
+from oslotest import base
+
+from os_disk_config import impl_base
+from os_disk_config import objects
+from os_disk_config import queue_tuning
+
+
+def _make_queue(path, disk, scheduler='[mq-deadline] none',
+                read_ahead_kb=128, nr_requests=64):
+    queue = os.path.join(path, disk, 'queue')
+    os.makedirs(queue)
+    for attr, value in (('scheduler', scheduler),
+                        ('read_ahead_kb', read_ahead_kb),
+                        ('nr_requests', nr_requests)):
+        with open(os.path.join(queue, attr), 'w') as f:
+            f.write('%s\n' % value)
+
+
+def _read(path):
+    with open(path) as f:
+        return f.read().strip()
+
+
+class TestDiskSettings(base.BaseTestCase):
+    def test_later_entries_override(self):
+        tunings = objects.queue_tunings_from_json([
+            {'disks': ['sda', '/dev/sdb'], 'scheduler': 'none',
+             'read_ahead_kb': 4096},
+            {'disks': ['sdb'], 'nr_requests': 256, 'scheduler': 'kyber'}])
+        settings = queue_tuning.disk_settings(tunings)
+        self.assertEqual(['sda', 'sdb'], list(settings))
+        self.assertEqual([('scheduler', 'none'), ('read_ahead_kb', 4096)],
+                         list(settings['sda'].items()))
+        self.assertEqual([('scheduler', 'kyber'), ('read_ahead_kb', 4096),
+                          ('nr_requests', 256)],
+                         list(settings['sdb'].items()))
+
+
+class TestUdevRules(base.BaseTestCase):
+    def test_rules(self):
+        settings = queue_tuning.disk_settings(
+            objects.queue_tunings_from_json([
+                {'disks': ['sda', 'sdb'], 'scheduler': 'none',
+                 'read_ahead_kb': 4096}]))
+        rules = queue_tuning.udev_rules(settings,
+                                        {'sda': {'wwn': 'naa.5000c500'},
+                                         'sdb': {'wwn': None}})
+        lines = rules.splitlines()
+        self.assertTrue(lines[0].startswith('#'))
+        self.assertEqual(
+            'ACTION=="add|change", SUBSYSTEM=="block", ENV{DEVTYPE}=="disk", '
+            'ATTRS{wwid}=="naa.5000c500", ATTR{queue/scheduler}="none", '
+            'ATTR{queue/read_ahead_kb}="4096"', lines[1])
+        self.assertIn('KERNEL=="sdb"', lines[2])
+
+
+class TestApply(base.BaseTestCase):
+    def setUp(self):
+        super(TestApply, self).setUp()
+        tmpdir = self.useFixture(fixtures.TempDir()).path
+        self.sys_block = os.path.join(tmpdir, 'sys')
+        self.useFixture(fixtures.MonkeyPatch(
+            'os_disk_config.queue_tuning._SYS_BLOCK', self.sys_block))
+        self.useFixture(fixtures.MockPatch(
+            'os_disk_config.utils.block_devices_snapshot', return_value={}))
+        self.rules_file = os.path.join(tmpdir, 'rules.d', 'queue.rules')
+        _make_queue(self.sys_block, 'sda')
+        self.settings = queue_tuning.disk_settings(
+            objects.queue_tunings_from_json([
+                {'disks': ['sda'], 'scheduler': 'none',
+                 'read_ahead_kb': 128, 'nr_requests': 256}]))
+
+    def _apply(self, noop=False):
+        return queue_tuning.apply(self.settings, noop=noop,
+                                  rules_file=self.rules_file)
+
+    def _queue(self, attr):
+        return _read(os.path.join(self.sys_block, 'sda', 'queue', attr))
+
+    def test_apply(self):
+        report = self._apply()
+        self.assertEqual({'sda': {
+            'scheduler': {'current': 'mq-deadline', 'planned': 'none'},
+            'nr_requests': {'current': 64, 'planned': 256}}},
+            report['disks'])
+        self.assertEqual('none', self._queue('scheduler'))
+        self.assertEqual('256', self._queue('nr_requests'))
+        self.assertEqual([self.rules_file], list(report['files']))
+        self.assertIn('ATTR{queue/nr_requests}="256"',
+                      _read(self.rules_file))
+
+    def test_unchanged(self):
+        self._apply()
+        # Like the kernel, which marks the scheduler in use
+        with open(os.path.join(self.sys_block, 'sda', 'queue',
+                               'scheduler'), 'w') as f:
+            f.write('mq-deadline [none]\n')
+        self.assertEqual({'disks': {}, 'files': {}}, self._apply())
+
+    def test_noop(self):
+        report = self._apply(noop=True)
+        self.assertEqual(['scheduler', 'nr_requests'],
+                         list(report['disks']['sda']))
+        self.assertEqual([self.rules_file], list(report['files']))
+        self.assertEqual('[mq-deadline] none', self._queue('scheduler'))
+        self.assertFalse(os.path.exists(self.rules_file))
+
+    def test_unavailable_scheduler(self):
+        self.settings['sda']['scheduler'] = 'bfq'
+        e = self.assertRaises(impl_base.DiskApplyException, self._apply)
+        self.assertIn('bfq is not available', str(e.failures['sda']))
+        self.assertEqual('64', self._queue('nr_requests'))
+        self.assertFalse(os.path.exists(self.rules_file))
+
+    def test_missing_disk(self):
+        self.settings['sdb'] = {'read_ahead_kb': 4096}
+        e = self.assertRaises(impl_base.DiskApplyException, self._apply)
+        self.assertEqual(['sdb'], list(e.failures))
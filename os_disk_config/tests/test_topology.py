@@ -0,0 +1,115 @@
+# Copyright 2015 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import mock
+from oslotest import base
+
+from os_disk_config import topology
+
+
+def _device(name, parents=(), device_type='partition', fs_uuid=None,
+            part_uuid=None):
+    device = mock.Mock()
+    device.name = name
+    device.path = '/dev/%s' % name
+    device.type = device_type
+    device.parents = list(parents)
+    device.uuid = part_uuid
+    device.size = 1024 ** 3
+    device.format.type = 'xfs'
+    device.format.uuid = fs_uuid
+    device.format.mountpoint = None
+    return device
+
+
+class TestDeviceIndex(base.BaseTestCase):
+    def setUp(self):
+        super(TestDeviceIndex, self).setUp()
+        self.sda = _device('sda', device_type='disk')
+        self.sdb = _device('sdb', device_type='disk')
+        self.sda1 = _device('sda1', [self.sda], fs_uuid='fs-1',
+                            part_uuid='part-1')
+        self.sda2 = _device('sda2', [self.sda])
+        self.index = topology.DeviceIndex([self.sda, self.sdb, self.sda1,
+                                           self.sda2])
+
+    def test_lookup(self):
+        for key in ('sda1', '/dev/sda1', 'fs-1', 'part-1'):
+            self.assertEqual('sda1', self.index.lookup(key)['name'])
+            self.assertIs(self.sda1, self.index.device(key))
+        self.assertIsNone(self.index.lookup('sdc'))
+        self.assertIsNone(self.index.device('sdc'))
+
+    @mock.patch('os.path.realpath')
+    def test_lookup_resolved_path(self, mock_realpath):
+        links = {'/dev/md/data': '/dev/md127'}
+        mock_realpath.side_effect = lambda path: links.get(path, path)
+        array = _device('data', [self.sda1], device_type='mdarray')
+        array.path = '/dev/md/data'
+        index = topology.DeviceIndex([self.sda, self.sda1, array])
+        self.assertEqual('data', index.lookup('/dev/md127')['name'])
+        self.assertEqual('data', index.lookup('/dev/md/data')['name'])
+
+    def test_disks(self):
+        self.assertEqual(['/dev/sda', '/dev/sdb'], self.index.disks())
+
+    def test_children(self):
+        self.assertEqual(['sda1', 'sda2'], self.index.children('sda'))
+        self.assertEqual([], self.index.children('sdb'))
+
+    def test_add_replaces(self):
+        self.sda1.format.uuid = 'fs-2'
+        self.index.add(self.sda1)
+        self.assertEqual('sda1', self.index.lookup('fs-2')['name'])
+        self.assertIsNone(self.index.lookup('fs-1'))
+        self.assertEqual(['sda2', 'sda1'], self.index.children('sda'))
+
+    def test_array_level(self):
+        array = _device('md0', [self.sda1], device_type='mdarray')
+        array.level = 'raid1'
+        self.assertEqual('raid1', topology.device_record(array)['level'])
+        self.assertIsNone(topology.device_record(self.sda1)['level'])
+
+    def test_lvm_attributes(self):
+        vg = _device('vg0', [self.sda1], device_type='lvmvg')
+        vg.peSize = 4 * 1024 ** 2
+        self.assertEqual(4 * 1024 ** 2, topology.device_record(vg)['pe_size'])
+        lv = _device('vg0-data', [vg], device_type='lvmlv')
+        lv.stripes = 2
+        lv.stripe_size = 64 * 1024
+        record = topology.device_record(lv)
+        self.assertEqual('lvmlv', record['type'])
+        self.assertEqual(2, record['stripes'])
+        self.assertEqual(64 * 1024, record['stripe_size'])
+        # Scanned volumes only say whether they are linear
+        lv = _device('vg0-other', [vg], device_type='lvmlv')
+        lv.segType = 'linear'
+        record = topology.device_record(lv)
+        self.assertEqual(1, record['stripes'])
+        self.assertIsNone(record['stripe_size'])
+
+    def test_add_records(self):
+        records = [topology.device_record(self.sda),
+                   topology.device_record(_device('sdc', device_type='disk'))]
+        records[0]['path'] = '/dev/stale'
+        self.index.add_records(records)
+        self.assertEqual('/dev/sda', self.index.lookup('sda')['path'])
+        self.assertEqual('/dev/sdc', self.index.lookup('sdc')['path'])
+        self.assertIsNone(self.index.device('sdc'))
+
+    def test_from_records(self):
+        index = topology.DeviceIndex.from_records(self.index.records())
+        self.assertEqual('sda1', index.lookup('part-1')['name'])
+        self.assertIsNone(index.device('part-1'))
+        self.assertEqual(self.index.disks(), index.disks())
@@ -0,0 +1,215 @@
+# Copyright 2015 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+import subprocess
+
+import fixtures
+import mock
+from oslotest import base
+
+from os_disk_config import utils
+
+
+BLKID_EXPORT = '''DEVNAME=/dev/sdb1
+UUID=11111111-2222-3333-4444-555555555555
+
+DEVNAME=/dev/sdc1
+UUID=66666666-7777-8888-9999-000000000000
+'''
+
+
+class TestUuidResolver(base.BaseTestCase):
+    def setUp(self):
+        super(TestUuidResolver, self).setUp()
+        self.by_uuid = self.useFixture(fixtures.TempDir()).path
+        self.resolver = utils.UuidResolver(self.by_uuid)
+        self.dev = self.useFixture(fixtures.TempDir()).path
+        self.sda1 = os.path.join(self.dev, 'sda1')
+        open(self.sda1, 'w').close()
+        os.symlink(self.sda1, os.path.join(self.by_uuid, 'abcd-1234'))
+
+    @mock.patch('subprocess.check_output')
+    def test_by_uuid_links(self, mock_check_output):
+        self.assertEqual('abcd-1234', self.resolver.get(self.sda1))
+        self.assertFalse(mock_check_output.called)
+
+    @mock.patch('subprocess.check_output')
+    def test_single_blkid_run(self, mock_check_output):
+        mock_check_output.return_value = BLKID_EXPORT
+        self.resolver.prime(['/dev/sdb1', '/dev/sdc1', self.sda1])
+        mock_check_output.assert_called_once_with(
+            ['blkid', '-p', '-s', 'UUID', '-o', 'export', '/dev/sdb1',
+             '/dev/sdc1'], universal_newlines=True)
+        self.assertEqual('11111111-2222-3333-4444-555555555555',
+                         self.resolver.get('/dev/sdb1'))
+        self.assertEqual('66666666-7777-8888-9999-000000000000',
+                         self.resolver.get('/dev/sdc1'))
+        self.assertEqual(1, mock_check_output.call_count)
+
+    @mock.patch('subprocess.check_output')
+    def test_invalidate(self, mock_check_output):
+        mock_check_output.return_value = ('DEVNAME=%s\nUUID=efgh-5678\n' %
+                                          self.sda1)
+        self.assertEqual('abcd-1234', self.resolver.get(self.sda1))
+        self.resolver.invalidate([self.sda1])
+        self.assertEqual('efgh-5678', self.resolver.get(self.sda1))
+        self.assertEqual('efgh-5678', self.resolver.get(self.sda1))
+        self.assertEqual(1, mock_check_output.call_count)
+
+    @mock.patch('subprocess.check_output')
+    def test_no_uuid(self, mock_check_output):
+        mock_check_output.side_effect = subprocess.CalledProcessError(
+            2, 'blkid', output='')
+        self.assertIsNone(self.resolver.get('/dev/sdd1'))
+
+
+class TestRunParallel(base.BaseTestCase):
+    def _run(self, jobs):
+        def _square(i):
+            if i == 3:
+                raise ValueError('three')
+            return i * i
+        return utils.run_parallel(_square, [1, 2, 3, 4], jobs)
+
+    def test_serial(self):
+        results = self._run(1)
+        self.assertEqual([(1, 1), (2, 4), (4, 16)],
+                         [(i, r) for i, r, e in results if e is None])
+        self.assertEqual(3, results[2][0])
+        self.assertIsInstance(results[2][2], ValueError)
+
+    def test_parallel(self):
+        self.assertEqual([(i, r, type(e)) for i, r, e in self._run(1)],
+                         [(i, r, type(e)) for i, r, e in self._run(3)])
+
+
+class TestDiskName(base.BaseTestCase):
+    def test_disk_name(self):
+        self.assertEqual('sda', utils.disk_name('sda'))
+        self.assertEqual('sda', utils.disk_name('/dev/sda'))
+
+
+class TestParseSize(base.BaseTestCase):
+    def test_parse_size(self):
+        self.assertEqual(5 * 1024 ** 3, utils.parse_size('5 GiB'))
+        self.assertEqual(500 * 1000 ** 2, utils.parse_size('500MB'))
+        self.assertEqual(1536, utils.parse_size('1.5 KiB'))
+        self.assertEqual(4 * 1024 ** 4, utils.parse_size('4 tib'))
+        self.assertEqual(512, utils.parse_size('512'))
+        self.assertEqual(512, utils.parse_size(512))
+
+    def test_invalid(self):
+        for size in ('', 'big', '5 GiBs', '5 XB'):
+            self.assertRaises(ValueError, utils.parse_size, size)
+
+
+def make_sys_block(path, name, sectors, rotational=0, model=None, wwid=None,
+                   partitions=(), holders=(), hints=None):
+    """Create a fake /sys/block entry for a disk under path"""
+    base = os.path.join(path, name)
+    queue = os.path.join(base, 'queue')
+    os.makedirs(queue)
+    os.makedirs(os.path.join(base, 'device'))
+    os.makedirs(os.path.join(base, 'holders'))
+
+    def _write(filename, value):
+        with open(filename, 'w') as f:
+            f.write('%s\n' % value)
+    _write(os.path.join(base, 'size'), sectors)
+    _write(os.path.join(base, 'removable'), 0)
+    _write(os.path.join(base, 'alignment_offset'), 0)
+    _write(os.path.join(queue, 'rotational'), rotational)
+    hints = hints or {}
+    for hint in ('logical_block_size', 'physical_block_size',
+                 'minimum_io_size'):
+        _write(os.path.join(queue, hint), hints.get(hint, 512))
+    _write(os.path.join(queue, 'optimal_io_size'),
+           hints.get('optimal_io_size', 0))
+    if model:
+        _write(os.path.join(base, 'device', 'model'), model)
+    if wwid:
+        _write(os.path.join(base, 'wwid'), wwid)
+    for part in partitions:
+        os.makedirs(os.path.join(base, part))
+        _write(os.path.join(base, part, 'partition'), 1)
+    for holder in holders:
+        os.makedirs(os.path.join(base, 'holders', holder))
+
+
+class TestBlockDevicesSnapshot(base.BaseTestCase):
+    def setUp(self):
+        super(TestBlockDevicesSnapshot, self).setUp()
+        self.sys_block = self.useFixture(fixtures.TempDir()).path
+        self.useFixture(fixtures.MonkeyPatch(
+            'os_disk_config.utils._SYS_BLOCK', self.sys_block))
+
+    def test_snapshot(self):
+        make_sys_block(self.sys_block, 'sda', 2048, rotational=1,
+                       model='ST4000NM', wwid='naa.5000c500',
+                       partitions=['sda1'],
+                       hints={'physical_block_size': 4096})
+        make_sys_block(self.sys_block, 'nvme0n1', 4096, holders=['md0'])
+        snapshot = utils.block_devices_snapshot()
+        self.assertEqual(['nvme0n1', 'sda'], sorted(snapshot))
+        sda = snapshot['sda']
+        self.assertEqual(1024 * 1024, sda['size'])
+        self.assertTrue(sda['rotational'])
+        self.assertEqual('ST4000NM', sda['model'])
+        self.assertEqual('naa.5000c500', sda['wwn'])
+        self.assertEqual(512, sda['logical_block_size'])
+        self.assertEqual(4096, sda['physical_block_size'])
+        self.assertEqual(1, sda['partitions'])
+        nvme = snapshot['nvme0n1']
+        self.assertEqual('nvme', nvme['transport'])
+        self.assertFalse(nvme['rotational'])
+        self.assertIsNone(nvme['model'])
+        self.assertEqual(['md0'], nvme['holders'])
+
+    def test_unreadable_disk_skipped(self):
+        make_sys_block(self.sys_block, 'sda', 2048)
+        os.makedirs(os.path.join(self.sys_block, 'sdb', 'device'))
+        self.assertEqual(['sda'], list(utils.block_devices_snapshot()))
+
+    def test_virtual_devices_skipped(self):
+        make_sys_block(self.sys_block, 'sda', 2048)
+        for name in ('loop0', 'zram0', 'dm-0', 'md127', 'nbd0', 'sr0'):
+            make_sys_block(self.sys_block, name, 2048)
+        make_sys_block(self.sys_block, 'sdb', 0)
+        make_sys_block(self.sys_block, 'xvda', 2048)
+        os.rmdir(os.path.join(self.sys_block, 'xvda', 'device'))
+        self.assertEqual(['sda'], list(utils.block_devices_snapshot()))
+        # Unless they are asked for by name
+        self.assertEqual(['loop0'],
+                         list(utils.block_devices_snapshot(['loop0'])))
+
+    def test_limited_to_disks(self):
+        make_sys_block(self.sys_block, 'sda', 2048)
+        make_sys_block(self.sys_block, 'sdb', 2048)
+        self.assertEqual(['sdb'],
+                         list(utils.block_devices_snapshot(['sdb', 'sdc'])))
+
+    def test_io_hints(self):
+        make_sys_block(self.sys_block, 'sda', 2048,
+                       hints={'optimal_io_size': 196608})
+        hints = utils.block_device_io_hints('sda')
+        self.assertEqual(196608, hints['optimal_io_size'])
+        self.assertEqual(0, hints['alignment_offset'])
+        self.assertIsNone(utils.block_device_io_hints('sdb'))
+
+
+class TestLcm(base.BaseTestCase):
+    def test_lcm(self):
+        self.assertEqual(3 * 1024 ** 2, utils.lcm(1024 ** 2, 196608))
+        self.assertEqual(4096, utils.lcm(512, 4096))
@@ -0,0 +1,109 @@
+# Copyright 2015 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+import subprocess
+
+import fixtures
+import mock
+from oslotest import base
+import testtools
+
+from os_disk_config import impl_base
+from os_disk_config import wipe
+
+
+SIZE = 16 * 1024 * 1024
+DATA = b'os-disk-config' * 64
+
+
+def _loop_devices_available():
+    if os.geteuid() != 0:
+        return False
+    try:
+        subprocess.check_output(['losetup', '--find'])
+        subprocess.check_output(['wipefs', '--version'])
+    except (OSError, subprocess.CalledProcessError):
+        return False
+    return True
+
+
+class TestWipe(base.BaseTestCase):
+    def setUp(self):
+        super(TestWipe, self).setUp()
+        self.image = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                                  'disk.img')
+        with open(self.image, 'wb') as f:
+            f.truncate(SIZE)
+            f.seek(SIZE // 2)
+            f.write(DATA)
+
+    def _read_image(self):
+        with open(self.image, 'rb') as f:
+            return f.read()
+
+    def _attach_loop(self):
+        loop = subprocess.check_output(['losetup', '--find', '--show',
+                                        self.image],
+                                       universal_newlines=True).strip()
+        self.addCleanup(subprocess.call, ['losetup', '-d', loop])
+        return loop
+
+    @mock.patch('subprocess.check_call')
+    def test_signatures_only(self, mock_check_call):
+        wipe.wipe_device(self.image, 'signatures')
+        mock_check_call.assert_called_once_with(
+            ['wipefs', '--all', '--quiet', self.image])
+        self.assertIn(DATA, self._read_image())
+
+    @mock.patch('subprocess.check_call')
+    def test_zero_sparse_file(self, mock_check_call):
+        wipe.wipe_device(self.image, 'zero')
+        self.assertEqual(b'\0' * SIZE, self._read_image())
+        self.assertEqual(SIZE, os.path.getsize(self.image))
+
+    @mock.patch('fcntl.ioctl')
+    def test_discard_unsupported(self, mock_ioctl):
+        mock_ioctl.side_effect = [IOError(95, 'Not supported'), None]
+        with mock.patch('os.fstat') as mock_fstat:
+            mock_fstat.return_value.st_mode = 0o60600
+            wipe.clear_data(self.image, 'discard')
+        self.assertEqual([wipe.BLKDISCARD, wipe.BLKZEROOUT],
+                         [c[0][1] for c in mock_ioctl.call_args_list])
+        # The kernel zeroed the device, so nothing was written here
+        self.assertIn(DATA, self._read_image())
+
+    @testtools.skipUnless(_loop_devices_available(),
+                          'Loop devices are not available')
+    def test_zero_loop_device(self):
+        loop = self._attach_loop()
+        wipe.wipe_device(loop, 'zero')
+        with open(loop, 'rb') as f:
+            self.assertEqual(b'\0' * SIZE, f.read())
+
+    @mock.patch('os_disk_config.wipe.wipe_device')
+    def test_wipe_disks(self, mock_wipe_device):
+        def _wipe(path, mode):
+            if path == '/dev/sdb':
+                raise IOError('failed')
+        mock_wipe_device.side_effect = _wipe
+        e = self.assertRaises(impl_base.DiskApplyException, wipe.wipe_disks,
+                              {'sda': 'zero', 'sdb': 'signatures'}, jobs=2)
+        self.assertEqual(['sdb'], list(e.failures))
+        mock_wipe_device.assert_any_call('/dev/sda', 'zero')
+
+    @mock.patch('os_disk_config.wipe.wipe_device')
+    def test_wipe_disks_noop(self, mock_wipe_device):
+        wipe.wipe_disks({'sda': 'zero'}, noop=True)
+        self.assertFalse(mock_wipe_device.called)
@@ -0,0 +1,174 @@
+# Copyright 2015 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import collections
+import logging
+import os
+
+
+logger = logging.getLogger(__name__)
+
+
+def _number(value):
+    """Return value as an int, or None if it is not a number"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def device_record(device):
+    """Return a plain dict describing a blivet device.
+
+    Only the attributes needed for lookups are read, so building the record
+    is much cheaper than device.dict.
+    """
+    fmt = device.format
+    level = stripes = stripe_size = pe_size = None
+    if device.type == 'mdarray':
+        level = getattr(device, 'level', None)
+        if level is not None:
+            level = str(level)
+    elif device.type == 'lvmvg':
+        pe_size = _number(getattr(device, 'peSize', None))
+    elif device.type == 'lvmlv':
+        # Only volumes created here know their stripe size
+        stripes = _number(getattr(device, 'stripes', None))
+        if stripes is None and getattr(device, 'segType', None) == 'linear':
+            stripes = 1
+        stripe_size = _number(getattr(device, 'stripe_size', None))
+    return {'name': device.name,
+            'path': device.path,
+            'type': device.type,
+            'parents': [p.name for p in device.parents],
+            'partition': device.type == 'partition',
+            'size': int(device.size),
+            'part_uuid': getattr(device, 'uuid', None),
+            'fs_type': getattr(fmt, 'type', None),
+            'uuid': getattr(fmt, 'uuid', None),
+            'mountpoint': getattr(fmt, 'mountpoint', None),
+            'level': level,
+            'stripes': stripes,
+            'stripe_size': stripe_size,
+            'pe_size': pe_size}
+
+
+class DeviceIndex(object):
+    """Hash-based lookups over a snapshot of the device topology.
+
+    Devices can be found by path, name, filesystem UUID, partition UUID or
+    the device node their path links to (e.g. /dev/md127 for /dev/md/data)
+    in constant time, and each device's children are kept in an adjacency
+    map.
+    The index is a snapshot: callers are responsible for rebuilding it when
+    the underlying devicetree is rescanned or reallocated.
+
+    :param devices: An iterable of blivet devices to index.
+    """
+    def __init__(self, devices=()):
+        self._records = collections.OrderedDict()
+        self._devices = {}
+        self._keys = {}
+        self._record_keys = {}
+        self._children = collections.defaultdict(list)
+        for device in devices:
+            self.add(device)
+
+    @classmethod
+    def from_records(cls, records):
+        """Build an index from device_record() dicts alone.
+
+        Lookups return the same records, but device() always returns None.
+        """
+        index = cls()
+        for record in records:
+            index._add_record(record)
+        return index
+
+    def add(self, device):
+        """Add device to the index, replacing any entry with its name."""
+        self._add_record(device_record(device))
+        self._devices[device.name] = device
+
+    def add_records(self, records):
+        """Add device_record() dicts for devices not already in the index"""
+        for record in records:
+            if record['name'] not in self._records:
+                self._add_record(record)
+
+    def _add_record(self, record):
+        name = record['name']
+        if name in self._records:
+            self._remove(name)
+        self._records[name] = record
+        self._record_keys[name] = []
+        resolved = None
+        if record['path']:
+            resolved = os.path.realpath(record['path'])
+        for key in (record['path'], name, record['uuid'],
+                    record['part_uuid'], resolved):
+            if key and key not in self._keys:
+                self._keys[key] = name
+                self._record_keys[name].append(key)
+        for parent in record['parents']:
+            self._children[parent].append(name)
+
+    def _remove(self, name):
+        record = self._records.pop(name)
+        self._devices.pop(name, None)
+        for key in self._record_keys.pop(name):
+            del self._keys[key]
+        for parent in record['parents']:
+            self._children[parent].remove(name)
+
+    def records(self):
+        """Return the records for every indexed device, in insertion order"""
+        return list(self._records.values())
+
+    def lookup(self, key):
+        """Return the record matching a path, name or UUID, or None"""
+        name = self._keys.get(key)
+        if name is None:
+            return None
+        return self._records[name]
+
+    def device(self, key):
+        """Return the blivet device matching key, or None"""
+        record = self.lookup(key)
+        if record is None:
+            return None
+        return self._devices.get(record['name'])
+
+    def subtree(self, name):
+        """Return the records of name and all of its descendants"""
+        result = []
+        pending = [name]
+        seen = set()
+        while pending:
+            current = pending.pop(0)
+            if current in seen or current not in self._records:
+                continue
+            seen.add(current)
+            result.append(self._records[current])
+            pending.extend(self._children.get(current, []))
+        return result
+
+    def children(self, name):
+        """Return the names of the devices whose parents include name"""
+        return list(self._children.get(name, []))
+
+    def disks(self):
+        """Return the paths of every device that has no parents"""
+        return [r['path'] for r in self._records.values()
+                if not r['parents']]
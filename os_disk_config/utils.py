@@ -16,16 +16,41 @@
 
 import glob
 import logging
+from multiprocessing import pool as mp_pool
 import os
+import re
+import subprocess
 
 
 logger = logging.getLogger(__name__)
 _SYS_CLASS_NET = '/sys/class/net'
+_SYS_BLOCK = '/sys/block'
+# Block devices that are never configured as disks, even with a device link
+_VIRTUAL_PREFIXES = ('loop', 'ram', 'zram', 'dm-', 'md', 'nbd', 'sr')
+_PROC_MOUNTS = '/proc/mounts'
+_DEV_DISK_BY_UUID = '/dev/disk/by-uuid'
+# Where state is kept between runs
+STATE_DIR = '/var/lib/os-disk-config'
+
+_SIZE_RE = re.compile(r'^\s*([0-9]*\.?[0-9]+)\s*([a-zA-Z]*)\s*$')
+_SIZE_PREFIXES = 'kmgtpe'
 
 
 def write_config(filename, data):
-    with open(filename, 'w') as f:
+    """Atomically replace filename with data.
+
+    The data is written to a temporary file in the same directory, which is
+    then renamed over filename, so readers never see a partial file.  The
+    permissions of an existing file are preserved.
+    """
+    tmp = '%s.tmp.%d' % (filename, os.getpid())
+    with open(tmp, 'w') as f:
         f.write(str(data))
+        f.flush()
+        os.fsync(f.fileno())
+    if os.path.exists(filename):
+        os.chmod(tmp, os.stat(filename).st_mode & 0o7777)
+    os.rename(tmp, filename)
 
 
 def get_file_data(filename):
@@ -40,6 +65,17 @@ def get_file_data(filename):
         return ''
 
 
+def disk_name(disk):
+    """Return the kernel name of a disk given as a name or a /dev path.
+
+    Symlinks such as /dev/disk/by-id/* are resolved, so "sda", "/dev/sda"
+    and a by-id link to sda all return "sda".
+    """
+    if disk.startswith('/dev/'):
+        return os.path.basename(os.path.realpath(disk))
+    return disk
+
+
 def interface_mac(name):
     try:
         with open('/sys/class/net/%s/address' % name, 'r') as f:
@@ -88,9 +124,300 @@ def ordered_active_nics():
     return sorted(embedded_nics) + sorted(nics)
 
 
+def parse_size(size):
+    """Convert a size such as "5 GiB" or "500MB" to a number of bytes.
+
+    Units follow blivet: KiB, MiB etc. are powers of 1024, KB, MB etc. are
+    powers of 1000, and a bare number is bytes.
+    """
+    if isinstance(size, (int, float)):
+        return int(size)
+    match = _SIZE_RE.match(size)
+    if not match:
+        raise ValueError('Invalid size: %s' % size)
+    value, unit = float(match.group(1)), match.group(2).lower()
+    if unit in ('', 'b'):
+        return int(value)
+    index = _SIZE_PREFIXES.find(unit[0])
+    if index < 0 or unit[1:] not in ('', 'b', 'ib'):
+        raise ValueError('Invalid size unit: %s' % size)
+    base = 1024 if unit.endswith('ib') else 1000
+    return int(value * base ** (index + 1))
+
+
+def lcm(a, b):
+    """Return the least common multiple of two positive integers"""
+    x, y = a, b
+    while y:
+        x, y = y, x % y
+    return a * b // x
+
+
+def _read_sysfs_int(path):
+    with open(path, 'r') as f:
+        return int(f.read().strip())
+
+
+def _read_sysfs_str(path):
+    try:
+        with open(path, 'r') as f:
+            return f.read().strip()
+    except IOError:
+        return None
+
+
+def _transport(disk, sys_path):
+    if disk.startswith('nvme'):
+        return 'nvme'
+    if disk.startswith('vd'):
+        return 'virtio'
+    if '/usb' in sys_path:
+        return 'usb'
+    if '/ata' in sys_path:
+        return 'sata'
+    if os.path.exists(os.path.join(sys_path, 'device', 'sas_address')):
+        return 'sas'
+    return 'scsi'
+
+
+def _is_virtual(disk, base):
+    """Return True for block devices that are not backed by hardware"""
+    return (disk.startswith(_VIRTUAL_PREFIXES) or
+            not os.path.exists(os.path.join(base, 'device')))
+
+
+def block_devices_snapshot(disks=None):
+    """Read the attributes of every disk in /sys/block in one pass.
+
+    Sizes are in bytes.  The I/O hints (logical_block_size,
+    physical_block_size, minimum_io_size, optimal_io_size and
+    alignment_offset) are as reported by the kernel, also in bytes.
+
+    :param disks: A list of disk names to limit the snapshot to.  If this
+        is None, every disk is included except empty ones and virtual
+        devices such as loop, dm and md devices.
+    :returns: a dict of disk name: dict of attributes.
+    """
+    snapshot = {}
+    if not os.path.isdir(_SYS_BLOCK):
+        return snapshot
+    names = os.listdir(_SYS_BLOCK) if disks is None else set(disks)
+    for disk in sorted(names):
+        base = os.path.join(_SYS_BLOCK, disk)
+        if disks is None and _is_virtual(disk, base):
+            continue
+        queue = os.path.join(base, 'queue')
+        try:
+            info = {
+                'name': disk,
+                'size': _read_sysfs_int(os.path.join(base, 'size')) * 512,
+                'rotational': bool(_read_sysfs_int(
+                    os.path.join(queue, 'rotational'))),
+                'removable': bool(_read_sysfs_int(
+                    os.path.join(base, 'removable'))),
+            }
+            for hint in ('logical_block_size', 'physical_block_size',
+                         'minimum_io_size', 'optimal_io_size'):
+                info[hint] = _read_sysfs_int(os.path.join(queue, hint))
+            info['alignment_offset'] = _read_sysfs_int(
+                os.path.join(base, 'alignment_offset'))
+        except (IOError, OSError, ValueError):
+            logger.debug('Skipping %s, unable to read its attributes', disk)
+            continue
+        if disks is None and not info['size']:
+            continue
+        info['model'] = _read_sysfs_str(os.path.join(base, 'device', 'model'))
+        info['wwn'] = (_read_sysfs_str(os.path.join(base, 'wwid')) or
+                       _read_sysfs_str(os.path.join(base, 'device', 'wwid')))
+        info['transport'] = _transport(disk, os.path.realpath(base))
+        info['partitions'] = len(glob.glob(os.path.join(base, disk + '*',
+                                                        'partition')))
+        info['holders'] = os.listdir(os.path.join(base, 'holders')) \
+            if os.path.isdir(os.path.join(base, 'holders')) else []
+        snapshot[disk] = info
+    return snapshot
+
+
+def block_device_io_hints(disk):
+    """Return the sector sizes and I/O hints of one disk from sysfs.
+
+    :param disk: The kernel name of the disk, e.g. "sda".
+    :returns: a dict with the same hint keys as block_devices_snapshot(),
+        or None if they cannot be read.
+    """
+    base = os.path.join(_SYS_BLOCK, disk)
+    queue = os.path.join(base, 'queue')
+    try:
+        hints = dict((hint, _read_sysfs_int(os.path.join(queue, hint)))
+                     for hint in ('logical_block_size', 'physical_block_size',
+                                  'minimum_io_size', 'optimal_io_size'))
+        hints['alignment_offset'] = _read_sysfs_int(
+            os.path.join(base, 'alignment_offset'))
+    except (IOError, OSError, ValueError):
+        return None
+    return hints
+
+
+def block_device_state(disk):
+    """Return a cheap description of a disk and its partitions from sysfs.
+
+    Only the disk size and the start and size of each partition (all in
+    512 byte sectors) are read, so this is fast enough to call on every run.
+
+    :param disk: The kernel name of the disk, e.g. "sda".
+    :returns: a dict, or None if the disk does not exist.
+    """
+    base = os.path.join(_SYS_BLOCK, disk)
+    try:
+        state = {'size': _read_sysfs_int(os.path.join(base, 'size')),
+                 'partitions': {}}
+        for part in glob.iglob(os.path.join(base, disk + '*', 'partition')):
+            part_dir = os.path.dirname(part)
+            state['partitions'][os.path.basename(part_dir)] = {
+                'start': _read_sysfs_int(os.path.join(part_dir, 'start')),
+                'size': _read_sysfs_int(os.path.join(part_dir, 'size'))}
+    except (IOError, OSError, ValueError):
+        return None
+    return state
+
+
+def block_device_numbers(disk):
+    """Return the "major:minor" numbers of a disk and its partitions.
+
+    :param disk: The kernel name of the disk, e.g. "sda".
+    :returns: a dict of device name: "major:minor".
+    """
+    base = os.path.join(_SYS_BLOCK, disk)
+    numbers = {}
+    for dev in ([os.path.join(base, 'dev')] +
+                glob.glob(os.path.join(base, disk + '*', 'dev'))):
+        name = os.path.basename(os.path.dirname(dev))
+        try:
+            with open(dev, 'r') as f:
+                numbers[name] = f.read().strip()
+        except IOError:
+            pass
+    return numbers
+
+
+def mounts():
+    """Return the mounted filesystems as a list of (source, target, type)"""
+    result = []
+    for line in get_file_data(_PROC_MOUNTS).splitlines():
+        fields = line.split()
+        if len(fields) >= 3:
+            result.append((fields[0], fields[1], fields[2]))
+    return result
+
+
 def diff(filename, data):
     file_data = get_file_data(filename)
     logger.debug("Diff file data:\n%s" % file_data)
     logger.debug("Diff data:\n%s" % data)
     # convert to string as JSON may have unicode in it
     return not file_data == data
+
+
+def run_parallel(func, items, jobs=1):
+    """Call func on each of items using a bounded pool of worker threads.
+
+    Exceptions raised by func are caught and returned rather than raised, so
+    that a failure on one item does not prevent the others from completing.
+
+    :param func: A callable taking a single item.
+    :param items: A list of items to pass to func.
+    :param jobs: The maximum number of items to process concurrently.
+    :returns: a list of (item, result, exception) tuples in the same order as
+        items.  exception is None if func succeeded.
+    """
+    def _call(item):
+        try:
+            return (item, func(item), None)
+        except Exception as e:
+            logger.debug('Parallel task for %s failed', item, exc_info=True)
+            return (item, None, e)
+
+    if jobs <= 1 or len(items) <= 1:
+        return [_call(i) for i in items]
+    workers = mp_pool.ThreadPool(min(jobs, len(items)))
+    try:
+        return workers.map(_call, items)
+    finally:
+        workers.close()
+        workers.join()
+
+
+def _parse_blkid_export(output):
+    """Parse `blkid -o export` output into a dict of device path: UUID"""
+    uuids = {}
+    devname = None
+    for line in output.splitlines():
+        key, _, value = line.strip().partition('=')
+        if key == 'DEVNAME':
+            devname = value
+        elif key == 'UUID' and devname:
+            uuids[devname] = value
+        elif not line.strip():
+            devname = None
+    return uuids
+
+
+class UuidResolver(object):
+    """Look up filesystem UUIDs for many devices with as few probes as we can.
+
+    The first lookup reads every link in /dev/disk/by-uuid at once.  Devices
+    that are missing from there, or that have been invalidated because they
+    were just formatted and udev may not have caught up yet, are probed
+    together by a single blkid run.  Results are cached until invalidated.
+
+    :param by_uuid_dir: The directory of by-uuid symlinks to read.  Defaults
+        to /dev/disk/by-uuid.
+    """
+    def __init__(self, by_uuid_dir=None):
+        self._by_uuid_dir = by_uuid_dir or _DEV_DISK_BY_UUID
+        self._uuids = None
+        self._stale = set()
+
+    def _load(self):
+        self._uuids = {}
+        if not os.path.isdir(self._by_uuid_dir):
+            return
+        for uuid in os.listdir(self._by_uuid_dir):
+            link = os.path.join(self._by_uuid_dir, uuid)
+            self._uuids[os.path.realpath(link)] = uuid
+
+    def invalidate(self, devices):
+        """Forget the cached UUIDs of devices, e.g. after formatting them.
+
+        Invalidated devices are always re-read with blkid, never from the
+        by-uuid links, which may still point at the old filesystem.
+        """
+        for device in devices:
+            path = os.path.realpath(device)
+            self._stale.add(path)
+            if self._uuids is not None:
+                self._uuids.pop(path, None)
+
+    def prime(self, devices):
+        """Make sure the UUIDs of devices are cached, using one blkid run."""
+        if self._uuids is None:
+            self._load()
+        paths = [os.path.realpath(d) for d in devices]
+        missing = [p for p in paths
+                   if p in self._stale or p not in self._uuids]
+        if not missing:
+            return
+        cmd = ['blkid', '-p', '-s', 'UUID', '-o', 'export'] + missing
+        try:
+            output = subprocess.check_output(cmd, universal_newlines=True)
+        except subprocess.CalledProcessError as e:
+            # blkid exits non-zero if any device has no UUID, but still
+            # prints the ones it found
+            output = e.output or ''
+        self._uuids.update(_parse_blkid_export(output))
+        self._stale.difference_update(missing)
+
+    def get(self, device):
+        """Return the filesystem UUID of device, or None if it has none"""
+        self.prime([device])
+        return self._uuids.get(os.path.realpath(device))
@@ -0,0 +1,127 @@
+# Copyright 2015 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Clearing old signatures and data from disks before they are reused."""
+
+import errno
+import fcntl
+import logging
+import os
+import stat
+import struct
+import subprocess
+
+from os_disk_config import impl_base
+from os_disk_config import utils
+
+
+logger = logging.getLogger(__name__)
+
+# From linux/fs.h
+BLKDISCARD = 0x1277
+BLKZEROOUT = 0x127f
+
+_UNSUPPORTED = (errno.ENOTTY, errno.EOPNOTSUPP, errno.EINVAL)
+_ZERO_CHUNK = 4 * 1024 * 1024
+
+
+def _range_ioctl(fd, request, length):
+    fcntl.ioctl(fd, request, struct.pack('QQ', 0, length))
+
+
+def _zero_file(fd, length):
+    # A regular file (e.g. a disk image) can be zeroed without writing
+    # anything by truncating it, which leaves it sparse.
+    os.ftruncate(fd, 0)
+    os.ftruncate(fd, length)
+
+
+def _zero_userspace(fd, length):
+    logger.warning('Falling back to writing zeros, this may be slow')
+    chunk = b'\0' * _ZERO_CHUNK
+    os.lseek(fd, 0, os.SEEK_SET)
+    remaining = length
+    while remaining > 0:
+        remaining -= os.write(fd, chunk[:min(remaining, _ZERO_CHUNK)])
+    os.fsync(fd)
+
+
+def wipe_signatures(path):
+    """Remove every filesystem, RAID and partition table signature"""
+    subprocess.check_call(['wipefs', '--all', '--quiet', path])
+
+
+def clear_data(path, mode):
+    """Discard or zero the whole of path.
+
+    The kernel is asked to do the work with the BLKDISCARD or BLKZEROOUT
+    ioctl.  If the device does not support discard, it is zeroed instead.
+    Writing zeros from userspace is only used as a last resort.
+
+    :param path: A block device or regular file.
+    :param mode: 'discard' or 'zero'.
+    """
+    fd = os.open(path, os.O_RDWR)
+    try:
+        length = os.lseek(fd, 0, os.SEEK_END)
+        if stat.S_ISREG(os.fstat(fd).st_mode):
+            _zero_file(fd, length)
+            return
+        requests = [BLKZEROOUT]
+        if mode == 'discard':
+            requests.insert(0, BLKDISCARD)
+        for request in requests:
+            try:
+                _range_ioctl(fd, request, length)
+                return
+            except IOError as e:
+                if e.errno not in _UNSUPPORTED:
+                    raise
+                logger.debug('%s does not support ioctl %#x', path, request)
+        _zero_userspace(fd, length)
+    finally:
+        os.close(fd)
+
+
+def wipe_device(path, mode):
+    """Wipe a single device according to mode, see objects.WIPE_MODES"""
+    logger.info('Wiping %s (%s)', path, mode)
+    wipe_signatures(path)
+    if mode != 'signatures':
+        clear_data(path, mode)
+
+
+def wipe_disks(disks, jobs=1, noop=False):
+    """Wipe several disks concurrently.
+
+    :param disks: A dict of disk name: wipe mode.
+    :param jobs: The maximum number of disks to wipe at once.
+    :param noop: If True, only log what would be wiped.
+    :raises: impl_base.DiskApplyException if any disk could not be wiped.
+    """
+    if noop:
+        for disk in sorted(disks):
+            logger.info('Would wipe %s (%s)', disk, disks[disk])
+        return
+
+    def _wipe(disk):
+        wipe_device(os.path.join('/dev', disk), disks[disk])
+
+    failures = {}
+    for disk, _, error in utils.run_parallel(_wipe, sorted(disks), jobs):
+        if error is not None:
+            logger.error('Failed to wipe %s: %s', disk, error)
+            failures[disk] = error
+    if failures:
+        raise impl_base.DiskApplyException(failures)